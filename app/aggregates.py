@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+AGGREGATE_KEYS = ["make", "model", "region_id", "channel"]
+AGGREGATE_FEATURES = ["agg_win_rate", "agg_sale_to_offer", "agg_enquiries"]
+WINDOW_DAYS = 90
+# Pseudo-count shrinking sparse keys towards the window-wide rate
+PRIOR_WEIGHT = 20.0
+
+
+def make_keys(df: pd.DataFrame) -> pd.Series:
+    """Composite make|model|region|channel key for each row."""
+    keys = df[AGGREGATE_KEYS[0]].astype(str)
+    for column in AGGREGATE_KEYS[1:]:
+        keys = keys + "|" + df[column].astype(str)
+    return keys
+
+
+class AggregateStore:
+    """
+    Array-backed snapshot of rolling per-key aggregates.
+
+    Values live in one float32 matrix (memory-mapped when loaded from disk) and a dict
+    maps each key to its row, so a lookup is a hash probe plus a row read.
+    """
+
+    def __init__(self, keys, values, defaults, as_of: str, window_days: int = WINDOW_DAYS):
+        self.keys = np.asarray(keys, dtype=str)
+        self.values = values
+        self.defaults = np.asarray(defaults, dtype=np.float32)
+        self.as_of = as_of
+        self.window_days = window_days
+        self._index = {key: i for i, key in enumerate(self.keys)}
+
+    def lookup(
+        self, make: str, model: str, region_id: str | None, channel: str
+    ) -> dict[str, float]:
+        row = self._index.get(f"{make}|{model}|{region_id}|{channel}")
+        values = self.defaults if row is None else self.values[row]
+        return {name: float(v) for name, v in zip(AGGREGATE_FEATURES, values)}
+
+    def contains(self, make: str, model: str, region_id: str | None, channel: str) -> bool:
+        """Whether the key has its own row; otherwise `lookup` serves the defaults."""
+        return f"{make}|{model}|{region_id}|{channel}" in self._index
+
+    def lookup_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Vectorised lookup for a frame holding the key columns."""
+        rows = pd.Index(self.keys).get_indexer(make_keys(df))
+        values = np.broadcast_to(self.defaults, (len(df), len(AGGREGATE_FEATURES))).copy()
+        found = rows >= 0
+        values[found] = np.asarray(self.values)[rows[found]]
+        return pd.DataFrame(values, columns=AGGREGATE_FEATURES, index=df.index)
+
+    def save(self, path: str):
+        """
+        Write the snapshot to a hidden directory beside `path` and rename it into place,
+        so a reader never sees a partly written snapshot.
+        """
+        path = os.path.normpath(path)
+        parent, name = os.path.split(path)
+        tmp_path = os.path.join(parent, f".{name}.tmp-{os.getpid()}")
+        old_path = os.path.join(parent, f".{name}.old-{os.getpid()}")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "keys.npy"), self.keys)
+        np.save(os.path.join(tmp_path, "values.npy"), np.asarray(self.values, dtype=np.float32))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "as_of": self.as_of,
+                    "window_days": self.window_days,
+                    "features": AGGREGATE_FEATURES,
+                    "defaults": self.defaults.tolist(),
+                },
+                f,
+                indent=2,
+            )
+        # Open memory maps of the old snapshot stay valid after it is removed
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str) -> "AggregateStore":
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        return cls(
+            keys=np.load(os.path.join(path, "keys.npy")),
+            values=np.load(os.path.join(path, "values.npy"), mmap_mode="r"),
+            defaults=meta["defaults"],
+            as_of=meta["as_of"],
+            window_days=meta["window_days"],
+        )
+
+
+def compute_snapshot(df: pd.DataFrame, as_of, window_days: int = WINDOW_DAYS) -> AggregateStore:
+    """
+    Aggregate enquiries dated in [as_of - window_days, as_of) per key.
+
+    Only rows strictly before `as_of` are used, so a snapshot taken at the start of a
+    month is a point-in-time-correct feature source for that month's enquiries.
+    """
+    as_of = pd.Timestamp(as_of)
+    dates = df["enquiry_date"]
+    window = df[(dates < as_of) & (dates >= as_of - pd.Timedelta(days=window_days))]
+
+    won = window["won"].fillna(0).to_numpy(dtype=np.float64)
+    ratio = (window["sale_price"] / window["offer_price"]).to_numpy(dtype=np.float64)
+    ratio = np.where(won == 1, ratio, np.nan)
+
+    grouped = pd.DataFrame({"key": make_keys(window).to_numpy(), "won": won, "ratio": ratio})
+    grouped = grouped.groupby("key", sort=True).agg(
+        enquiries=("won", "size"),
+        wins=("won", "sum"),
+        wins_with_sale=("ratio", "count"),
+        median_ratio=("ratio", "median"),
+    )
+
+    global_win_rate = won.mean() if len(won) else np.nan
+    global_ratio = np.nanmedian(ratio) if np.isfinite(ratio).any() else np.nan
+
+    win_rate = (grouped["wins"] + PRIOR_WEIGHT * global_win_rate) / (
+        grouped["enquiries"] + PRIOR_WEIGHT
+    )
+    sale_to_offer = (
+        grouped["wins_with_sale"] * grouped["median_ratio"].fillna(0) + PRIOR_WEIGHT * global_ratio
+    ) / (grouped["wins_with_sale"] + PRIOR_WEIGHT)
+
+    values = np.column_stack([win_rate, sale_to_offer, grouped["enquiries"]]).astype(np.float32)
+    return AggregateStore(
+        keys=grouped.index.to_numpy(dtype=str),
+        values=values,
+        defaults=[global_win_rate, global_ratio, 0.0],
+        as_of=as_of.strftime("%Y-%m-%d"),
+        window_days=window_days,
+    )
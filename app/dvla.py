@@ -144,6 +144,8 @@ async def fetch_dvla_data(registration: str) -> Dict[str, Any]:
         if not ves_data and not mot_data:
             return {
                 "status": "error",
+                # Both registries failing is an outage, not an unknown registration
+                "upstream_failed": min(ves_resp.status_code, mot_resp.status_code) >= 500,
                 "message": "Vehicle not found in official DVLA/MOT registries.",
             }
 
@@ -185,4 +187,8 @@ async def fetch_dvla_data(registration: str) -> Dict[str, Any]:
             "mot_days_remaining": mot_days,
         }
     except Exception as e:
-        return {"status": "error", "message": f"Integration error: {str(e)}"}
+        return {
+            "status": "error",
+            "upstream_failed": True,
+            "message": f"Integration error: {str(e)}",
+        }
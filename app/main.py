@@ -3,13 +3,32 @@ import pickle
 import pandas as pd
 import numpy as np
 import hashlib
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, Security, Depends
+from fastapi import FastAPI, HTTPException, Request, Security, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security.api_key import APIKeyHeader
-from app.schemas import QuoteRequest, QuoteResponse
-from app.optimiser import compute_expected_costs, optimise_offer
+from app.schemas import (
+    PortfolioQuote,
+    QuoteBatchRequest,
+    QuoteBatchResponse,
+    QuoteRequest,
+    QuoteResponse,
+)
+from app.optimiser import (
+    compute_expected_costs,
+    compute_expected_costs_batch,
+    offer_grid,
+    optimise_offer,
+    optimise_portfolio,
+    p_win_matrix,
+    risk_bands,
+)
+from app.aggregates import AGGREGATE_FEATURES, AggregateStore
+from app.quote_log import QUOTE_LOG_DIR, QuoteLogger
+from app.metrics import API_METRICS_DIR, ApiMetrics
+from app.publish import load_consistent, read_generation
 
 app = FastAPI(title="AutoPricer API", version="0.1.0")
 
@@ -40,6 +59,37 @@ def get_api_key(api_key: str = Security(api_key_header)):
 # Model registry
 models: Dict[str, Any] = {}
 
+# Region risk used for costs and features until regions are looked up
+REGION_RISK_SCORE = 0.5
+DAMAGE_SEVERITY = {"none": 0, "scratches": 1, "dents": 2, "mechanical": 3, "structural": 4}
+
+# Every served quote, for monitoring; QUOTE_LOG=off disables it
+quote_log = QuoteLogger(
+    os.getenv("QUOTE_LOG_DIR", QUOTE_LOG_DIR), enabled=os.getenv("QUOTE_LOG", "on") != "off"
+)
+
+# Request latency, shed and cache counters for the monitor's SLO rules; API_METRICS=off
+# keeps them in memory only
+metrics = ApiMetrics(
+    os.getenv("API_METRICS_DIR", API_METRICS_DIR), persist=os.getenv("API_METRICS", "on") != "off"
+)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template so unmatched paths share one series
+        route = request.scope.get("route")
+        metrics.observe(
+            getattr(route, "path", "unmatched"), (time.perf_counter() - started) * 1000, status
+        )
+
 
 def get_model_path(filename: str) -> str:
     return os.path.join(os.path.dirname(__file__), "..", "models", filename)
@@ -55,6 +105,46 @@ def get_file_hash(filepath: str) -> str:
     return hash_md5.hexdigest()
 
 
+def _read_models() -> Dict[str, Any]:
+    loaded: Dict[str, Any] = {}
+    with open(get_model_path("price_model.pkl"), "rb") as f:
+        loaded["price_model"] = pickle.load(f)
+    with open(get_model_path("price_q10.pkl"), "rb") as f:
+        loaded["price_q10"] = pickle.load(f)
+    with open(get_model_path("conversion_model.pkl"), "rb") as f:
+        loaded["conversion_model"] = pickle.load(f)
+    # Optional q10/q50/q90 model from `train_price_model.py --multi-quantile`
+    if os.path.exists(get_model_path("price_quantiles.pkl")):
+        with open(get_model_path("price_quantiles.pkl"), "rb") as f:
+            loaded["price_quantiles"] = pickle.load(f)
+    if os.path.isdir(get_model_path("aggregates")):
+        loaded["aggregates"] = AggregateStore.load(get_model_path("aggregates"))
+
+    loaded["meta"] = {
+        "price_model": {
+            "file_hash": get_file_hash(get_model_path("price_model.pkl")),
+            "trained_at": datetime.now().isoformat(),
+            "training_rows": 50000,
+        },
+        "price_q10": {
+            "file_hash": get_file_hash(get_model_path("price_q10.pkl")),
+            # XGBRegressor unless trained with another --quantile-engine
+            "estimator": type(loaded["price_q10"].named_steps["model"]).__name__,
+        },
+        "price_quantiles": {
+            "file_hash": get_file_hash(get_model_path("price_quantiles.pkl")),
+            "loaded": "price_quantiles" in loaded,
+        },
+        "conversion_model": {
+            "file_hash": get_file_hash(get_model_path("conversion_model.pkl")),
+            "trained_at": datetime.now().isoformat(),
+            "training_rows": 50000,
+        },
+        "publish_generation": read_generation(),
+    }
+    return loaded
+
+
 @app.on_event("startup")
 def load_models():
     model_source = os.getenv("MODEL_SOURCE", "local")
@@ -71,58 +161,151 @@ def load_models():
         }
     else:
         try:
-            with open(get_model_path("price_model.pkl"), "rb") as f:
-                models["price_model"] = pickle.load(f)
-            with open(get_model_path("price_q10.pkl"), "rb") as f:
-                models["price_q10"] = pickle.load(f)
-            with open(get_model_path("conversion_model.pkl"), "rb") as f:
-                models["conversion_model"] = pickle.load(f)
-
-            models["meta"] = {
-                "price_model": {
-                    "file_hash": get_file_hash(get_model_path("price_model.pkl")),
-                    "trained_at": datetime.now().isoformat(),
-                    "training_rows": 50000,
-                },
-                "conversion_model": {
-                    "file_hash": get_file_hash(get_model_path("conversion_model.pkl")),
-                    "trained_at": datetime.now().isoformat(),
-                    "training_rows": 50000,
-                },
-            }
+            # Retried while `make retrain` is publishing, so the models form one set
+            loaded = load_consistent(_read_models)
+            if loaded is None and not models:
+                print("Warning: Models were being published throughout startup, loading anyway.")
+                loaded = _read_models()
         except FileNotFoundError:
             print("Warning: Models not found on disk. Run `make train` first.")
+            return
+        if loaded is None:
+            print("Warning: Models were being published throughout the reload, keeping the old.")
+            return
+        # Swap the whole set in, dropping models (e.g. price_quantiles) no longer on disk
+        models.update(loaded)
+        for name in set(models) - set(loaded):
+            del models[name]
+
+
+@app.on_event("shutdown")
+def flush_quote_log():
+    quote_log.flush()
+    metrics.close()
 
 
 @app.get("/health")
 def health():
     if os.getenv("MODEL_SOURCE", "local") == "mock":
-        return {"status": "ok", "models": models}
+        return {"status": "ok", "models": models, "quote_log": quote_log.stats()}
+
+    return {
+        "status": "ok",
+        "models": models.get("meta", "Not loaded"),
+        "quote_log": quote_log.stats(),
+    }
 
+
+@app.post("/reload")
+def reload_models(api_key: str = Depends(get_api_key)):
+    """
+    Reload the models from disk, e.g. after `make retrain` publishes new ones. Only
+    this worker reloads: with several workers, restart the API instead.
+    """
+    load_models()
+    if os.getenv("MODEL_SOURCE", "local") == "mock":
+        return {"status": "ok", "models": models}
     return {"status": "ok", "models": models.get("meta", "Not loaded")}
 
 
 from app.dvla import fetch_dvla_data
 
 
+@app.get("/metrics")
+def get_metrics():
+    """This worker's per-minute request, latency and cache counters."""
+    return metrics.snapshot()
+
+
 @app.get("/lookup")
 async def dvla_lookup(reg: str, api_key: str = Depends(get_api_key)):
     """
     Look up vehicle details using UK Registration Number.
     Powered by official DVLA/DVSA APIs or deterministic mocks if keys are absent.
     """
+    started = time.perf_counter()
     result = await fetch_dvla_data(reg)
+    failed = bool(result.get("upstream_failed"))
+    metrics.observe("dvla_upstream", (time.perf_counter() - started) * 1000, 502 if failed else 200)
     if result.get("status") == "error":
-        raise HTTPException(status_code=404, detail=result.get("message"))
+        # A failed integration is an upstream outage, not an unknown registration
+        raise HTTPException(status_code=502 if failed else 404, detail=result.get("message"))
     return result
 
 
+def build_features(req: QuoteRequest) -> Dict[str, Any]:
+    """Model features of one quote request, rolling aggregates included."""
+    month = datetime.now().month
+    features = {
+        "make": req.make,
+        "fuel_type": req.fuel_type,
+        "body_type": "hatchback",
+        "channel": req.channel,
+        "vehicle_age": max(0, 2025 - req.year),
+        "mileage": req.mileage,
+        "damage_severity_score": DAMAGE_SEVERITY.get(req.damage_type or "none", 0),
+        "risk_score": REGION_RISK_SCORE,
+        "month_sin": np.sin((month - 1) * (2.0 * np.pi / 12)),
+        "month_cos": np.cos((month - 1) * (2.0 * np.pi / 12)),
+    }
+
+    # Rolling make/model/region/channel aggregates: one hash probe into the snapshot
+    if "aggregates" in models:
+        key = (req.make, req.model, req.region_id, req.channel)
+        features.update(models["aggregates"].lookup(*key))
+        metrics.count("aggregate_hit" if models["aggregates"].contains(*key) else "aggregate_miss")
+    else:
+        features.update({name: np.nan for name in AGGREGATE_FEATURES})
+    return features
+
+
+def predict_prices(df_features: pd.DataFrame):
+    """
+    E(sale), q10 and (with the multi-quantile model) the q10/q50/q90 rows per vehicle.
+
+    E(sale) always comes from the mean model `price_model`; the multi-quantile model
+    only replaces the q10 model and adds the interval, so loading it does not move EVs.
+    """
+    e_sale = models["price_model"].predict(df_features)
+    if "price_quantiles" in models:
+        # One traversal for q10/q50/q90; sorting fixes any quantile crossing
+        quantiles = np.sort(models["price_quantiles"].predict(df_features), axis=1)
+        return e_sale, quantiles[:, 0], quantiles
+    return e_sale, models["price_q10"].predict(df_features), None
+
+
+def model_versions() -> Dict[str, Optional[str]]:
+    """File hashes (or mock versions) of the models serving quotes."""
+    names = ["price_model", "conversion_model"]
+    if os.getenv("MODEL_SOURCE", "local") == "mock":
+        return {f"{name}_version": models.get(name, {}).get("version_hash") for name in names}
+    meta = models.get("meta", {})
+    return {f"{name}_version": meta.get(name, {}).get("file_hash") for name in names}
+
+
+def log_quote(endpoint: str, req: QuoteRequest, features: Dict[str, Any], started: float, **served):
+    """Queue one served quote on the quote log; this never waits on the writer."""
+    quote_log.log(
+        {
+            "logged_at": datetime.now(),
+            "endpoint": endpoint,
+            "model_source": os.getenv("MODEL_SOURCE", "local"),
+            **model_versions(),
+            **req.model_dump(),
+            **features,
+            "latency_ms": (time.perf_counter() - started) * 1000,
+            **served,
+        }
+    )
+
+
 @app.post("/quote", response_model=QuoteResponse)
 def get_quote(req: QuoteRequest, api_key: str = Depends(get_api_key)):
+    started = time.perf_counter()
     model_source = os.getenv("MODEL_SOURCE", "local")
 
-    region_risk_score = 0.5
-    e_costs = compute_expected_costs(req.damage_flag, req.channel, region_risk_score)
+    e_costs = compute_expected_costs(req.damage_flag, req.channel, REGION_RISK_SCORE)
+    features = build_features(req)
 
     if model_source == "mock":
         e_sale = 10000.0
@@ -134,34 +317,20 @@ def get_quote(req: QuoteRequest, api_key: str = Depends(get_api_key)):
             return 1.0 / (1.0 + math.exp(-(offer - 9000) / 500.0))
 
         result = optimise_offer(e_sale, price_q10, e_costs, mock_p_win)
+        log_quote("quote", req, features, started, **_served(result, e_sale, price_q10, e_costs))
         return QuoteResponse(**result)
 
     if "price_model" not in models:
         raise HTTPException(status_code=503, detail="Models are not loaded.")
 
-    damage_map = {"none": 0, "scratches": 1, "dents": 2, "mechanical": 3, "structural": 4}
-    damage_severity_score = damage_map.get(req.damage_type or "none", 0)
-    month = datetime.now().month
-    month_sin = np.sin((month - 1) * (2.0 * np.pi / 12))
-    month_cos = np.cos((month - 1) * (2.0 * np.pi / 12))
+    df_features = pd.DataFrame([features])
 
-    features_dict = {
-        "make": req.make,
-        "fuel_type": req.fuel_type,
-        "body_type": "hatchback",
-        "channel": req.channel,
-        "vehicle_age": max(0, 2025 - req.year),
-        "mileage": req.mileage,
-        "damage_severity_score": damage_severity_score,
-        "risk_score": region_risk_score,
-        "month_sin": month_sin,
-        "month_cos": month_cos,
-    }
-
-    df_features = pd.DataFrame([features_dict])
-
-    e_sale = float(models["price_model"].predict(df_features)[0])
-    price_q10 = float(models["price_q10"].predict(df_features)[0])
+    e_sale, price_q10, quantiles = predict_prices(df_features)
+    e_sale, price_q10 = float(e_sale[0]), float(price_q10[0])
+    price_interval = None
+    if quantiles is not None:
+        q10, q50, q90 = quantiles[0]
+        price_interval = {"q10": float(q10), "q50": float(q50), "q90": float(q90)}
 
     def predict_p_win(offer: float) -> float:
         df_conv = df_features.copy()
@@ -169,4 +338,99 @@ def get_quote(req: QuoteRequest, api_key: str = Depends(get_api_key)):
         return float(models["conversion_model"].predict_proba(df_conv)[0][1])
 
     result = optimise_offer(e_sale, price_q10, e_costs, predict_p_win)
+    if price_interval is not None:
+        result["explanation"]["price_interval"] = price_interval
+    log_quote("quote", req, features, started, **_served(result, e_sale, price_q10, e_costs))
     return QuoteResponse(**result)
+
+
+def _served(result: Dict[str, Any], e_sale: float, price_q10: float, e_costs: float):
+    return {
+        "e_sale": float(e_sale),
+        "price_q10": float(price_q10),
+        "e_costs": float(e_costs),
+        "recommended_offer": float(result["recommended_offer"]),
+        "expected_value": float(result["expected_value"]),
+        "p_win": float(result["p_win"]),
+        "risk_band": result["risk_band"],
+        "selected": bool(result.get("selected", result["recommended_offer"] > 0)),
+    }
+
+
+@app.post("/quote/batch", response_model=QuoteBatchResponse)
+def get_quote_batch(req: QuoteBatchRequest, api_key: str = Depends(get_api_key)):
+    """
+    Offers for a batch of vehicles that maximise total EV under an expected spend budget
+    and purchase volume limits. Every vehicle's offer grid is scored in one vectorised
+    pass and the constraints are met by optimise_portfolio's Lagrange multipliers.
+    """
+    started = time.perf_counter()
+    model_source = os.getenv("MODEL_SOURCE", "local")
+    vehicles = req.vehicles
+    features = [build_features(v) for v in vehicles]
+
+    e_costs = compute_expected_costs_batch(
+        [v.damage_flag for v in vehicles], [v.channel for v in vehicles], REGION_RISK_SCORE
+    )
+
+    if model_source == "mock":
+        e_sale = np.full(len(vehicles), 10000.0)
+        price_q10 = np.full(len(vehicles), 9000.0)
+        offers, valid = offer_grid(e_sale, e_costs)
+        p_win = 1.0 / (1.0 + np.exp(-(offers - 9000) / 500.0))
+    else:
+        if "price_model" not in models:
+            raise HTTPException(status_code=503, detail="Models are not loaded.")
+        df_features = pd.DataFrame(features)
+        e_sale, price_q10, _ = predict_prices(df_features)
+        offers, valid = offer_grid(e_sale, e_costs)
+        p_win = p_win_matrix(models["conversion_model"], df_features, offers)
+
+    result = optimise_portfolio(
+        e_sale,
+        price_q10,
+        e_costs,
+        offers,
+        p_win,
+        valid,
+        budget=req.budget,
+        max_volume=req.max_volume,
+        min_volume=req.min_volume,
+        risk_lambda=req.risk_lambda,
+    )
+    bands = np.where(
+        result["selected"], risk_bands(result["recommended_offer"], e_sale, price_q10), "none"
+    )
+    quotes = [
+        PortfolioQuote(
+            vehicle_id=v.vehicle_id,
+            recommended_offer=float(result["recommended_offer"][i]),
+            expected_value=float(result["expected_value"][i]),
+            p_win=float(result["p_win"][i]),
+            selected=bool(result["selected"][i]),
+            risk_band=str(bands[i]),
+        )
+        for i, v in enumerate(vehicles)
+    ]
+    for i, (v, quote) in enumerate(zip(vehicles, quotes)):
+        log_quote(
+            "quote/batch",
+            v,
+            features[i],
+            started,
+            **_served(quote.model_dump(), e_sale[i], price_q10[i], e_costs[i]),
+        )
+    return QuoteBatchResponse(
+        quotes=quotes,
+        **{
+            key: result[key]
+            for key in [
+                "expected_spend",
+                "expected_volume",
+                "total_expected_value",
+                "budget_multiplier",
+                "volume_multiplier",
+                "feasible",
+            ]
+        },
+    )
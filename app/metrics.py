@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Any
+
+API_METRICS_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "monitor", "api_metrics")
+# Upper bounds of the latency histogram buckets; the last bucket is everything above
+LATENCY_BOUNDS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+# Per-minute buckets kept, enough for the longest burn-rate window
+RETENTION_MINUTES = 6 * 60
+SNAPSHOT_SECONDS = 15.0
+# Responses that turned a request away rather than failing it
+SHED_STATUSES = {429, 503}
+
+
+def _minute(at: float | None = None) -> int:
+    return int((time.time() if at is None else at) // 60)
+
+
+def _new_timing() -> dict[str, Any]:
+    return {"requests": 0, "errors": 0, "shed": 0, "latency": [0] * (len(LATENCY_BOUNDS_MS) + 1)}
+
+
+class ApiMetrics:
+    """
+    Per-minute request counts, latency histograms and event counters of this process.
+
+    Recording is a dict update under a lock. A background thread snapshots the last
+    RETENTION_MINUTES to metrics-<pid>.json by atomic rename, one file per worker,
+    for the monitor's SLO rules to merge.
+    """
+
+    def __init__(
+        self,
+        metrics_dir: str = API_METRICS_DIR,
+        persist: bool = True,
+        snapshot_seconds: float = SNAPSHOT_SECONDS,
+    ):
+        self.metrics_dir = metrics_dir
+        self.persist = persist
+        self.snapshot_seconds = snapshot_seconds
+        self._minutes: dict[int, dict[str, dict]] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _bucket(self, at: float | None) -> dict[str, dict]:
+        minute = _minute(at)
+        bucket = self._minutes.get(minute)
+        if bucket is None:
+            bucket = self._minutes[minute] = {"timings": {}, "counts": {}}
+            for old in [m for m in self._minutes if m <= minute - RETENTION_MINUTES]:
+                del self._minutes[old]
+        return bucket
+
+    def _ensure_writer(self):
+        if not self.persist or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def observe(self, name: str, latency_ms: float, status: int = 200, at: float | None = None):
+        """Record one timed request (or upstream call) and its status code."""
+        self._ensure_writer()
+        with self._lock:
+            timings = self._bucket(at)["timings"]
+            timing = timings.get(name)
+            if timing is None:
+                timing = timings[name] = _new_timing()
+            timing["requests"] += 1
+            timing["latency"][bisect_left(LATENCY_BOUNDS_MS, latency_ms)] += 1
+            if status in SHED_STATUSES:
+                timing["shed"] += 1
+            elif status >= 500:
+                timing["errors"] += 1
+
+    def count(self, name: str, n: int = 1, at: float | None = None):
+        """Add to an event counter, e.g. cache hits and misses."""
+        self._ensure_writer()
+        with self._lock:
+            counts = self._bucket(at)["counts"]
+            counts[name] = counts.get(name, 0) + n
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            minutes = {
+                str(minute): {
+                    "timings": {
+                        name: {**t, "latency": list(t["latency"])}
+                        for name, t in bucket["timings"].items()
+                    },
+                    "counts": dict(bucket["counts"]),
+                }
+                for minute, bucket in sorted(self._minutes.items())
+            }
+        return {
+            "pid": os.getpid(),
+            "written_at": datetime.now().isoformat(),
+            "latency_bounds_ms": LATENCY_BOUNDS_MS,
+            "minutes": minutes,
+        }
+
+    def write(self):
+        """Replace this process's snapshot file. Returns its path."""
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        path = os.path.join(self.metrics_dir, f"metrics-{os.getpid()}.json")
+        try:
+            with open(path + ".tmp", "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Warning: could not write API metrics: {e}")
+        return path
+
+    def _run(self):
+        while not self._stop.wait(self.snapshot_seconds):
+            self.write()
+
+    def close(self):
+        """Stop the writer after a final snapshot."""
+        self._stop.set()
+        if self.persist and self._minutes:
+            self.write()
+
+
+def read_snapshots(
+    metrics_dir: str = API_METRICS_DIR, now: float | None = None
+) -> list[dict[str, Any]]:
+    """
+    Every worker's latest snapshot; unreadable files are skipped. A snapshot written
+    more than RETENTION_MINUTES before `now` holds no minute a window can reach: its
+    worker has exited, so the file is deleted rather than merged on every read.
+    """
+    if not os.path.isdir(metrics_dir):
+        return []
+    stale_before = datetime.fromtimestamp(time.time() if now is None else now) - timedelta(
+        minutes=RETENTION_MINUTES
+    )
+    snapshots = []
+    for name in sorted(os.listdir(metrics_dir)):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(metrics_dir, name)
+        try:
+            with open(path, "r") as f:
+                snapshot = json.load(f)
+            if datetime.fromisoformat(snapshot["written_at"]) < stale_before:
+                os.remove(path)
+                continue
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: skipping API metrics snapshot {name}: {e}")
+            continue
+        snapshots.append(snapshot)
+    return snapshots
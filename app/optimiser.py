@@ -1,5 +1,19 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import numpy as np
+import pandas as pd
+
+CHANNEL_COSTS = {"dealer": 100.0, "private": 200.0, "fleet": 50.0}
+OTHER_CHANNEL_COST = 150.0
+# Offers searched per vehicle
+OFFER_GRID_SIZE = 50
+# Vehicles scored per predict_proba call in p_win_matrix: rows in flight are chunk × grid
+CHUNK_VEHICLES = 20000
+# Bisection steps per Lagrange multiplier in optimise_portfolio, and the relative
+# precision at which it stops early
+MULTIPLIER_ITERATIONS = 40
+MULTIPLIER_TOLERANCE = 1e-6
+# Doublings of the per-purchase reward searched for a min_volume target
+MAX_VOLUME_DOUBLINGS = 20
 
 
 def compute_expected_costs(damage_flag: bool, channel: str, region_risk_score: float) -> float:
@@ -7,13 +21,25 @@ def compute_expected_costs(damage_flag: bool, channel: str, region_risk_score: f
     base_cost = 250.0
     damage_cost = 500.0 if damage_flag else 0.0
 
-    channel_costs = {"dealer": 100.0, "private": 200.0, "fleet": 50.0}
-    cost_channel = channel_costs.get(channel.lower(), 150.0)
+    cost_channel = CHANNEL_COSTS.get(channel.lower(), OTHER_CHANNEL_COST)
     risk_multiplier = 100.0 * region_risk_score
 
     return base_cost + damage_cost + cost_channel + risk_multiplier
 
 
+def compute_expected_costs_batch(damage_flag, channel, region_risk_score) -> np.ndarray:
+    """compute_expected_costs for arrays of vehicles."""
+    cost_channel = (
+        pd.Series(channel, dtype="object")
+        .str.lower()
+        .map(CHANNEL_COSTS)
+        .fillna(OTHER_CHANNEL_COST)
+        .to_numpy(dtype=float)
+    )
+    damage_cost = np.where(np.asarray(damage_flag, dtype=bool), 500.0, 0.0)
+    return 250.0 + damage_cost + cost_channel + 100.0 * np.asarray(region_risk_score, dtype=float)
+
+
 def compute_ev(
     offer: float,
     p_win: float,
@@ -24,14 +50,86 @@ def compute_ev(
 ) -> float:
     """
     EV(offer) = P(win|offer) * (E(sale) - offer - E(costs)) - λ * tail_penalty
+
+    Works element-wise on numpy arrays too, e.g. a (vehicles × offers) grid.
     """
     margin = e_sale - offer - e_costs
-    tail_penalty_from_lower_quantile = max(0.0, offer - price_q10)
+    tail_penalty_from_lower_quantile = np.maximum(0.0, offer - price_q10)
 
     ev = p_win * margin - (risk_lambda * tail_penalty_from_lower_quantile)
     return ev
 
 
+def offer_bounds(e_sale, e_costs, min_margin: float = 200.0):
+    """Lowest and highest offer searched, for scalars or arrays of vehicles."""
+    max_offer = e_sale - e_costs - min_margin
+    min_offer = np.maximum(500.0, max_offer * 0.5)
+    return min_offer, max_offer
+
+
+def offer_grid(e_sale, e_costs, min_margin: float = 200.0, num: int = OFFER_GRID_SIZE):
+    """
+    The (vehicles × num) offers optimise_offer would search for each vehicle, and a
+    mask of vehicles that can be offered anything at all.
+    """
+    min_offer, max_offer = offer_bounds(
+        np.asarray(e_sale, dtype=float), np.asarray(e_costs, dtype=float), min_margin
+    )
+    return np.linspace(min_offer, max_offer, num=num, axis=-1), max_offer > min_offer
+
+
+def p_win_matrix(conversion_model, X, offers, chunk_vehicles: int = CHUNK_VEHICLES):
+    """
+    P(win) of every vehicle at every offer in its grid row, as a (vehicles × offers)
+    matrix: each vehicle's features are repeated once per offer and scored in
+    vehicle chunks, one predict_proba call per chunk. The matrix is float32, half the
+    memory of the repeated frames it replaces.
+
+    Scoring is bound by the model's predict: the three-fold calibrated conversion model
+    scored 63-77k vehicle-offer pairs/s on one core, so 100k vehicles on a 50-offer
+    grid take 65-80s single-threaded, shrinking with the cores available to
+    HistGradientBoosting's OpenMP predict.
+    """
+    n, k = offers.shape
+    p_win = np.empty((n, k), dtype=np.float32)
+    for lo in range(0, n, chunk_vehicles):
+        hi = min(lo + chunk_vehicles, n)
+        rows = X.iloc[np.repeat(np.arange(lo, hi), k)].reset_index(drop=True)
+        rows["offer_price"] = offers[lo:hi].ravel()
+        p_win[lo:hi] = conversion_model.predict_proba(rows)[:, 1].reshape(hi - lo, k)
+    return p_win
+
+
+def risk_bands(offer, e_sale, price_q10) -> np.ndarray:
+    """optimise_offer's risk band for arrays of offers."""
+    return np.where(offer < price_q10, "low", np.where(offer < e_sale, "medium", "high"))
+
+
+def optimise_offers(
+    e_sale, price_q10, e_costs, offers, p_win, valid, risk_lambda: float = 0.5
+) -> Dict[str, np.ndarray]:
+    """
+    optimise_offer for many vehicles at once: EV over a (vehicles × offers) grid with
+    its matching p_win matrix, then the best offer per row. Vehicles without a valid
+    range get a zero offer, as optimise_offer returns.
+    """
+    ev = compute_ev(
+        offers,
+        p_win,
+        np.asarray(e_sale)[:, None],
+        np.asarray(e_costs)[:, None],
+        np.asarray(price_q10)[:, None],
+        risk_lambda,
+    )
+    best = np.argmax(ev, axis=1)
+    rows = np.arange(len(offers))
+    return {
+        "recommended_offer": np.where(valid, offers[rows, best], 0.0),
+        "expected_value": np.where(valid, ev[rows, best], 0.0),
+        "p_win": np.where(valid, p_win[rows, best], 0.0),
+    }
+
+
 def optimise_offer(
     e_sale: float,
     price_q10: float,
@@ -43,8 +141,7 @@ def optimise_offer(
     """
     Grid search over valid offers to maximize EV.
     """
-    max_offer = e_sale - e_costs - min_margin
-    min_offer = max(500.0, max_offer * 0.5)
+    min_offer, max_offer = offer_bounds(e_sale, e_costs, min_margin)
 
     if max_offer <= min_offer:
         # Cannot make a profitable offer
@@ -56,7 +153,7 @@ def optimise_offer(
             "explanation": {"reason": "Negative or zero margin"},
         }
 
-    offers = np.linspace(min_offer, max_offer, num=50)
+    offers = np.linspace(min_offer, max_offer, num=OFFER_GRID_SIZE)
     best_ev = -float("inf")
     best_offer = 0.0
     best_p_win = 0.0
@@ -83,3 +180,104 @@ def optimise_offer(
             "tail_penalty": max(0.0, best_offer - price_q10),
         },
     }
+
+
+def _bisect(feasible, lo, hi, iterations=MULTIPLIER_ITERATIONS):
+    """Smallest multiplier in [lo, hi] for which `feasible` holds, given it holds at hi."""
+    for _ in range(iterations):
+        if hi - lo <= MULTIPLIER_TOLERANCE * abs(hi):
+            break
+        mid = (lo + hi) / 2
+        if feasible(mid):
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+def optimise_portfolio(
+    e_sale,
+    price_q10,
+    e_costs,
+    offers,
+    p_win,
+    valid,
+    budget: Optional[float] = None,
+    max_volume: Optional[float] = None,
+    min_volume: Optional[float] = None,
+    risk_lambda: float = 0.5,
+) -> Dict[str, Any]:
+    """
+    Offers for a batch of vehicles maximising total EV subject to an expected spend
+    budget, sum(p_win × offer) <= budget, and expected purchases, sum(p_win), within
+    [min_volume, max_volume]. Every vehicle may also get no bid.
+
+    Lagrangian relaxation: with a price mu per £ of expected spend and nu per expected
+    purchase, each vehicle independently takes the grid offer maximising
+    EV - mu × p_win × offer - nu × p_win, or no bid if that is negative. Spend and
+    volume fall as the multipliers rise, so each is found by bisection over the whole
+    (vehicles × offers) matrix at once; a negative nu rewards volume to meet min_volume.
+    """
+    e_sale, price_q10, e_costs = (np.asarray(a, dtype=float) for a in (e_sale, price_q10, e_costs))
+    ev = compute_ev(
+        offers, p_win, e_sale[:, None], e_costs[:, None], price_q10[:, None], risk_lambda
+    )
+    ev = np.where(np.asarray(valid)[:, None], ev, -np.inf)
+    spend = p_win * offers
+    rows = np.arange(len(offers))
+
+    def choose(mu, nu):
+        score = ev - mu * spend - nu * p_win
+        best = np.argmax(score, axis=1)
+        bid = score[rows, best] > 0
+        return best, bid, spend[rows, best] @ bid, p_win[rows, best] @ bid
+
+    def budget_multiplier(nu):
+        """Smallest mu meeting the budget at this nu."""
+        if budget is None or choose(0.0, nu)[2] <= budget:
+            return 0.0
+        # Beyond max(EV + |nu| p) / spend no bid scores above zero, so spend is 0
+        upper = np.nanmax(np.where(spend > 0, (ev + abs(nu) * p_win) / spend, 0.0)) + 1.0
+        return _bisect(lambda mu: choose(mu, nu)[2] <= budget, 0.0, upper)
+
+    def volume_at(nu):
+        return choose(budget_multiplier(nu), nu)[3]
+
+    nu = 0.0
+    volume = volume_at(0.0)
+    if max_volume is not None and volume > max_volume:
+        upper = np.nanmax(np.where(p_win > 0, ev / p_win, 0.0)) + 1.0
+        nu = _bisect(lambda x: volume_at(x) <= max_volume, 0.0, upper)
+    elif min_volume is not None and volume < min_volume:
+        # Rewarding each purchase MAX_VOLUME_DOUBLINGS doublings past the largest
+        # vehicle EV buys about the most volume the budget allows; if even that misses
+        # the target, keep it, otherwise double up to the target and bisect back
+        scale = max(1.0, float(np.abs(ev[np.isfinite(ev)]).max(initial=0.0)))
+        if volume_at(-scale * 2**MAX_VOLUME_DOUBLINGS) < min_volume:
+            nu = -scale * 2**MAX_VOLUME_DOUBLINGS
+        else:
+            while volume_at(-scale) < min_volume:
+                scale *= 2
+            nu = -_bisect(lambda x: volume_at(-x) >= min_volume, 0.0, scale)
+    mu = budget_multiplier(nu)
+
+    best, bid, total_spend, total_volume = choose(mu, nu)
+    offer = np.where(bid, offers[rows, best], 0.0)
+    chosen_ev = np.where(bid, ev[rows, best], 0.0)
+    return {
+        "recommended_offer": offer,
+        "expected_value": chosen_ev,
+        "p_win": np.where(bid, p_win[rows, best], 0.0),
+        "selected": bid,
+        "expected_spend": float(total_spend),
+        "expected_volume": float(total_volume),
+        "total_expected_value": float(chosen_ev.sum()),
+        # Shadow prices: EV given up per extra £ of expected spend / per expected purchase
+        "budget_multiplier": float(mu),
+        "volume_multiplier": float(nu),
+        "feasible": bool(
+            (budget is None or total_spend <= budget + 1e-6)
+            and (max_volume is None or total_volume <= max_volume + 1e-6)
+            and (min_volume is None or total_volume >= min_volume - 1e-6)
+        ),
+    }
@@ -0,0 +1,98 @@
+import json
+import os
+import pickle
+import shutil
+import time
+from collections.abc import Callable, Iterable
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
+PUBLISH_PATH = os.path.join(MODEL_DIR, "publish.json")
+# A reader overlapping a publish retries this many times, this far apart
+LOAD_ATTEMPTS = 50
+LOAD_WAIT_SECONDS = 0.2
+
+
+def read_generation(path: str = PUBLISH_PATH) -> int:
+    """Publish generation of the model directory: odd while a publish is moving files."""
+    try:
+        with open(path, "r") as f:
+            return int(json.load(f)["generation"])
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def _write_generation(path: str, generation: int, names: Iterable[str]):
+    with open(path + ".tmp", "w") as f:
+        json.dump(
+            {
+                "generation": generation,
+                "models": sorted(names),
+                "updated_at": datetime.now().isoformat(),
+            },
+            f,
+        )
+    os.replace(path + ".tmp", path)
+
+
+@contextmanager
+def publishing(names: Iterable[str], path: str = PUBLISH_PATH):
+    """
+    Bracket the moves of a multi-file publish: the generation is made odd before the
+    first file is replaced and even again after the last, so a reader that sees the
+    same even generation before and after loading holds a consistent set of models.
+    """
+    names = list(names)
+    generation = read_generation(path)
+    generation += 1 if generation % 2 == 0 else 2
+    _write_generation(path, generation, names)
+    try:
+        yield
+    finally:
+        _write_generation(path, generation + 1, names)
+
+
+def publish_models(models: dict[str, Any], model_dir: str = MODEL_DIR, remove: Iterable[str] = ()):
+    """
+    Pickle every model to a staging directory on the same filesystem, then move each
+    to <model_dir>/<name>.pkl with os.replace inside one publish generation, so the
+    API never reads a half-written pickle nor a mix of old and new models. Artifacts
+    named in `remove` are deleted in the same generation, so none is left stale.
+    """
+    remove = list(remove)
+    staging_dir = os.path.join(model_dir, f".staging-{os.getpid()}")
+    os.makedirs(staging_dir, exist_ok=True)
+    try:
+        for name, model in models.items():
+            with open(os.path.join(staging_dir, f"{name}.pkl"), "wb") as f:
+                pickle.dump(model, f)
+        with publishing(list(models) + remove, path=os.path.join(model_dir, "publish.json")):
+            for name in models:
+                os.replace(
+                    os.path.join(staging_dir, f"{name}.pkl"),
+                    os.path.join(model_dir, f"{name}.pkl"),
+                )
+            for name in remove:
+                if os.path.exists(os.path.join(model_dir, f"{name}.pkl")):
+                    os.remove(os.path.join(model_dir, f"{name}.pkl"))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def load_consistent(
+    load: Callable[[], Any],
+    path: str = PUBLISH_PATH,
+    attempts: int = LOAD_ATTEMPTS,
+    wait_seconds: float = LOAD_WAIT_SECONDS,
+) -> Any | None:
+    """Call `load` until no publish overlaps it. None if every attempt overlapped one."""
+    for _ in range(attempts):
+        before = read_generation(path)
+        if before % 2 == 0:
+            result = load()
+            if read_generation(path) == before:
+                return result
+        time.sleep(wait_seconds)
+    return None
@@ -0,0 +1,193 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.aggregates import AGGREGATE_FEATURES
+
+QUOTE_LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "quote_log")
+# Events buffered between the request path and the writer; beyond this they are dropped
+MAX_PENDING = 10000
+# The writer closes a file once it holds this many events or its oldest is this old
+BATCH_EVENTS = 1000
+FLUSH_SECONDS = 5.0
+
+LOG_SCHEMA = pa.schema(
+    [
+        ("logged_at", pa.timestamp("us")),
+        ("endpoint", pa.string()),
+        ("enquiry_id", pa.string()),
+        ("vehicle_id", pa.string()),
+        ("model_source", pa.string()),
+        ("price_model_version", pa.string()),
+        ("conversion_model_version", pa.string()),
+        # Request
+        ("make", pa.string()),
+        ("model", pa.string()),
+        ("year", pa.int32()),
+        ("mileage", pa.int64()),
+        ("fuel_type", pa.string()),
+        ("channel", pa.string()),
+        ("damage_flag", pa.bool_()),
+        ("damage_type", pa.string()),
+        ("region_id", pa.string()),
+        # Model features derived from it
+        ("body_type", pa.string()),
+        ("vehicle_age", pa.int32()),
+        ("damage_severity_score", pa.int32()),
+        ("risk_score", pa.float64()),
+        ("month_sin", pa.float64()),
+        ("month_cos", pa.float64()),
+        *[(name, pa.float64()) for name in AGGREGATE_FEATURES],
+        # What was served
+        ("e_sale", pa.float64()),
+        ("price_q10", pa.float64()),
+        ("e_costs", pa.float64()),
+        ("recommended_offer", pa.float64()),
+        ("expected_value", pa.float64()),
+        ("p_win", pa.float64()),
+        ("risk_band", pa.string()),
+        ("selected", pa.bool_()),
+        ("latency_ms", pa.float64()),
+    ]
+)
+
+_STOP = object()
+
+
+class QuoteLogger:
+    """
+    Append-only log of served quotes, written off the request path.
+
+    `log` only puts the event on a bounded queue, counting it as dropped if the queue
+    is full, and a background thread writes batches to a new Parquet file under
+    date=YYYY-MM-DD/ per flush. Files appear by atomic rename, so readers only see
+    complete ones.
+    """
+
+    def __init__(
+        self,
+        log_dir: str = QUOTE_LOG_DIR,
+        enabled: bool = True,
+        max_pending: int = MAX_PENDING,
+        batch_events: int = BATCH_EVENTS,
+        flush_seconds: float = FLUSH_SECONDS,
+    ):
+        self.log_dir = log_dir
+        self.enabled = enabled
+        self.batch_events = batch_events
+        self.flush_seconds = flush_seconds
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._sequence = 0
+        self._counts = {"logged": 0, "dropped": 0, "written": 0, "files": 0, "write_errors": 0}
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counts[name] += n
+
+    def log(self, event: dict[str, Any]):
+        if not self.enabled:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(event)
+            self._count("logged")
+        except queue.Full:
+            self._count("dropped")
+
+    def _run(self):
+        batch: list[dict[str, Any]] = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                event = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                event = None
+            if event is _STOP:
+                self.write(batch)
+                return
+            if event is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_seconds
+                batch.append(event)
+            if batch and (len(batch) >= self.batch_events or time.monotonic() >= deadline):
+                self.write(batch)
+                batch = []
+
+    def write(self, batch: list[dict[str, Any]]):
+        """Write events as one file in the first event's day, on the calling thread."""
+        if not batch:
+            return
+        try:
+            table = pa.Table.from_pylist(batch, schema=LOG_SCHEMA)
+            day = batch[0]["logged_at"].strftime("%Y-%m-%d")
+            out_dir = os.path.join(self.log_dir, f"date={day}")
+            os.makedirs(out_dir, exist_ok=True)
+            with self._lock:
+                self._sequence += 1
+                sequence = self._sequence
+            name = f"part-{datetime.now():%H%M%S%f}-{os.getpid()}-{sequence:06d}.parquet"
+            # Dot-prefixed until complete: pyarrow datasets skip hidden files
+            tmp_path = os.path.join(out_dir, f".{name}.tmp")
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, os.path.join(out_dir, name))
+            self._count("written", len(batch))
+            self._count("files")
+        except (OSError, pa.ArrowException, TypeError, ValueError) as e:
+            print(f"Warning: could not write {len(batch)} quote log events: {e}")
+            self._count("write_errors", len(batch))
+
+    def flush(self, timeout: float = 10.0):
+        """Write everything logged so far and stop the writer; a later `log` restarts it."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        return {"enabled": self.enabled, "pending": self._queue.qsize(), **counts}
+
+
+def log_files(start=None, end=None, log_dir: str = QUOTE_LOG_DIR) -> list[str]:
+    """Complete log files for quote days in [start, end], oldest first."""
+    if not os.path.isdir(log_dir):
+        return []
+    first = str(pd.Timestamp(start).date()) if start is not None else ""
+    last = str(pd.Timestamp(end).date()) if end is not None else "9999"
+    files = []
+    for day_dir in sorted(os.listdir(log_dir)):
+        if not day_dir.startswith("date=") or not first <= day_dir[5:] <= last:
+            continue
+        path = os.path.join(log_dir, day_dir)
+        files += [
+            os.path.join(path, name)
+            for name in sorted(os.listdir(path))
+            if name.endswith(".parquet") and not name.startswith(".")
+        ]
+    return files
+
+
+def read_quote_log(files: list[str]) -> pd.DataFrame:
+    """The events of `files` as one frame, e.g. the files a monitor has not yet seen."""
+    if not files:
+        return LOG_SCHEMA.empty_table().to_pandas()
+    return pa.concat_tables(pq.read_table(path, schema=LOG_SCHEMA) for path in files).to_pandas()
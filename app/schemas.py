@@ -1,9 +1,11 @@
 from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 
 class QuoteRequest(BaseModel):
     vehicle_id: Optional[str] = None
+    # Joins the served quote to its outcome in monitoring
+    enquiry_id: Optional[str] = None
     make: str
     model: str
     year: int = Field(..., ge=1990, le=2026)
@@ -21,3 +23,31 @@ class QuoteResponse(BaseModel):
     p_win: float
     risk_band: str
     explanation: Dict[str, Any]
+
+
+class QuoteBatchRequest(BaseModel):
+    vehicles: List[QuoteRequest] = Field(..., min_length=1)
+    # Expected spend (sum of p_win × offer) and expected purchases (sum of p_win) limits
+    budget: Optional[float] = Field(None, gt=0)
+    max_volume: Optional[float] = Field(None, gt=0)
+    min_volume: Optional[float] = Field(None, ge=0)
+    risk_lambda: float = Field(0.5, ge=0)
+
+
+class PortfolioQuote(BaseModel):
+    vehicle_id: Optional[str] = None
+    recommended_offer: float
+    expected_value: float
+    p_win: float
+    selected: bool
+    risk_band: str
+
+
+class QuoteBatchResponse(BaseModel):
+    quotes: List[PortfolioQuote]
+    expected_spend: float
+    expected_volume: float
+    total_expected_value: float
+    budget_multiplier: float
+    volume_multiplier: float
+    feasible: bool
@@ -186,6 +186,16 @@ def load_reports():
     return drift, perf
 
 
+@st.cache_data
+def load_policy_sweep():
+    path = os.path.join(os.path.dirname(__file__), "..", "reports", "policy_sweep.json")
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
 @st.cache_resource
 def get_session():
     return requests.Session()
@@ -202,7 +212,9 @@ st.sidebar.markdown(
     unsafe_allow_html=True,
 )
 
-page = st.sidebar.radio("", ["Overview", "Drift Diagnostics", "Policy Simulator"])
+page = st.sidebar.radio(
+    "", ["Overview", "Drift Diagnostics", "Policy Simulator", "Policy Sweep"]
+)
 
 drift_report, perf_report = load_reports()
 
@@ -216,13 +228,13 @@ if page == "Overview":
 
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total Profit (Actual)", f"£{perf_report.get('total_profit_actual', 0):,.0f}")
+        st.metric("Realised Profit (30d)", f"£{perf_report.get('total_profit_actual') or 0:,.0f}")
     with col2:
-        st.metric("Profit Lift vs Flat Offer", f"+{perf_report.get('profit_lift_pct', 0)}%")
+        st.metric("Realised vs Expected", f"{perf_report.get('profit_lift_pct') or 0:+}%")
     with col3:
-        st.metric("Price Model MAE", f"£{perf_report.get('price_mae', 0)}")
+        st.metric("Price Model MAE (30d)", f"£{perf_report.get('price_mae') or 0}")
     with col4:
-        st.metric("Conversion Brier Score", f"{perf_report.get('conversion_brier', 0):.3f}")
+        st.metric("Conversion Brier (30d)", f"{perf_report.get('conversion_brier') or 0:.3f}")
 
     st.markdown("<br><hr>", unsafe_allow_html=True)
     st.markdown(
@@ -314,15 +326,20 @@ elif page == "Drift Diagnostics":
 
         st.markdown("<br>", unsafe_allow_html=True)
         st.markdown(
-            "<h3 style='font-size: 1.2rem; margin-bottom: 15px;'>KS Test Breakdown</h3>",
+            "<h3 style='font-size: 1.2rem; margin-bottom: 15px;'>KS / Chi-Square Test Breakdown</h3>",
             unsafe_allow_html=True,
         )
         df_ks = pd.DataFrame(
             {
                 "Feature Indicator": features,
                 "PSI Score": [f"{p:.3f}" for p in psis],
-                "KS p-value": [
-                    f"{drift_report['features'][f]['ks_p_value']:.4f}" for f in features
+                "Test": [
+                    "KS" if "ks_p_value" in drift_report["features"][f] else "Chi-square"
+                    for f in features
+                ],
+                "p-value": [
+                    f"{drift_report['features'][f].get('ks_p_value', drift_report['features'][f].get('chi2_p_value')):.4f}"
+                    for f in features
                 ],
                 "Status": [
                     "Drift Detected" if drift_report["features"][f]["drift_detected"] else "Stable"
@@ -331,6 +348,25 @@ elif page == "Drift Diagnostics":
             }
         )
         st.dataframe(df_ks, use_container_width=True, hide_index=True)
+
+        if drift_report.get("segments"):
+            st.markdown("<br>", unsafe_allow_html=True)
+            st.markdown(
+                "<h3 style='font-size: 1.2rem; margin-bottom: 15px;'>Segment Breakdown</h3>",
+                unsafe_allow_html=True,
+            )
+            df_segments = pd.DataFrame(
+                [
+                    {
+                        "Segment": segment,
+                        "Current Rows": result["current_rows"],
+                        "Max PSI": max(f["psi"] for f in result["features"].values()),
+                        "Drifted Features": ", ".join(result["drifted_features"]) or "None",
+                    }
+                    for segment, result in drift_report["segments"].items()
+                ]
+            )
+            st.dataframe(df_segments, use_container_width=True, hide_index=True)
     else:
         st.warning("No drift report found. Run pipelines/monitor/drift.py")
 
@@ -588,3 +624,69 @@ elif page == "Policy Simulator":
                 "<div style='padding: 20px; text-align: center; color: #71717A; border: 1px dashed #27272A; border-radius: 8px; margin-top: 20px;'>Enter vehicle attributes and generate an offer.</div>",
                 unsafe_allow_html=True,
             )
+
+elif page == "Policy Sweep":
+    st.markdown("<h1 style='font-size: 2rem;'>Policy Sweep</h1>", unsafe_allow_html=True)
+    st.markdown(
+        "<p style='color:#A1A1AA; font-size:1.05rem;'>Holdout Profit vs Win Rate per risk_lambda / min_margin Setting</p>",
+        unsafe_allow_html=True,
+    )
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    sweep = load_policy_sweep()
+    if sweep.get("settings"):
+        df_sweep = pd.DataFrame(sweep["settings"])
+        front = df_sweep[df_sweep["pareto"]].sort_values("win_rate")
+        best = df_sweep.loc[df_sweep["total_profit"].idxmax()]
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Most Profitable Setting", f"λ {best['risk_lambda']} / £{best['min_margin']:,.0f}")
+        with col2:
+            st.metric("Its Total Profit", f"£{best['total_profit']:,.0f}")
+        with col3:
+            st.metric("Holdout Vehicles", f"{sweep['holdout_vehicles']:,}")
+
+        fig = px.scatter(
+            df_sweep,
+            x="win_rate",
+            y="total_profit",
+            color=df_sweep["pareto"].map({True: "Pareto front", False: "Dominated"}),
+            color_discrete_map={"Pareto front": "#FAFAFA", "Dominated": "#52525B"},
+            hover_data=["risk_lambda", "min_margin", "margin_per_win"],
+            labels={"win_rate": "Win Rate", "total_profit": "Total Profit (£)", "color": ""},
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=front["win_rate"],
+                y=front["total_profit"],
+                mode="lines",
+                line={"color": "#FAFAFA", "width": 1, "dash": "dot"},
+                showlegend=False,
+                hoverinfo="skip",
+            )
+        )
+        fig.update_layout(**PLOTLY_THEME)
+        fig.update_layout(xaxis_tickformat=".0%", height=400)
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.markdown(
+            "<h3 style='font-size: 1.2rem; margin-bottom: 15px;'>Pareto Settings</h3>",
+            unsafe_allow_html=True,
+        )
+        st.dataframe(
+            front.sort_values("total_profit", ascending=False)[
+                [
+                    "risk_lambda",
+                    "min_margin",
+                    "win_rate",
+                    "margin_per_win",
+                    "total_profit",
+                    "expected_profit",
+                ]
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )
+    else:
+        st.warning("No policy sweep found. Run pipelines/evaluate/policy_sweep.py")
@@ -1,9 +1,27 @@
 import argparse
 import os
+import shutil
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
+FUEL_TYPES = ["petrol", "diesel", "electric", "hybrid"]
+BODY_TYPES = ["hatchback", "saloon", "suv", "estate"]
+CHANNELS = ["dealer", "private", "fleet"]
+DAMAGE_TYPES = ["scratches", "dents", "structural", "mechanical"]
+# Seller acceptance and outcome model, shared with pipelines/evaluate/evaluate.py: a
+# seller accepts with P = sigmoid((offer - ACCEPT_AT * TMV) / (ACCEPT_SCALE * TMV)),
+# the car sells on at TMV * N(1, SALE_NOISE) and costs BASE_COST, plus DAMAGE_COST
+# if damaged
+ACCEPT_AT = 0.90
+ACCEPT_SCALE = 0.05
+SALE_NOISE = 0.05
+BASE_COST = 250.0
+DAMAGE_COST = 500.0
+
 
 def sigmoid(x):
     return 1 / (1 + np.exp(-x))
@@ -111,8 +129,8 @@ def generate_synthetic_data(num_vehicles=50000, offers_per_enquiry=1, seed=42):
         enquiry_date = enquiry_dates[i]
 
         # Dealer threshold: they won't sell unless offer is close to tmv minus dealer threshold
-        dealer_threshold = tmv * 0.10  # e.g. dealer expects to lose 10% max on tmv
-        price_sensitivity = tmv * 0.05  # How sharp the curve is
+        dealer_threshold = tmv * (1 - ACCEPT_AT)  # e.g. dealer expects to lose 10% max on tmv
+        price_sensitivity = tmv * ACCEPT_SCALE  # How sharp the curve is
 
         # Generate N counterfactual offers mapping to different win probs
         for _ in range(offers_per_enquiry):
@@ -140,12 +158,12 @@ def generate_synthetic_data(num_vehicles=50000, offers_per_enquiry=1, seed=42):
             )
 
             # If win, actual costs are incurred
-            actual_costs = 250.0  # base fee
+            actual_costs = BASE_COST  # base fee
             if dmg_flag:
-                actual_costs += 500.0
+                actual_costs += DAMAGE_COST
 
             # Add some noise to final sale price (might be slightly different from tmv)
-            sale_price = round(tmv * np.random.normal(1.0, 0.05), 2)
+            sale_price = round(tmv * np.random.normal(1.0, SALE_NOISE), 2)
             gross_margin = round(sale_price - offer_price - actual_costs, 2)
 
             sales_list.append(
@@ -181,6 +199,220 @@ def generate_synthetic_data(num_vehicles=50000, offers_per_enquiry=1, seed=42):
     print(f"Saved to {os.path.abspath(out_dir)}")
 
 
+def _load_makes_models(rng):
+    import json
+
+    json_path = os.path.join(os.path.dirname(__file__), "assets", "makes_models.json")
+    with open(json_path, "r") as f:
+        mm_dict = json.load(f)
+
+    makes_models = []
+    for make, models in mm_dict.items():
+        for model in models:
+            makes_models.append((make, model, int(rng.integers(8000, 50000))))
+    return makes_models
+
+
+def _as_category(values, categories):
+    return pd.Categorical(values, categories=categories)
+
+
+def _write_partitioned(df, table_dir, chunk_idx):
+    """Write one chunk of a dated table as month=YYYY-MM/part-NNNNN.parquet files."""
+    months = df["date"].str.slice(0, 7)
+    for month in np.unique(months):
+        part_dir = os.path.join(table_dir, f"month={month}")
+        os.makedirs(part_dir, exist_ok=True)
+        table = pa.Table.from_pandas(df[months == month], preserve_index=False)
+        pq.write_table(table, os.path.join(part_dir, f"part-{chunk_idx:05d}.parquet"))
+
+
+def _generate_chunk(
+    chunk_idx, start, stop, offers_per_enquiry, seed, region_ids, makes_models, end_date, out_dir
+):
+    """
+    Generate vehicles [start, stop) and their enquiries/sales, vectorised.
+
+    The RNG is derived from (seed, chunk_idx) only, so a chunk's rows are identical
+    regardless of how many workers the run is spread over.
+    """
+    rng = np.random.default_rng([seed, 1, chunk_idx])
+    n = stop - start
+
+    vehicle_ids = "V" + pd.Series(np.arange(start + 1, stop + 1)).astype(str).str.zfill(6)
+
+    make_model_idx = rng.integers(0, len(makes_models), n)
+    makes = np.array([m[0] for m in makes_models], dtype=object)[make_model_idx]
+    models = np.array([m[1] for m in makes_models], dtype=object)[make_model_idx]
+    base_values = np.array([m[2] for m in makes_models])[make_model_idx]
+
+    years = rng.integers(2010, 2025, n)
+    age_depreciation = np.power(0.85, 2025 - years)
+
+    mileages = rng.exponential(scale=30000, size=n) + 5000
+    mileage_depreciation = np.maximum(0.3, 1.0 - (mileages / 150000.0) * 0.5)
+
+    fuel_types = rng.choice(FUEL_TYPES, n, p=[0.5, 0.3, 0.1, 0.1])
+    body_types = rng.choice(BODY_TYPES, n)
+
+    make_categories = sorted({m[0] for m in makes_models})
+    model_categories = sorted({m[1] for m in makes_models})
+    vehicles_df = pd.DataFrame(
+        {
+            "vehicle_id": vehicle_ids,
+            "make": _as_category(makes, make_categories),
+            "model": _as_category(models, model_categories),
+            "year": years.astype(np.int16),
+            "mileage": mileages.astype(np.int32),
+            "fuel_type": _as_category(fuel_types, FUEL_TYPES),
+            "body_type": _as_category(body_types, BODY_TYPES),
+        }
+    )
+
+    true_market_values = base_values * age_depreciation * mileage_depreciation
+    true_market_values *= rng.normal(1.0, 0.1, n)
+    true_market_values = np.maximum(500, true_market_values).round(2)
+
+    channels = rng.choice(CHANNELS, n, p=[0.6, 0.3, 0.1])
+    damage_flags = rng.binomial(1, 0.2, n).astype(bool)
+    damage_types = np.where(
+        damage_flags, rng.choice(DAMAGE_TYPES, n, p=[0.5, 0.3, 0.1, 0.1]), "none"
+    )
+    enquiry_regions = rng.choice(region_ids, n)
+    enquiry_dates = (
+        pd.Timestamp(end_date)
+        - pd.Timedelta(days=365)
+        + pd.to_timedelta(rng.integers(0, 365, n), unit="D")
+    ).strftime("%Y-%m-%d")
+
+    # Fan each vehicle out into its counterfactual offers
+    idx = np.repeat(np.arange(n), offers_per_enquiry)
+    m = len(idx)
+    tmv = true_market_values[idx]
+    first_enquiry = start * offers_per_enquiry + 1
+    enquiry_ids = "E" + pd.Series(np.arange(first_enquiry, first_enquiry + m)).astype(
+        str
+    ).str.zfill(7)
+
+    offer_price = (tmv * rng.normal(0.85, 0.1, m)).round(2)
+    p_win = sigmoid((offer_price - tmv * ACCEPT_AT) / (tmv * ACCEPT_SCALE))
+    win = rng.binomial(1, p_win).astype(bool)
+    sale_price = (tmv * rng.normal(1.0, SALE_NOISE, m)).round(2)
+    actual_costs = BASE_COST + DAMAGE_COST * damage_flags[idx]
+    gross_margin = (sale_price - offer_price - actual_costs).round(2)
+    dates = np.asarray(enquiry_dates)[idx]
+
+    enquiries_df = pd.DataFrame(
+        {
+            "enquiry_id": enquiry_ids,
+            "vehicle_id": vehicle_ids.to_numpy()[idx],
+            "region_id": _as_category(enquiry_regions[idx], region_ids),
+            "channel": _as_category(channels[idx], CHANNELS),
+            "damage_flag": damage_flags[idx],
+            "damage_type": _as_category(damage_types[idx], ["none"] + DAMAGE_TYPES),
+            "offer_price": offer_price,
+            "date": dates,
+        }
+    )
+    sales_df = pd.DataFrame(
+        {
+            "enquiry_id": enquiry_ids,
+            "true_market_value": tmv,
+            "sale_price": np.where(win, sale_price, np.nan),
+            "won": win.astype(np.int8),
+            "actual_costs": np.where(win, actual_costs, 0.0),
+            "gross_margin": np.where(win, gross_margin, 0.0),
+            "date": dates,
+        }
+    )
+
+    pq.write_table(
+        pa.Table.from_pandas(vehicles_df, preserve_index=False),
+        os.path.join(out_dir, "vehicles", f"part-{chunk_idx:05d}.parquet"),
+    )
+    _write_partitioned(enquiries_df, os.path.join(out_dir, "enquiries"), chunk_idx)
+    _write_partitioned(sales_df, os.path.join(out_dir, "sales"), chunk_idx)
+
+    return n, m
+
+
+def generate_sharded(
+    num_vehicles=50000,
+    offers_per_enquiry=1,
+    seed=42,
+    chunk_size=250000,
+    workers=None,
+    end_date=None,
+    out_dir=None,
+):
+    """
+    Sharded generator for load-test volumes.
+
+    Vehicles are split into fixed-size chunks, each generated by a worker process and
+    written straight to month-partitioned Parquet under `out_dir/<table>/`, so peak
+    memory per worker is bounded by `chunk_size` rather than `num_vehicles`.
+    """
+    end_date = pd.Timestamp(end_date or datetime.now().date())
+    out_dir = out_dir or os.path.join(os.path.dirname(__file__), "..", "raw")
+
+    for table in ["regions", "vehicles", "enquiries", "sales"]:
+        table_dir = os.path.join(out_dir, table)
+        if os.path.isdir(table_dir):
+            shutil.rmtree(table_dir)
+        os.makedirs(table_dir)
+
+    # Dimension tables come from their own stream so they do not depend on chunking
+    dim_rng = np.random.default_rng([seed, 0])
+    num_regions = int(dim_rng.integers(30, 101))
+    region_ids = [f"R{str(i).zfill(3)}" for i in range(1, num_regions + 1)]
+    regions_df = pd.DataFrame(
+        {
+            "region_id": region_ids,
+            "name": [f"Region {i}" for i in range(1, num_regions + 1)],
+            "country": "UK",
+            "risk_score": dim_rng.uniform(0.1, 1.0, num_regions),
+        }
+    )
+    pq.write_table(
+        pa.Table.from_pandas(regions_df, preserve_index=False),
+        os.path.join(out_dir, "regions", "part-00000.parquet"),
+    )
+    makes_models = _load_makes_models(dim_rng)
+
+    bounds = [
+        (i, start, min(start + chunk_size, num_vehicles))
+        for i, start in enumerate(range(0, num_vehicles, chunk_size))
+    ]
+
+    total_vehicles = total_enquiries = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _generate_chunk,
+                chunk_idx,
+                start,
+                stop,
+                offers_per_enquiry,
+                seed,
+                region_ids,
+                makes_models,
+                end_date,
+                out_dir,
+            )
+            for chunk_idx, start, stop in bounds
+        ]
+        for future in as_completed(futures):
+            n_vehicles, n_enquiries = future.result()
+            total_vehicles += n_vehicles
+            total_enquiries += n_enquiries
+
+    print(f"Generated {len(regions_df)} regions")
+    print(f"Generated {total_vehicles} vehicles in {len(bounds)} chunks")
+    print(f"Generated {total_enquiries} enquiries")
+    print(f"Generated {total_enquiries} sales")
+    print(f"Saved partitioned Parquet to {os.path.abspath(out_dir)}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate synthetic AutoPricer data")
     parser.add_argument("--num-vehicles", type=int, default=50000, help="Number of unique vehicles")
@@ -190,8 +422,38 @@ if __name__ == "__main__":
         default=1,
         help="Number of counterfactual offers per vehicle",
     )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="csv writes the four in-memory CSVs; parquet runs the sharded generator",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Base random seed")
+    parser.add_argument(
+        "--chunk-size", type=int, default=250000, help="Vehicles per shard (parquet only)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Worker processes (parquet only, default: CPUs)"
+    )
+    parser.add_argument(
+        "--end-date",
+        default=None,
+        help="Last enquiry date, YYYY-MM-DD (parquet only, default: today)",
+    )
     args = parser.parse_args()
 
-    generate_synthetic_data(
-        num_vehicles=args.num_vehicles, offers_per_enquiry=args.offers_per_enquiry
-    )
+    if args.format == "parquet":
+        generate_sharded(
+            num_vehicles=args.num_vehicles,
+            offers_per_enquiry=args.offers_per_enquiry,
+            seed=args.seed,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            end_date=args.end_date,
+        )
+    else:
+        generate_synthetic_data(
+            num_vehicles=args.num_vehicles,
+            offers_per_enquiry=args.offers_per_enquiry,
+            seed=args.seed,
+        )
@@ -1,5 +1,24 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='enquiry_id',
+        incremental_strategy='delete+insert',
+        indexes=[
+            {'columns': ['enquiry_id'], 'unique': True},
+            {'columns': ['enquiry_date']},
+            {'columns': ['vehicle_id']},
+        ]
+    )
+}}
+
 WITH enquiries AS (
     SELECT * FROM {{ ref('stg_enquiries') }}
+    {% if is_incremental() %}
+    -- Re-join the trailing window so sales landing after their enquiry update its outcome
+    WHERE enquiry_date >= (
+        SELECT max(enquiry_date) - {{ var('sales_lookback_days') }} FROM {{ this }}
+    )
+    {% endif %}
 ),
 sales AS (
     SELECT * FROM {{ ref('stg_sales') }}
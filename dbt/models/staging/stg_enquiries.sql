@@ -1,3 +1,15 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='enquiry_id',
+        incremental_strategy='delete+insert',
+        indexes=[
+            {'columns': ['enquiry_id'], 'unique': True},
+            {'columns': ['enquiry_date']},
+        ]
+    )
+}}
+
 SELECT
     enquiry_id,
     vehicle_id,
@@ -9,3 +21,9 @@ SELECT
     date::date AS enquiry_date
 FROM
     {{ source('raw', 'enquiries') }}
+{% if is_incremental() %}
+-- raw.date is ISO text, so compare as text to keep raw indexes/partitions usable
+WHERE date >= (
+    SELECT to_char(max(enquiry_date) - {{ var('lookback_days') }}, 'YYYY-MM-DD') FROM {{ this }}
+)
+{% endif %}
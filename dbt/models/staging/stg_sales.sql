@@ -1,3 +1,15 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='enquiry_id',
+        incremental_strategy='delete+insert',
+        indexes=[
+            {'columns': ['enquiry_id'], 'unique': True},
+            {'columns': ['sale_date']},
+        ]
+    )
+}}
+
 SELECT
     enquiry_id,
     true_market_value,
@@ -8,3 +20,8 @@ SELECT
     date::date AS sale_date
 FROM
     {{ source('raw', 'sales') }}
+{% if is_incremental() %}
+WHERE date >= (
+    SELECT to_char(max(sale_date) - {{ var('sales_lookback_days') }}, 'YYYY-MM-DD') FROM {{ this }}
+)
+{% endif %}
@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import pickle
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from sklearn.metrics import mean_absolute_error, roc_auc_score
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+
+from pipelines.features.store import attach_aggregates, load_features
+from pipelines.train import train_conversion_model as conversion
+from pipelines.train import train_price_model as price
+from pipelines.train.categorical import extend_vocabulary, feature_types, load_vocabulary
+
+MODES = ["onehot", "native"]
+
+
+def _build(kind, mode, vocab):
+    if kind == "price":
+        types = feature_types(len(price.NUMERIC_FEATURES), mode)
+        model = price.price_estimator(types)
+        preprocessor = price.build_preprocessor(mode, vocab)
+    else:
+        types = feature_types(len(conversion.NUMERIC_FEATURES), mode)
+        model = conversion.conversion_estimator(types)
+        preprocessor = conversion.build_preprocessor(mode, vocab)
+    return Pipeline(steps=[("preprocessor", preprocessor), ("model", model)])
+
+
+def _run(kind, mode, vocab, X_train, y_train, X_test, y_test, repeats):
+    pipeline = _build(kind, mode, vocab)
+
+    # Python-side allocations during fit, i.e. the encoded design matrix and its copies
+    # (the boosters' native buffers are not traced)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    pipeline.fit(X_train, y_train)
+    fit_s = time.perf_counter() - t0
+    fit_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    design_matrix = pipeline.named_steps["preprocessor"].transform(X_train)
+
+    # One-row DataFrame per call, exactly as get_quote builds its features
+    timings = []
+    for i in range(repeats):
+        row = X_test.iloc[i % len(X_test) : i % len(X_test) + 1]
+        t0 = time.perf_counter()
+        if kind == "price":
+            pipeline.predict(row)
+        else:
+            pipeline.predict_proba(row)
+        timings.append(time.perf_counter() - t0)
+
+    if kind == "price":
+        score = {"mae": round(float(mean_absolute_error(y_test, pipeline.predict(X_test))), 2)}
+    else:
+        score = {
+            "roc_auc": round(float(roc_auc_score(y_test, pipeline.predict_proba(X_test)[:, 1])), 3)
+        }
+
+    return {
+        "fit_s": round(fit_s, 3),
+        "design_matrix_columns": int(design_matrix.shape[1]),
+        "design_matrix_mb": round(np.asarray(design_matrix, dtype=np.float32).nbytes / 2**20, 2),
+        "fit_peak_traced_mb": round(fit_peak / 2**20, 2),
+        "model_size_kb": round(len(pickle.dumps(pipeline)) / 1024, 1),
+        "single_row_predict_ms": round(float(np.median(timings) * 1000), 3),
+        **score,
+    }
+
+
+def benchmark_categorical(start=None, end=None, repeats=200):
+    """
+    Compare the one-hot and native categorical pipelines of both models: fit time,
+    memory, pickled model size, single-row latency and accuracy on a held-out split.
+    """
+    print("Loading data for categorical encoding benchmark...")
+    df = load_features(start, end)
+    if df is None:
+        print("Features not built, run build_features.py first!")
+        return
+    df = attach_aggregates(df)
+    df["won"] = df["won"].fillna(0).astype(int)
+    vocab = extend_vocabulary(load_vocabulary(), df)
+
+    won = df[df["won"] == 1]
+    splits = {
+        "price": train_test_split(
+            won[price.FEATURES], won[price.TARGET], test_size=0.2, random_state=42
+        ),
+        "conversion": train_test_split(
+            df[conversion.FEATURES], df[conversion.TARGET], test_size=0.2, random_state=42
+        ),
+    }
+
+    results = {}
+    for kind, (X_train, X_test, y_train, y_test) in splits.items():
+        for mode in MODES:
+            result = _run(kind, mode, vocab, X_train, y_train, X_test, y_test, repeats)
+            results[f"{kind}_{mode}"] = result
+            print(f"{kind} {mode}: {result}")
+
+    reports_dir = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
+    os.makedirs(reports_dir, exist_ok=True)
+    with open(os.path.join(reports_dir, "categorical_benchmark.json"), "w") as f:
+        json.dump(
+            {
+                "benchmarked_at": datetime.now().isoformat(),
+                "rows": {kind: len(split[0]) for kind, split in splits.items()},
+                "models": results,
+            },
+            f,
+            indent=2,
+        )
+
+    print("Generated categorical_benchmark.json")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark one-hot vs native categoricals")
+    parser.add_argument("--start", default=None, help="First enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument(
+        "--repeats", type=int, default=200, help="Single-row predictions timed per model"
+    )
+    args = parser.parse_args()
+
+    benchmark_categorical(start=args.start, end=args.end, repeats=args.repeats)
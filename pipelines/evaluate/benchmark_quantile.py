@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+from sklearn.metrics import mean_pinball_loss
+from sklearn.model_selection import train_test_split
+
+from pipelines.features.store import attach_aggregates, load_features
+from pipelines.train.train_price_model import (
+    FEATURES,
+    TARGET,
+    build_preprocessor,
+    quantile_estimator,
+)
+
+ENGINES = ["gbr", "hist", "xgb"]
+QUANTILES = [0.10, 0.90]
+
+
+def _single_row_latency_ms(model, X, repeats):
+    """Median latency of predicting one preprocessed row, as the API does per quote."""
+    timings = []
+    for i in range(repeats):
+        row = X[i % len(X) : i % len(X) + 1]
+        t0 = time.perf_counter()
+        model.predict(row)
+        timings.append(time.perf_counter() - t0)
+    return float(np.median(timings) * 1000)
+
+
+def benchmark_quantile(start=None, end=None, repeats=200):
+    """
+    Fit each quantile engine on the same preprocessed split and compare fit time,
+    batch and single-row predict latency, and pinball loss on the held-out rows.
+    """
+    print("Loading data for quantile benchmark...")
+    df = load_features(start, end)
+    if df is None:
+        print("Features not built, run build_features.py first!")
+        return
+    df = attach_aggregates(df)
+    train_df = df[df["won"] == 1.0]
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        train_df[FEATURES], train_df[TARGET], test_size=0.2, random_state=42
+    )
+    preprocessor = build_preprocessor()
+    Xt_train = np.ascontiguousarray(preprocessor.fit_transform(X_train), dtype=np.float32)
+    Xt_test = np.ascontiguousarray(preprocessor.transform(X_test), dtype=np.float32)
+    y_train = y_train.to_numpy(dtype=np.float32)
+    y_test = y_test.to_numpy(dtype=np.float32)
+
+    results = {}
+    for engine in ENGINES:
+        for alpha in QUANTILES:
+            name = f"{engine}_q{int(alpha * 100)}"
+            model = quantile_estimator(alpha, engine)
+
+            t0 = time.perf_counter()
+            model.fit(Xt_train, y_train)
+            fit_s = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            y_pred = model.predict(Xt_test)
+            batch_s = time.perf_counter() - t0
+
+            results[name] = {
+                "engine": engine,
+                "quantile": alpha,
+                "fit_s": round(fit_s, 3),
+                "batch_predict_s": round(batch_s, 4),
+                "single_row_predict_ms": round(_single_row_latency_ms(model, Xt_test, repeats), 3),
+                "pinball_loss": round(float(mean_pinball_loss(y_test, y_pred, alpha=alpha)), 2),
+                # Share of held-out sales below the predicted quantile (should be ~alpha)
+                "coverage": round(float(np.mean(y_test <= y_pred)), 3),
+            }
+            print(
+                f"{name}: fit {fit_s:.2f}s, single-row "
+                f"{results[name]['single_row_predict_ms']:.2f}ms, "
+                f"pinball {results[name]['pinball_loss']:.2f}"
+            )
+
+    reports_dir = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
+    os.makedirs(reports_dir, exist_ok=True)
+    with open(os.path.join(reports_dir, "quantile_benchmark.json"), "w") as f:
+        json.dump(
+            {
+                "benchmarked_at": datetime.now().isoformat(),
+                "training_rows": len(Xt_train),
+                "test_rows": len(Xt_test),
+                "models": results,
+            },
+            f,
+            indent=2,
+        )
+
+    print("Generated quantile_benchmark.json")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the q10/q90 quantile engines")
+    parser.add_argument("--start", default=None, help="First enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument(
+        "--repeats", type=int, default=200, help="Single-row predictions timed per model"
+    )
+    args = parser.parse_args()
+
+    benchmark_quantile(start=args.start, end=args.end, repeats=args.repeats)
@@ -1,41 +1,376 @@
+import argparse
+import json
 import os
+import pickle
+import time
+from datetime import datetime
 
+import numpy as np
+from sklearn.metrics import brier_score_loss, mean_absolute_error, roc_auc_score
+
+from app.optimiser import (
+    compute_expected_costs_batch,
+    offer_grid,
+    optimise_offers,
+    optimise_portfolio,
+    p_win_matrix,
+)
+from data.seed.generate import ACCEPT_AT, ACCEPT_SCALE, BASE_COST, DAMAGE_COST, SALE_NOISE
+from pipelines.features.store import attach_aggregates, load_features
+from pipelines.train import train_conversion_model as conversion
+from pipelines.train import train_price_model as price
+from pipelines.train.out_of_core import holdout_mask, source_columns
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "models")
+REPORTS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
+
+# The flat baseline offers this share of book value (the price model's E(sale))
+BASELINE_RATIO = 0.85
+SERVED_MODELS = ["price_model", "price_q10", "price_quantiles", "conversion_model"]
+
+
+def _load_model(name):
+    path = os.path.join(MODEL_DIR, f"{name}.pkl")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def load_models():
+    """The served models, or None if the point price or conversion model is missing."""
+    models = {name: _load_model(name) for name in SERVED_MODELS}
+    if models["price_model"] is None or models["conversion_model"] is None:
+        return None
+    return models
+
+
+def load_holdout(start=None, end=None):
+    """
+    Holdout enquiries within [start, end] with aggregates attached: the deterministic
+    20% hash holdout of the training scripts. None if features are not built.
+    """
+    extra = ["enquiry_id", "true_market_value", "damage_flag", price.TARGET, conversion.TARGET]
+    columns = source_columns(list(dict.fromkeys(conversion.FEATURES + price.FEATURES + extra)))
+    df = load_features(start, end, columns=columns)
+    if df is None:
+        return None
+    df = df[holdout_mask(df["enquiry_id"])].reset_index(drop=True)
+    df = attach_aggregates(df)
+    df["won"] = df["won"].fillna(0).astype(int)
+    return df
+
+
+def predict_prices(models, X):
+    """
+    E(sale) and q10 per vehicle, from the same models the API serves: E(sale) from the
+    mean model, q10 from the multi-quantile model when it is present.
+    """
+    e_sale = models["price_model"].predict(X)
+    if models.get("price_quantiles") is not None:
+        return e_sale, np.sort(models["price_quantiles"].predict(X), axis=1)[:, 0]
+    return e_sale, models["price_q10"].predict(X)
+
+
+def acceptance_probability(offer, true_market_value):
+    z = (offer - ACCEPT_AT * true_market_value) / (ACCEPT_SCALE * true_market_value)
+    return np.where(offer > 0, 1.0 / (1.0 + np.exp(-z)), 0.0)
 
-def evaluate():
-    print("Evaluating models and generating reports...")
 
-    reports_dir = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
-    os.makedirs(reports_dir, exist_ok=True)
+def outcome_inputs(df, seed=42):
+    """True market values, realised costs and the shared random draws of `df`'s vehicles."""
+    rng = np.random.default_rng(seed)
+    draws = {"accept": rng.random(len(df)), "sale_shock": rng.standard_normal(len(df))}
+    true_market_value = df["true_market_value"].to_numpy(dtype=float)
+    actual_costs = BASE_COST + DAMAGE_COST * df["damage_flag"].to_numpy(dtype=bool)
+    return true_market_value, actual_costs, draws
 
-    # Mocking evaluation for speed in Phase 3
-    # In reality, this loads X_test, y_test, computes MAE, AUC, Brier,
-    # and tests the optimiser's profit versus a flat baseline.
 
-    report_content = """# Baseline vs Improved Model Performance
+def realise(offer, true_market_value, actual_costs, draws):
+    """
+    Simulated wins and profit of each offer. `draws` holds one shared uniform and one
+    sale-price shock per vehicle, so every policy faces the same sellers and markets.
+    """
+    p_accept = acceptance_probability(offer, true_market_value)
+    won = draws["accept"] < p_accept
+    sale_price = true_market_value * (1.0 + SALE_NOISE * draws["sale_shock"])
+    profit = np.where(won, sale_price - offer - actual_costs, 0.0)
+    expected = p_accept * (true_market_value - offer - actual_costs)
+    return won, profit, expected
 
-| Metric | Baseline (Phase 1) | Improved (Phase 3) |
-|---|---|---|
-| Sale Price MAE | ~£850 | ~£420 |
-| Conversion ROC AUC | 0.650 | 0.785 |
-| Conversion Brier Score | 0.22 | 0.15 |
 
-## Profit Simulation (1,000 Vehicles)
+def summarise(offer, won, profit, expected):
+    wins = int(won.sum())
+    return {
+        "vehicles": len(offer),
+        "offers_made": int((offer > 0).sum()),
+        "wins": wins,
+        "win_rate": round(wins / len(offer), 4),
+        "margin_per_win": round(float(profit[won].mean()), 2) if wins else 0.0,
+        "total_profit": round(float(profit.sum()), 2),
+        "expected_profit": round(float(expected.sum()), 2),
+        "profit_per_vehicle": round(float(profit.sum() / len(offer)), 2),
+    }
 
-We simulated offering a flat 85% of book value versus the EV Optimiser policy.
 
-| Strategy | Win Rate | Margin per Win | Total Expected Profit |
-|---|---|---|---|
-| Flat Offer (85% Book) | 35% | £400 | £140,000 |
-| EV Optimiser (Phase 3) | 42% | £550 | **£231,000** |
+def daily_portfolio(days, e_sale, price_q10, e_costs, offers, p_win, valid, **constraints):
+    """
+    optimise_portfolio run separately on each enquiry day's vehicles, so `constraints`
+    (budget, max_volume, min_volume, risk_lambda) apply per day. Returns the offers and
+    one summary row per day.
+    """
+    offer = np.zeros(len(days))
+    summary = []
+    for day, index in days.groupby(days).indices.items():
+        result = optimise_portfolio(
+            e_sale[index],
+            price_q10[index],
+            e_costs[index],
+            offers[index],
+            p_win[index],
+            valid[index],
+            **constraints,
+        )
+        offer[index] = result["recommended_offer"]
+        summary.append(
+            {
+                "day": str(day.date()),
+                "vehicles": len(index),
+                "expected_spend": round(result["expected_spend"], 2),
+                "expected_volume": round(result["expected_volume"], 2),
+                "budget_multiplier": round(result["budget_multiplier"], 6),
+                "feasible": result["feasible"],
+            }
+        )
+    return offer, summary
 
-**Conclusion:** The advanced models with calibrated conversion probabilities and tail-risk penalties yield a **+65% increase in total expected profit** compared to a naive flat-offer policy.
-"""
 
-    with open(os.path.join(reports_dir, "baseline_vs_improved.md"), "w") as f:
-        f.write(report_content)
+def _gbp(value, sign=False):
+    text = f"£{abs(value):,.0f}"
+    return ("-" if value < 0 else "+" if sign else "") + text
 
-    print("Generated baseline_vs_improved.md")
+
+def _markdown(report):
+    metrics, policies = report["model_metrics"], report["policies"]
+    baseline, ev = policies["flat_baseline"], policies["ev_optimiser"]
+    lines = [
+        "# Baseline vs Improved Model Performance",
+        "",
+        (
+            f"Holdout: {report['holdout_vehicles']:,} enquiries "
+            f"({report['holdout']}), evaluated {report['evaluated_at'][:10]}."
+        ),
+        "",
+        "| Metric | Holdout |",
+        "|---|---|",
+        f"| Sale Price MAE | {_gbp(metrics['price_mae'])} |",
+        f"| Conversion ROC AUC | {metrics['conversion_roc_auc']:.3f} |",
+        f"| Conversion Brier Score | {metrics['conversion_brier']:.3f} |",
+        "",
+        f"## Profit Backtest ({report['holdout_vehicles']:,} Vehicles)",
+        "",
+        (
+            f"Every holdout vehicle was scored against its {report['offer_grid_size']}-offer "
+            f"grid in vectorised chunks ({report['scoring_wall_s']:.1f}s, "
+            f"{report['scoring_pairs_per_s']:,} pairs/s), and both policies "
+            "were settled against the simulator's seller acceptance curve with shared random draws."
+        ),
+        "",
+        "| Strategy | Offers Made | Win Rate | Margin per Win | Total Profit | Expected Profit |",
+        "|---|---|---|---|---|---|",
+    ]
+    rows = [(f"Flat Offer ({BASELINE_RATIO:.0%} Book)", baseline), ("EV Optimiser", ev)]
+    if "ev_portfolio" in policies:
+        rows.append(("EV Portfolio (Daily Limits)", policies["ev_portfolio"]))
+    for name, p in rows:
+        lines.append(
+            f"| {name} | {p['offers_made']:,} | {p['win_rate']:.1%} | "
+            f"{_gbp(p['margin_per_win'])} | {_gbp(p['total_profit'])} | "
+            f"{_gbp(p['expected_profit'])} |"
+        )
+    lines += [
+        "",
+        (
+            f"**Conclusion:** On the same vehicles, the EV optimiser's realised profit is "
+            f"**{_gbp(report['profit_uplift'], sign=True)}** "
+            f"({_gbp(report['profit_uplift_per_vehicle'], sign=True)} per vehicle) against the "
+            "flat-offer policy."
+        ),
+        "",
+    ]
+    if "portfolio" in report:
+        portfolio = report["portfolio"]
+        limits = [
+            (
+                f"an expected spend of {_gbp(portfolio['daily_budget'])}"
+                if portfolio["daily_budget"] is not None
+                else None
+            ),
+            (
+                f"{portfolio['daily_volume']:,.0f} expected purchases"
+                if portfolio["daily_volume"] is not None
+                else None
+            ),
+        ]
+        lines += [
+            (
+                f"**Portfolio:** offers chosen jointly per enquiry day, capped at "
+                f"{' and '.join(limit for limit in limits if limit)} a day. Limits bound on "
+                f"{portfolio['days_constrained']} of {portfolio['days']} days; the mean daily "
+                f"expected spend was {_gbp(portfolio['mean_daily_expected_spend'])} "
+                f"({portfolio['wall_s']:.2f}s to optimise every day)."
+            ),
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def evaluate(start=None, end=None, seed=42, risk_lambda=0.5, daily_budget=None, daily_volume=None):
+    """
+    Counterfactual profit backtest of the served models on the holdout enquiries:
+    model metrics, then the EV policy against a flat offer of BASELINE_RATIO × E(sale).
+    With a daily budget or volume cap, a portfolio policy picks each day's offers
+    jointly under those limits as well.
+    """
+    print("Evaluating models and generating reports...")
+    models = load_models()
+    if models is None:
+        print("Models not found, run make train first!")
+        return
+    df = load_holdout(start, end)
+    if df is None:
+        print("Features not built, run build_features.py first!")
+        return
+    print(f"Backtesting {len(df)} holdout enquiries...")
+
+    won = (df["won"] == 1).to_numpy()
+    p_actual = models["conversion_model"].predict_proba(df[conversion.FEATURES])[:, 1]
+    metrics = {
+        "price_mae": round(
+            float(
+                mean_absolute_error(
+                    df.loc[won, price.TARGET],
+                    models["price_model"].predict(df.loc[won, price.FEATURES]),
+                )
+            ),
+            2,
+        ),
+        "conversion_roc_auc": round(float(roc_auc_score(df["won"], p_actual)), 3),
+        "conversion_brier": round(float(brier_score_loss(df["won"], p_actual)), 4),
+    }
+
+    scoring_start = time.perf_counter()
+    e_sale, price_q10 = predict_prices(models, df[price.FEATURES])
+    e_costs = compute_expected_costs_batch(df["damage_flag"], df["channel"], df["risk_score"])
+    offers, valid = offer_grid(e_sale, e_costs)
+    p_win = p_win_matrix(models["conversion_model"], df[conversion.FEATURES], offers)
+    policy = optimise_offers(e_sale, price_q10, e_costs, offers, p_win, valid, risk_lambda)
+    scoring_wall = time.perf_counter() - scoring_start
+    print(
+        f"Scored {offers.size} vehicle-offer pairs in {scoring_wall:.2f}s "
+        f"({offers.size / scoring_wall:,.0f} pairs/s)"
+    )
+
+    candidates = [
+        ("flat_baseline", BASELINE_RATIO * e_sale),
+        ("ev_optimiser", policy["recommended_offer"]),
+    ]
+    portfolio = None
+    if daily_budget is not None or daily_volume is not None:
+        portfolio_start = time.perf_counter()
+        portfolio_offer, days = daily_portfolio(
+            df["enquiry_date"].dt.normalize(),
+            e_sale,
+            price_q10,
+            e_costs,
+            offers,
+            p_win,
+            valid,
+            budget=daily_budget,
+            max_volume=daily_volume,
+            risk_lambda=risk_lambda,
+        )
+        portfolio_wall = time.perf_counter() - portfolio_start
+        candidates.append(("ev_portfolio", portfolio_offer))
+        portfolio = {
+            "daily_budget": daily_budget,
+            "daily_volume": daily_volume,
+            "days": len(days),
+            "days_constrained": sum(
+                d["budget_multiplier"] > 0
+                or (daily_volume is not None and d["expected_volume"] >= daily_volume - 1e-6)
+                for d in days
+            ),
+            "mean_daily_expected_spend": round(
+                float(np.mean([d["expected_spend"] for d in days])), 2
+            ),
+            "wall_s": round(portfolio_wall, 3),
+            "by_day": days,
+        }
+        print(f"Optimised {len(days)} daily portfolios in {portfolio_wall:.2f}s")
+
+    tmv, actual_costs, draws = outcome_inputs(df, seed)
+
+    policies = {}
+    for name, offer in candidates:
+        policies[name] = summarise(offer, *realise(offer, tmv, actual_costs, draws))
+        print(f"{name}: {policies[name]}")
+
+    uplift = policies["ev_optimiser"]["total_profit"] - policies["flat_baseline"]["total_profit"]
+    report = {
+        "evaluated_at": datetime.now().isoformat(),
+        "holdout": f"hash holdout, {start or 'first'} to {end or 'last'} enquiry date",
+        "holdout_vehicles": len(df),
+        "offer_grid_size": offers.shape[1],
+        "risk_lambda": risk_lambda,
+        "seed": seed,
+        "scoring_wall_s": round(scoring_wall, 3),
+        "scoring_pairs_per_s": round(offers.size / scoring_wall),
+        "model_metrics": metrics,
+        "policies": policies,
+        "profit_uplift": round(uplift, 2),
+        "profit_uplift_per_vehicle": round(uplift / len(df), 2),
+    }
+    if portfolio is not None:
+        report["portfolio"] = portfolio
+
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    with open(os.path.join(REPORTS_DIR, "backtest.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.join(REPORTS_DIR, "baseline_vs_improved.md"), "w") as f:
+        f.write(_markdown(report))
+
+    print("Generated baseline_vs_improved.md and backtest.json")
+    return report
 
 
 if __name__ == "__main__":
-    evaluate()
+    parser = argparse.ArgumentParser(description="Backtest the EV policy against a flat offer")
+    parser.add_argument("--start", default=None, help="First enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the simulated outcomes")
+    parser.add_argument(
+        "--risk-lambda", type=float, default=0.5, help="Tail-risk penalty weight of the policy"
+    )
+    parser.add_argument(
+        "--daily-budget",
+        type=float,
+        default=None,
+        help="Also backtest a portfolio policy capping each day's expected spend (£)",
+    )
+    parser.add_argument(
+        "--daily-volume",
+        type=float,
+        default=None,
+        help="Also backtest a portfolio policy capping each day's expected purchases",
+    )
+    args = parser.parse_args()
+
+    evaluate(
+        start=args.start,
+        end=args.end,
+        seed=args.seed,
+        risk_lambda=args.risk_lambda,
+        daily_budget=args.daily_budget,
+        daily_volume=args.daily_volume,
+    )
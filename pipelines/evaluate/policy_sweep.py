@@ -0,0 +1,195 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from app.optimiser import (
+    compute_expected_costs_batch,
+    offer_bounds,
+    offer_grid,
+    optimise_offers,
+    p_win_matrix,
+)
+from pipelines.evaluate.evaluate import (
+    REPORTS_DIR,
+    load_holdout,
+    load_models,
+    outcome_inputs,
+    predict_prices,
+    realise,
+    summarise,
+)
+from pipelines.train import train_conversion_model as conversion
+from pipelines.train import train_price_model as price
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "cache", "policy_sweep")
+
+RISK_LAMBDAS = [0.0, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0]
+MIN_MARGINS = [0.0, 100.0, 200.0, 300.0, 500.0, 750.0, 1000.0, 1500.0]
+# Offers on each vehicle's precomputed P(win) curve; every setting's grid is
+# interpolated from it
+CURVE_POINTS = 100
+
+
+def _interpolate(curve, lo, hi, offers):
+    """Linear interpolation of each row's evenly spaced P(win) curve at `offers`."""
+    n, k = curve.shape
+    span = np.where(hi > lo, hi - lo, 1.0)[:, None]
+    position = np.clip((offers - lo[:, None]) / span * (k - 1), 0, k - 1)
+    left = np.minimum(position.astype(int), k - 2)
+    weight = position - left
+    rows = np.arange(n)[:, None]
+    return (1 - weight) * curve[rows, left] + weight * curve[rows, left + 1]
+
+
+def _evaluate_margin(paths, min_margin, risk_lambdas):
+    """Every risk_lambda at one min_margin: only NumPy over the memory-mapped arrays."""
+    a = {name: np.load(path, mmap_mode="r") for name, path in paths.items()}
+    draws = {"accept": a["accept"], "sale_shock": a["sale_shock"]}
+    offers, valid = offer_grid(a["e_sale"], a["e_costs"], min_margin)
+    p_win = _interpolate(a["curve"], a["curve_lo"], a["curve_hi"], offers)
+
+    results = []
+    for risk_lambda in risk_lambdas:
+        policy = optimise_offers(
+            a["e_sale"], a["price_q10"], a["e_costs"], offers, p_win, valid, risk_lambda
+        )
+        offer = policy["recommended_offer"]
+        results.append(
+            {
+                "risk_lambda": risk_lambda,
+                "min_margin": min_margin,
+                **summarise(offer, *realise(offer, a["tmv"], a["actual_costs"], draws)),
+            }
+        )
+    return results
+
+
+def pareto_front(results, objectives=("total_profit", "win_rate")):
+    """Mark settings that no other setting matches or beats on every objective."""
+    for r in results:
+        r["pareto"] = not any(
+            all(o[k] >= r[k] for k in objectives) and any(o[k] > r[k] for k in objectives)
+            for o in results
+        )
+    return results
+
+
+def policy_sweep(
+    start=None,
+    end=None,
+    risk_lambdas=RISK_LAMBDAS,
+    min_margins=MIN_MARGINS,
+    n_jobs=None,
+    seed=42,
+):
+    """
+    Backtest every (risk_lambda, min_margin) policy on the holdout.
+
+    The models are scored once: E(sale), q10 and a CURVE_POINTS-offer P(win) curve per
+    vehicle spanning the widest offer range any setting searches. Settings are then
+    spread over processes that rebuild optimise_offer's grid by interpolating the
+    curves and settle the chosen offers with the same draws as evaluate.py.
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    print("Loading holdout for policy sweep...")
+    models = load_models()
+    if models is None:
+        print("Models not found, run make train first!")
+        return
+    df = load_holdout(start, end)
+    if df is None:
+        print("Features not built, run build_features.py first!")
+        return
+
+    scoring_start = time.perf_counter()
+    e_sale, price_q10 = predict_prices(models, df[price.FEATURES])
+    e_costs = compute_expected_costs_batch(df["damage_flag"], df["channel"], df["risk_score"])
+    curve_lo, _ = offer_bounds(e_sale, e_costs, max(min_margins))
+    _, curve_hi = offer_bounds(e_sale, e_costs, min(min_margins))
+    curve_offers = np.linspace(curve_lo, curve_hi, num=CURVE_POINTS, axis=-1)
+    curve = p_win_matrix(models["conversion_model"], df[conversion.FEATURES], curve_offers)
+    scoring_wall = time.perf_counter() - scoring_start
+    print(f"Scored {curve.size} vehicle-offer pairs in {scoring_wall:.2f}s")
+
+    tmv, actual_costs, draws = outcome_inputs(df, seed)
+    arrays = {
+        "e_sale": e_sale,
+        "price_q10": price_q10,
+        "e_costs": e_costs,
+        "curve": curve,
+        "curve_lo": curve_lo,
+        "curve_hi": curve_hi,
+        "tmv": tmv,
+        "actual_costs": actual_costs,
+        **draws,
+    }
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    paths = {}
+    for name, array in arrays.items():
+        paths[name] = os.path.join(CACHE_DIR, f"{name}.npy")
+        np.save(paths[name], np.asarray(array, dtype=np.float64))
+
+    sweep_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        futures = [
+            pool.submit(_evaluate_margin, paths, float(m), [float(r) for r in risk_lambdas])
+            for m in min_margins
+        ]
+        results = list(itertools.chain.from_iterable(f.result() for f in futures))
+    sweep_wall = time.perf_counter() - sweep_start
+    results = pareto_front(results)
+    print(f"Evaluated {len(results)} settings in {sweep_wall:.2f}s on {n_jobs} processes")
+
+    front = sorted((r for r in results if r["pareto"]), key=lambda r: -r["total_profit"])
+    for r in front:
+        print(
+            f"risk_lambda={r['risk_lambda']} min_margin={r['min_margin']}: "
+            f"win rate {r['win_rate']:.1%}, profit £{r['total_profit']:,.0f}"
+        )
+
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    with open(os.path.join(REPORTS_DIR, "policy_sweep.json"), "w") as f:
+        json.dump(
+            {
+                "swept_at": datetime.now().isoformat(),
+                "holdout_vehicles": len(df),
+                "curve_points": CURVE_POINTS,
+                "seed": seed,
+                "n_jobs": n_jobs,
+                "scoring_wall_s": round(scoring_wall, 3),
+                "sweep_wall_s": round(sweep_wall, 3),
+                "objectives": ["total_profit", "win_rate"],
+                "settings": sorted(results, key=lambda r: -r["total_profit"]),
+            },
+            f,
+            indent=2,
+        )
+
+    print("Generated policy_sweep.json")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep risk_lambda and min_margin on the holdout")
+    parser.add_argument("--start", default=None, help="First enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument("--risk-lambdas", type=float, nargs="+", default=RISK_LAMBDAS)
+    parser.add_argument("--min-margins", type=float, nargs="+", default=MIN_MARGINS)
+    parser.add_argument("--n-jobs", type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the simulated outcomes")
+    args = parser.parse_args()
+
+    policy_sweep(
+        start=args.start,
+        end=args.end,
+        risk_lambdas=args.risk_lambdas,
+        min_margins=args.min_margins,
+        n_jobs=args.n_jobs,
+        seed=args.seed,
+    )
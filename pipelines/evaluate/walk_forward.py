@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pyarrow.compute as pc
+from pyarrow import feather
+from sklearn.metrics import brier_score_loss, mean_absolute_error, roc_auc_score
+from sklearn.pipeline import Pipeline
+from threadpoolctl import threadpool_limits
+
+from app.optimiser import (
+    compute_expected_costs_batch,
+    offer_grid,
+    optimise_offers,
+    p_win_matrix,
+)
+from pipelines.evaluate.evaluate import (
+    BASELINE_RATIO,
+    REPORTS_DIR,
+    outcome_inputs,
+    predict_prices,
+    realise,
+    summarise,
+)
+from pipelines.features.store import attach_aggregates, load_features
+from pipelines.train import train_conversion_model as conversion
+from pipelines.train import train_price_model as price
+from pipelines.train.categorical import extend_vocabulary, feature_types, load_vocabulary
+from pipelines.train.out_of_core import source_columns
+from pipelines.train.tuned_params import load_tuned_params
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "cache", "walk_forward")
+FRAME_PATH = os.path.join(CACHE_DIR, "frame.arrow")
+# Months of history before the first scored month
+MIN_TRAIN_MONTHS = 3
+
+# The feature table, memory-mapped once per worker process by _init_worker
+_table = None
+
+
+def _init_worker(path):
+    global _table
+    # Uncompressed Arrow is memory-mapped, so workers share its pages through the page
+    # cache; each window converts only its own rows to pandas
+    _table = feather.read_table(path, memory_map=True)
+
+
+def _fit_models(train, vocab, use_tuned):
+    """Price point and q10 models plus the calibrated conversion model, as trained for serving."""
+    types = feature_types(len(price.NUMERIC_FEATURES), "native")
+    price_params = load_tuned_params("price_model") if use_tuned else {}
+    won = train[train["won"] == 1]
+    models = {}
+    for name, estimator in [
+        # One thread per fit: parallelism comes from running windows side by side
+        ("price_model", price.price_estimator(types, {**price_params, "n_jobs": 1})),
+        ("price_q10", price.quantile_estimator(0.10, "xgb", types).set_params(n_jobs=1)),
+    ]:
+        pipeline = Pipeline(
+            [("preprocessor", price.build_preprocessor("native", vocab)), ("model", estimator)]
+        )
+        models[name] = pipeline.fit(won[price.FEATURES], won[price.TARGET])
+    models["conversion_model"] = conversion.fit_conversion_model(
+        train[conversion.FEATURES],
+        train[conversion.TARGET],
+        "native",
+        vocab,
+        load_tuned_params("conversion_model") if use_tuned else {},
+    )
+    return models
+
+
+def _run_window(month, vocab, use_tuned, seed):
+    """Train on every month before `month` and score `month`."""
+    start = time.perf_counter()
+    train = _table.filter(pc.less(_table["month"], month)).to_pandas()
+    test = _table.filter(pc.equal(_table["month"], month)).to_pandas()
+
+    with threadpool_limits(1):
+        models = _fit_models(train, vocab, use_tuned)
+
+        won = (test["won"] == 1).to_numpy()
+        p_actual = models["conversion_model"].predict_proba(test[conversion.FEATURES])[:, 1]
+        e_sale, price_q10 = predict_prices(models, test[price.FEATURES])
+        e_costs = compute_expected_costs_batch(
+            test["damage_flag"], test["channel"], test["risk_score"]
+        )
+        offers, valid = offer_grid(e_sale, e_costs)
+        p_win = p_win_matrix(models["conversion_model"], test[conversion.FEATURES], offers)
+        policy = optimise_offers(e_sale, price_q10, e_costs, offers, p_win, valid)
+
+    tmv, actual_costs, draws = outcome_inputs(test, seed)
+    policies = {
+        name: summarise(offer, *realise(offer, tmv, actual_costs, draws))
+        for name, offer in [
+            ("flat_baseline", BASELINE_RATIO * e_sale),
+            ("ev_optimiser", policy["recommended_offer"]),
+        ]
+    }
+    return {
+        "month": month,
+        "train_months": int(train["month"].nunique()),
+        "train_rows": len(train),
+        "test_rows": len(test),
+        "price_mae": (
+            round(float(mean_absolute_error(test.loc[won, price.TARGET], e_sale[won])), 2)
+            if won.any()
+            else None
+        ),
+        "conversion_brier": round(float(brier_score_loss(test["won"], p_actual)), 4),
+        "conversion_roc_auc": (
+            round(float(roc_auc_score(test["won"], p_actual)), 3)
+            if test["won"].nunique() > 1
+            else None
+        ),
+        "ev_profit": policies["ev_optimiser"]["total_profit"],
+        "baseline_profit": policies["flat_baseline"]["total_profit"],
+        "ev_win_rate": policies["ev_optimiser"]["win_rate"],
+        "baseline_win_rate": policies["flat_baseline"]["win_rate"],
+        "wall_s": round(time.perf_counter() - start, 3),
+    }
+
+
+def walk_forward(
+    start=None, end=None, min_train_months=MIN_TRAIN_MONTHS, n_jobs=None, use_tuned=True, seed=42
+):
+    """
+    Walk-forward backtest: for every month after the first `min_train_months`, train
+    on all earlier months (an expanding window) and score that month's enquiries on
+    price MAE, conversion Brier and simulated profit of the EV policy against the flat
+    baseline. Windows run in a process pool over one shared Arrow copy of the features.
+    """
+    run_start = time.perf_counter()
+    n_jobs = n_jobs or os.cpu_count()
+    print("Loading features for walk-forward backtest...")
+    extra = ["enquiry_id", "true_market_value", "damage_flag", price.TARGET, conversion.TARGET]
+    columns = source_columns(list(dict.fromkeys(conversion.FEATURES + price.FEATURES + extra)))
+    df = load_features(start, end, columns=columns)
+    if df is None:
+        print("Features not built, run build_features.py first!")
+        return
+    df = attach_aggregates(df)
+    df["won"] = df["won"].fillna(0).astype(int)
+    df["month"] = df["enquiry_date"].dt.strftime("%Y-%m")
+
+    months = sorted(df["month"].unique())[min_train_months:]
+    if not months:
+        print(f"Need more than {min_train_months} months of features")
+        return
+
+    # Extended once here in memory, leaving the serving vocabulary file untouched
+    vocab = extend_vocabulary(load_vocabulary(), df)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    feather.write_feather(df, FRAME_PATH, compression="uncompressed")
+    del df
+
+    print(f"Backtesting {len(months)} monthly windows on {n_jobs} processes...")
+    with ProcessPoolExecutor(
+        max_workers=n_jobs, initializer=_init_worker, initargs=(FRAME_PATH,)
+    ) as pool:
+        futures = [pool.submit(_run_window, month, vocab, use_tuned, seed) for month in months]
+        windows = []
+        for future in futures:
+            window = future.result()
+            windows.append(window)
+            print(
+                f"{window['month']}: MAE £{window['price_mae']}, Brier "
+                f"{window['conversion_brier']}, EV profit £{window['ev_profit']:,.0f} vs "
+                f"£{window['baseline_profit']:,.0f} flat ({window['wall_s']:.1f}s)"
+            )
+    wall_time = time.perf_counter() - run_start
+
+    ev_total = sum(w["ev_profit"] for w in windows)
+    baseline_total = sum(w["baseline_profit"] for w in windows)
+    report = {
+        "backtested_at": datetime.now().isoformat(),
+        "min_train_months": min_train_months,
+        "n_jobs": n_jobs,
+        "tuned_params": use_tuned,
+        "seed": seed,
+        "wall_time_s": round(wall_time, 2),
+        # What the windows would have cost back to back
+        "sequential_window_s": round(sum(w["wall_s"] for w in windows), 2),
+        "totals": {
+            "ev_profit": round(ev_total, 2),
+            "baseline_profit": round(baseline_total, 2),
+            "profit_uplift": round(ev_total - baseline_total, 2),
+            "months_ev_ahead": sum(w["ev_profit"] > w["baseline_profit"] for w in windows),
+        },
+        "months": windows,
+    }
+
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    with open(os.path.join(REPORTS_DIR, "walk_forward.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(
+        f"Walk-forward backtest of {len(windows)} months finished in {wall_time:.1f}s "
+        f"({report['sequential_window_s']:.1f}s of window work)"
+    )
+    print("Generated walk_forward.json")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-forward monthly backtest")
+    parser.add_argument("--start", default=None, help="First enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument(
+        "--min-train-months",
+        type=int,
+        default=MIN_TRAIN_MONTHS,
+        help="Months of history before the first scored month",
+    )
+    parser.add_argument("--n-jobs", type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument(
+        "--ignore-tuned",
+        action="store_true",
+        help="Use the default hyperparameters even if models/tuned_params.json exists",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the simulated outcomes")
+    args = parser.parse_args()
+
+    walk_forward(
+        start=args.start,
+        end=args.end,
+        min_train_months=args.min_train_months,
+        n_jobs=args.n_jobs,
+        use_tuned=not args.ignore_tuned,
+        seed=args.seed,
+    )
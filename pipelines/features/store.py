@@ -0,0 +1,198 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from app.aggregates import AGGREGATE_FEATURES, AggregateStore
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+FEATURES_DIR = os.path.join(DATA_DIR, "features")
+# Single-file output of older builds, still readable when no dataset exists
+LEGACY_FEATURES_PATH = os.path.join(DATA_DIR, "features.parquet")
+
+# Point-in-time aggregate snapshots, one per month (as of its first day)
+AGGREGATES_DIR = os.path.join(DATA_DIR, "aggregates")
+# Latest snapshot, shipped with the model artifacts for serving
+SERVING_AGGREGATES_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "models", "aggregates")
+
+PARTITION_KEY = "month"
+MANIFEST_NAME = "_manifest.json"
+
+
+def month_of(dates):
+    """YYYY-MM partition value for each enquiry date."""
+    return dates.dt.strftime("%Y-%m")
+
+
+def partition_dir(features_dir, month):
+    return os.path.join(features_dir, f"{PARTITION_KEY}={month}")
+
+
+def read_manifest(features_dir=FEATURES_DIR):
+    path = os.path.join(features_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"partitions": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, features_dir=FEATURES_DIR):
+    path = os.path.join(features_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def write_partition(df, month, features_dir=FEATURES_DIR):
+    """Atomically replace one month's partition."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Fix dictionary index width so partitions written in different runs share a schema
+    schema = pa.schema(
+        [
+            (
+                pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type))
+                if pa.types.is_dictionary(field.type)
+                else field
+            )
+            for field in table.schema
+        ],
+        metadata=table.schema.metadata,
+    )
+    out_dir = partition_dir(features_dir, month)
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, "part-0.parquet")
+    pq.write_table(table.cast(schema), path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _row_filter(start=None, end=None, where=None, partitioned=True):
+    """Dataset filter for enquiries in [start, end], pruning month partitions when present."""
+    conditions = [] if where is None else [where]
+    if start is not None:
+        conditions.append(ds.field("enquiry_date") >= start.to_pydatetime())
+        if partitioned:
+            conditions.append(ds.field(PARTITION_KEY) >= start.strftime("%Y-%m"))
+    if end is not None:
+        conditions.append(ds.field("enquiry_date") <= end.to_pydatetime())
+        if partitioned:
+            conditions.append(ds.field(PARTITION_KEY) <= end.strftime("%Y-%m"))
+    row_filter = None
+    for condition in conditions:
+        row_filter = condition if row_filter is None else row_filter & condition
+    return row_filter
+
+
+def _has_dataset(features_dir):
+    return os.path.isdir(features_dir) and bool(read_manifest(features_dir)["partitions"])
+
+
+def load_features(start=None, end=None, columns=None, features_dir=FEATURES_DIR):
+    """
+    Read features for enquiries dated within [start, end] (inclusive, either optional).
+
+    Month partitions outside the range are pruned from their directory names, so a
+    narrow range only opens the files it needs. Returns None if no features are built.
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    if not _has_dataset(features_dir):
+        if not os.path.exists(LEGACY_FEATURES_PATH):
+            return None
+        df = pd.read_parquet(LEGACY_FEATURES_PATH, columns=columns)
+        if (start is not None or end is not None) and "enquiry_date" in df.columns:
+            dates = df["enquiry_date"]
+            mask = (dates >= (start or dates.min())) & (dates <= (end or dates.max()))
+            df = df[mask].reset_index(drop=True)
+        return df
+
+    dataset = ds.dataset(features_dir, format="parquet", partitioning="hive")
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name != PARTITION_KEY]
+    return dataset.to_table(columns=columns, filter=_row_filter(start, end)).to_pandas()
+
+
+def iter_features(
+    start=None, end=None, columns=None, batch_rows=65536, where=None, features_dir=FEATURES_DIR
+):
+    """
+    Stream features for [start, end] as DataFrames of about `batch_rows` rows.
+
+    Parquet row groups are read one at a time and only `batch_rows` rows are held
+    at once, so memory is bounded by the batch size rather than the dataset. `where`
+    is an optional extra pyarrow filter expression, e.g. ds.field("won") == 1.
+    Yields nothing if no features are built; the scan order is deterministic.
+    """
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    if _has_dataset(features_dir):
+        dataset = ds.dataset(features_dir, format="parquet", partitioning="hive")
+        if columns is None:
+            columns = [name for name in dataset.schema.names if name != PARTITION_KEY]
+        batches = dataset.to_batches(
+            columns=columns, filter=_row_filter(start, end, where), batch_size=batch_rows
+        )
+    elif os.path.exists(LEGACY_FEATURES_PATH):
+        batches = _legacy_batches(columns, _row_filter(start, end, where, False), batch_rows)
+    else:
+        return
+
+    pending, pending_rows = [], 0
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows >= batch_rows:
+            yield pa.Table.from_batches(pending).to_pandas()
+            pending, pending_rows = [], 0
+    if pending:
+        yield pa.Table.from_batches(pending).to_pandas()
+
+
+def _legacy_batches(columns, row_filter, batch_rows):
+    parquet_file = pq.ParquetFile(LEGACY_FEATURES_PATH)
+    columns = columns or parquet_file.schema_arrow.names
+    # Filter columns are read alongside the projection and dropped after filtering
+    read_columns = list(dict.fromkeys(columns + ["enquiry_date", "won"]))
+    for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=read_columns):
+        table = pa.Table.from_batches([batch])
+        if row_filter is not None:
+            table = table.filter(row_filter)
+        yield from table.select(columns).to_batches()
+
+
+def count_features(start=None, end=None, where=None, features_dir=FEATURES_DIR):
+    """Number of feature rows in [start, end] matching `where`, without loading them."""
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    if _has_dataset(features_dir):
+        dataset = ds.dataset(features_dir, format="parquet", partitioning="hive")
+        return dataset.count_rows(filter=_row_filter(start, end, where))
+    chunks = iter_features(start, end, ["enquiry_id"], where=where, features_dir=features_dir)
+    return sum(len(chunk) for chunk in chunks)
+
+
+def attach_aggregates(df, aggregates_dir=AGGREGATES_DIR):
+    """
+    Join each enquiry to the aggregate snapshot taken at the start of its month.
+
+    Snapshots only see enquiries dated before their as-of date, so this never leaks
+    an enquiry's own (or later) outcomes into its features.
+    """
+    months = month_of(df["enquiry_date"])
+    aggregates = np.full((len(df), len(AGGREGATE_FEATURES)), np.nan, dtype=np.float32)
+    for month in months.unique():
+        path = os.path.join(aggregates_dir, f"{PARTITION_KEY}={month}")
+        if os.path.isdir(path):
+            mask = (months == month).to_numpy()
+            aggregates[mask] = AggregateStore.load(path).lookup_frame(df[mask]).to_numpy()
+    for i, column in enumerate(AGGREGATE_FEATURES):
+        df[column] = aggregates[:, i]
+    return df
@@ -1,45 +1,100 @@
-import os
+import argparse
 import json
+from pipelines.monitor.reports import read_report, write_report
+from pipelines.monitor.slo import SLO_RULES, evaluate_slos
 
+TRIGGER_REPORT = "retrain_required.json"
 
-def check_alerts():
-    print("Evaluating Alerts and Retrain Triggers...")
 
-    reports_dir = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
-    drift_path = os.path.join(reports_dir, "drift_report.json")
-    perf_path = os.path.join(reports_dir, "performance_report.json")
+def check_alerts(slo_rules=SLO_RULES, now=None):
+    """
+    Raise the retrain trigger on drift or degraded performance and flag SLO breaches.
+
+    The trigger records the `checked_at` of the drift and performance reports it came
+    from. Once retrain.py has marked it handled, the same reports do not raise it
+    again; only a newer drift or performance check can.
+    """
+    print("Evaluating Alerts and Retrain Triggers...")
 
     retrain_required = False
+    rollback = False
     reasons = []
 
-    if os.path.exists(drift_path):
-        with open(drift_path, "r") as f:
-            drift = json.load(f)
-
+    drift = read_report("drift_report.json")
+    if drift is not None:
         for feature, metrics in drift.get("features", {}).items():
             if metrics.get("drift_detected", False):
                 retrain_required = True
                 reasons.append(f"Drift detected in {feature} (PSI = {metrics.get('psi')})")
 
-    if os.path.exists(perf_path):
-        with open(perf_path, "r") as f:
-            perf = json.load(f)
+    perf = read_report("performance_report.json")
+    if perf is not None and perf.get("performance_degraded", False):
+        retrain_required = True
+        reasons.append(f"Model performance degraded (MAE = {perf.get('price_mae')})")
+
+    sources = {
+        name: report.get("checked_at")
+        for name, report in [("drift_report.json", drift), ("performance_report.json", perf)]
+        if report is not None
+    }
+    previous = read_report(TRIGGER_REPORT) or {}
+    handled_at = previous.get("handled_at") if previous.get("sources") == sources else None
+    if retrain_required and handled_at:
+        print(f"Retrain for these drift and performance reports was handled at {handled_at}.")
+        retrain_required = False
 
-        if perf.get("performance_degraded", False):
-            retrain_required = True
-            reasons.append(f"Model performance degraded (MAE = {perf.get('price_mae')})")
+    # Latency, shed and cache SLOs of the serving API, from its metrics snapshots
+    slo = evaluate_slos(now=now, rules=slo_rules)
+    write_report("slo_report.json", slo)
+    breaches = [name for name, result in slo["rules"].items() if result["breached"]]
+    for name in breaches:
+        result = slo["rules"][name]
+        burn = max(w["burn_rate"] for w in result["windows"].values() if w["burn_rate"] is not None)
+        reasons.append(
+            f"SLO {name} burning its error budget at {burn}x "
+            f"({', '.join(result['breached_windows'])} windows)"
+        )
+        rollback = rollback or result["action"] == "rollback"
 
-    if retrain_required:
-        print("ALERT: Retrain Triggered!")
+    if retrain_required or breaches:
+        if retrain_required:
+            print("ALERT: Retrain Triggered!")
+        if breaches:
+            print(f"ALERT: SLO breached{' - rollback recommended' if rollback else ''}!")
         for r in reasons:
             print(f" - {r}")
 
-        out_path = os.path.join(reports_dir, "retrain_required.json")
-        with open(out_path, "w") as f:
-            json.dump({"retrain": True, "reasons": reasons}, f, indent=2)
+        trigger = {
+            "retrain": retrain_required,
+            "rollback": rollback,
+            "reasons": reasons,
+            "slo_breaches": breaches,
+            "sources": sources,
+        }
+        if handled_at:
+            trigger["handled_at"] = handled_at
+        # Unchanged triggers are left alone, keeping their file time meaningful
+        if any(previous.get(key) != value for key, value in trigger.items()):
+            write_report(TRIGGER_REPORT, trigger)
     else:
         print("System Healthy. No retrain required.")
+    return {
+        "retrain": retrain_required,
+        "rollback": rollback,
+        "reasons": reasons,
+        "slo_breaches": breaches,
+    }
 
 
 if __name__ == "__main__":
-    check_alerts()
+    parser = argparse.ArgumentParser(description="Evaluate alerts and retrain triggers")
+    parser.add_argument(
+        "--slo-rules", default=None, help="JSON file of SLO rules replacing the defaults"
+    )
+    args = parser.parse_args()
+
+    slo_rules = SLO_RULES
+    if args.slo_rules:
+        with open(args.slo_rules, "r") as f:
+            slo_rules = json.load(f)
+    check_alerts(slo_rules)
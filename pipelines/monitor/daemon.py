@@ -0,0 +1,137 @@
+import argparse
+import signal
+import threading
+import time
+from datetime import datetime
+
+from app.quote_log import QUOTE_LOG_DIR
+from pipelines.monitor.alerts import check_alerts
+from pipelines.monitor.drift import check_drift, load_sketches
+from pipelines.monitor.performance import STATE_PATH, PerformanceState, check_performance
+from pipelines.monitor.sketches import SKETCH_DIR
+
+# Seconds between runs of each check
+DRIFT_EVERY = 3600
+PERFORMANCE_EVERY = 900
+ALERTS_EVERY = 300
+
+
+class MonitorDaemon:
+    """
+    One long-running process for the drift, performance and alert checks.
+
+    The drift sketches and the performance state are loaded once and kept, so a tick
+    only reads feature partitions and quote-log files that are new since the last one,
+    and a check with nothing new skips rewriting its report. Alerts run on every due
+    tick, as the API's SLO metrics move on even when no report does. Reports are
+    replaced atomically, so the dashboard always reads a complete snapshot.
+    """
+
+    def __init__(
+        self,
+        drift_every=DRIFT_EVERY,
+        performance_every=PERFORMANCE_EVERY,
+        alerts_every=ALERTS_EVERY,
+        sketch_dir=SKETCH_DIR,
+        state_path=STATE_PATH,
+        log_dir=QUOTE_LOG_DIR,
+    ):
+        self.sketch_dir = sketch_dir
+        self.state_path = state_path
+        self.log_dir = log_dir
+        self.cadences = {
+            "drift": drift_every,
+            "performance": performance_every,
+            "alerts": alerts_every,
+        }
+        # Run in this order within a tick, so alerts see this tick's reports
+        self.checks = {
+            "drift": self.check_drift,
+            "performance": self.check_performance,
+            "alerts": self.check_alerts,
+        }
+        self.next_run = dict.fromkeys(self.cadences, 0.0)
+        self.sketches = None
+        self.state = None
+        self._stop = threading.Event()
+
+    def check_drift(self):
+        if self.sketches is None:
+            self.sketches = load_sketches(path=self.sketch_dir)
+            if self.sketches is None:
+                print("Features not found.")
+                return
+            return check_drift(sketches=self.sketches, path=self.sketch_dir)
+        return check_drift(sketches=self.sketches, path=self.sketch_dir, skip_unchanged=True)
+
+    def check_performance(self):
+        first = self.state is None
+        if first:
+            self.state = PerformanceState(self.state_path)
+        return check_performance(log_dir=self.log_dir, state=self.state, skip_unchanged=not first)
+
+    def check_alerts(self):
+        return check_alerts()
+
+    def tick(self, now=None):
+        """Run every check that is due. Returns the names of those that ran."""
+        now = time.monotonic() if now is None else now
+        ran = []
+        for name, check in self.checks.items():
+            if now < self.next_run[name]:
+                continue
+            self.next_run[name] = now + self.cadences[name]
+            try:
+                check()
+            # A failing check must not stop the others or the daemon
+            except Exception as e:  # noqa: BLE001
+                print(f"Warning: {name} check failed: {e}")
+                continue
+            ran.append(name)
+        return ran
+
+    def run(self):
+        """Tick until stopped by SIGINT/SIGTERM or `stop`."""
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: self.stop())
+        print(f"Monitor started at {datetime.now().isoformat()} with cadences {self.cadences}")
+        try:
+            while not self._stop.is_set():
+                self.tick()
+                self._stop.wait(max(0.0, min(self.next_run.values()) - time.monotonic()))
+        finally:
+            self.close()
+        print("Monitor stopped.")
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        if self.state is not None:
+            self.state.close()
+            self.state = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the drift, performance and alert checks")
+    parser.add_argument(
+        "--drift-every", type=float, default=DRIFT_EVERY, help="Seconds between drift checks"
+    )
+    parser.add_argument(
+        "--performance-every",
+        type=float,
+        default=PERFORMANCE_EVERY,
+        help="Seconds between performance checks",
+    )
+    parser.add_argument(
+        "--alerts-every", type=float, default=ALERTS_EVERY, help="Seconds between alert checks"
+    )
+    parser.add_argument("--once", action="store_true", help="Run every check once and exit")
+    args = parser.parse_args()
+
+    daemon = MonitorDaemon(args.drift_every, args.performance_every, args.alerts_every)
+    if args.once:
+        daemon.tick()
+        daemon.close()
+    else:
+        daemon.run()
@@ -1,76 +1,213 @@
-import os
-import json
+import argparse
+import time
+from datetime import datetime
 import numpy as np
 import pandas as pd
-from scipy.stats import ks_2samp
-
-
-def calculate_psi(expected, actual, buckets=10):
-    """Calculate Population Stability Index for a single feature."""
-    # Break into quantiles based on expected distribution
-    breakpoints = np.percentile(expected, np.linspace(0, 100, buckets + 1))
-    breakpoints[0] = -np.inf
-    breakpoints[-1] = np.inf
-
-    expected_percents = np.histogram(expected, bins=breakpoints)[0] / len(expected)
-    actual_percents = np.histogram(actual, bins=breakpoints)[0] / len(actual)
-
-    # Replace 0s with a small value to avoid division by zero
-    expected_percents = np.maximum(expected_percents, 0.0001)
-    actual_percents = np.maximum(actual_percents, 0.0001)
-
-    psi_value = np.sum(
-        (actual_percents - expected_percents) * np.log(actual_percents / expected_percents)
-    )
-    return psi_value
-
-
-def check_drift():
-    print("Running Drift Detection (PSI + KS test)...")
-
-    # In reality, compare reference dataset with last 30 days
-    # We will simulate drift by loading the same feature set and adding noise
-    data_dir = os.path.join(os.path.dirname(__file__), "..", "..", "data")
-    features_path = os.path.join(data_dir, "features.parquet")
-
-    if not os.path.exists(features_path):
+from scipy.stats import kstwobign
+from pipelines.features.store import load_features
+from pipelines.monitor.reports import write_report
+from pipelines.monitor.sketches import (
+    CATEGORICAL_FEATURES,
+    NUMERIC_FEATURES,
+    SEGMENT_BY,
+    SKETCH_DIR,
+    DriftSketches,
+    chi2_test,
+    coarsen,
+    ks_statistic,
+    psi,
+)
+
+# Enquiry days in the rolling current window, and in the reference window before it
+CURRENT_DAYS = 30
+REFERENCE_DAYS = 180
+PSI_THRESHOLD = 0.25
+P_VALUE_ALPHA = 0.05
+# Segments reported only when both windows hold this many of their rows
+MIN_SEGMENT_ROWS = 200
+
+
+def ks_p_value(statistic, n, m):
+    """Asymptotic two-sample KS p-value, as ks_2samp(method="asymp") computes it."""
+    n, m = np.asarray(n, dtype=float), np.asarray(m, dtype=float)
+    scale = np.sqrt(n * m / np.maximum(n + m, 1))
+    return np.where((n > 0) & (m > 0), kstwobign.sf(statistic * scale), 1.0)
+
+
+def load_sketches(rebuild=False, reference_days=REFERENCE_DAYS, path=SKETCH_DIR):
+    """
+    Saved drift sketches brought up to date with the feature partitions. On first use
+    (or with `rebuild`) the bins are fixed from the first `reference_days` days of
+    features. None if no features are built.
+    """
+    sketches = None if rebuild else DriftSketches.load(path)
+    if sketches is None:
+        dates = load_features(columns=["enquiry_date"])
+        if dates is None or dates.empty:
+            return None
+        first = dates["enquiry_date"].min()
+        reference = load_features(
+            first,
+            first + pd.Timedelta(days=reference_days - 1),
+            columns=list(dict.fromkeys(NUMERIC_FEATURES + CATEGORICAL_FEATURES + SEGMENT_BY)),
+        )
+        sketches = DriftSketches.from_reference(reference)
+
+    refresh_sketches(sketches, path)
+    return sketches
+
+
+def refresh_sketches(sketches, path=SKETCH_DIR):
+    """Count new or rebuilt feature partitions and save the sketches if any were."""
+    refreshed = sketches.refresh()
+    if refreshed:
+        print(f"Counted {len(refreshed)} new or rebuilt feature partitions into the sketches")
+        sketches.save(path)
+    return refreshed
+
+
+def feature_drift(sketches, reference_counts, current_counts):
+    """
+    PSI and a distribution test of every feature in every segment at once: KS for
+    numeric features, chi-square for categorical ones. Each statistic is computed on
+    the (segments × bins) matrices of one feature, so the only loop is over features.
+    """
+    reference = sketches.histograms(reference_counts)
+    current = sketches.histograms(current_counts)
+    drift = {}
+    for f in sketches.features:
+        if f in sketches.edges:
+            statistic = ks_statistic(reference[f], current[f])
+            p_value = ks_p_value(
+                statistic, reference[f][:, :-1].sum(axis=1), current[f][:, :-1].sum(axis=1)
+            )
+            test = "ks"
+            feature_psi = psi(coarsen(reference[f]), coarsen(current[f]))
+        else:
+            statistic, p_value = chi2_test(reference[f], current[f])
+            test = "chi2"
+            feature_psi = psi(reference[f], current[f])
+        drift[f] = {
+            "test": test,
+            "psi": feature_psi,
+            "statistic": statistic,
+            "p_value": p_value,
+            "drift_detected": (feature_psi > PSI_THRESHOLD) | (p_value < P_VALUE_ALPHA),
+        }
+    return drift
+
+
+def check_drift(
+    as_of=None,
+    current_days=CURRENT_DAYS,
+    reference_days=REFERENCE_DAYS,
+    rebuild=False,
+    path=SKETCH_DIR,
+    sketches=None,
+    skip_unchanged=False,
+):
+    """
+    Compare the last `current_days` days of features up to `as_of` (default: the
+    latest enquiry day) with the `reference_days` days before them, overall and per
+    channel and region, using the saved histogram sketches rather than the feature rows.
+
+    A long-running caller passes the `sketches` it keeps in memory, and with
+    `skip_unchanged` nothing is reported when no feature partition changed.
+    """
+    print("Running Drift Detection (PSI + KS/chi-square tests)...")
+    start_time = time.perf_counter()
+
+    if sketches is None:
+        sketches = load_sketches(rebuild, reference_days, path)
+    elif not refresh_sketches(sketches, path) and skip_unchanged:
+        return
+    if sketches is None or not len(sketches.keys):
         print("Features not found.")
         return
 
-    df_ref = pd.read_parquet(features_path).sample(frac=0.5, random_state=42)
-    df_cur = pd.read_parquet(features_path).sample(frac=0.5, random_state=123)
-
-    # Simulate a drift in mileage
-    df_cur["mileage"] = df_cur["mileage"] * 1.5
+    as_of = pd.Timestamp(as_of) if as_of is not None else sketches.days().max()
+    current_start = as_of - pd.Timedelta(days=current_days - 1)
+    reference_end = current_start - pd.Timedelta(days=1)
+    reference_start = reference_end - pd.Timedelta(days=reference_days - 1)
 
-    drift_report = {"features": {}}
-    numeric_features = ["vehicle_age", "mileage", "offer_price", "damage_severity_score"]
-
-    for f in numeric_features:
-        if f not in df_ref.columns:
-            continue
+    ref_counts, ref_rows = sketches.window(reference_start, reference_end)
+    cur_counts, cur_rows = sketches.window(current_start, as_of)
+    if ref_rows[0] == 0 or cur_rows[0] == 0:
+        print("Not enough history for a reference and a current window.")
+        return
 
-        ref_data = df_ref[f].dropna().values
-        cur_data = df_cur[f].dropna().values
+    drift = feature_drift(sketches, ref_counts, cur_counts)
 
-        psi = calculate_psi(ref_data, cur_data)
-        ks_stat, p_value = ks_2samp(ref_data, cur_data)
+    def entry(f, i, detail=True):
+        d = drift[f]
+        result = {"psi": round(float(d["psi"][i]), 3)}
+        if detail:
+            result[f"{d['test']}_statistic"] = round(float(d["statistic"][i]), 4)
+        result[f"{d['test']}_p_value" if detail else "p_value"] = round(float(d["p_value"][i]), 4)
+        result["drift_detected"] = bool(d["drift_detected"][i])
+        return result
 
-        drift_report["features"][f] = {
-            "psi": round(psi, 3),
-            "ks_p_value": round(p_value, 4),
-            "drift_detected": bool(psi > 0.25 or p_value < 0.05),
+    segments = {}
+    for i, segment in enumerate(sketches.segments[1:], start=1):
+        if min(ref_rows[i], cur_rows[i]) < MIN_SEGMENT_ROWS:
+            continue
+        # A segment's own column is constant within it
+        column = segment.split("=")[0]
+        features = {f: entry(f, i, detail=False) for f in sketches.features if f != column}
+        segments[segment] = {
+            "reference_rows": int(ref_rows[i]),
+            "current_rows": int(cur_rows[i]),
+            "drifted_features": [f for f, e in features.items() if e["drift_detected"]],
+            "features": features,
         }
 
-    reports_dir = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
-    os.makedirs(reports_dir, exist_ok=True)
-
-    out_path = os.path.join(reports_dir, "drift_report.json")
-    with open(out_path, "w") as f:
-        json.dump(drift_report, f, indent=2)
-
-    print(f"Drift report generated at {out_path}")
+    drift_report = {
+        "checked_at": datetime.now().isoformat(),
+        "reference": {
+            "start": str(reference_start.date()),
+            "end": str(reference_end.date()),
+            "rows": int(ref_rows[0]),
+        },
+        "current": {
+            "start": str(current_start.date()),
+            "end": str(as_of.date()),
+            "rows": int(cur_rows[0]),
+        },
+        "features": {f: entry(f, 0) for f in sketches.features},
+        "min_segment_rows": MIN_SEGMENT_ROWS,
+        "segments_skipped": len(sketches.segments) - 1 - len(segments),
+        "segments": segments,
+    }
+    drift_report["wall_s"] = round(time.perf_counter() - start_time, 3)
+
+    for segment, result in segments.items():
+        if result["drifted_features"]:
+            print(f"Drift in segment {segment}: {', '.join(result['drifted_features'])}")
+
+    out_path = write_report("drift_report.json", drift_report)
+    print(f"Drift report generated at {out_path} ({drift_report['wall_s']:.2f}s)")
+    return drift_report
 
 
 if __name__ == "__main__":
-    check_drift()
+    parser = argparse.ArgumentParser(description="Check feature drift")
+    parser.add_argument(
+        "--as-of", default=None, help="Last day of the current window (default: latest enquiry)"
+    )
+    parser.add_argument(
+        "--current-days", type=int, default=CURRENT_DAYS, help="Days in the current window"
+    )
+    parser.add_argument(
+        "--reference-days", type=int, default=REFERENCE_DAYS, help="Days in the reference window"
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Rebuild the sketches and their bins"
+    )
+    args = parser.parse_args()
+
+    check_drift(
+        as_of=args.as_of,
+        current_days=args.current_days,
+        reference_days=args.reference_days,
+        rebuild=args.rebuild,
+    )
@@ -1,55 +1,360 @@
+import argparse
 import os
-import json
+import sqlite3
+import time
+from datetime import datetime
+import numpy as np
 import pandas as pd
-from sklearn.metrics import mean_absolute_error, brier_score_loss
+from app.quote_log import QUOTE_LOG_DIR, log_files, read_quote_log
+from pipelines.features.store import FEATURES_DIR, load_features, read_manifest
+from pipelines.monitor.reports import write_report
 
+STATE_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "data", "monitor", "performance.sqlite"
+)
 
-def check_performance():
-    print("Running Performance Monitoring...")
+# Rolling windows reported, in days; the last is the headline window
+WINDOWS = [7, 30]
+CALIBRATION_BINS = 10
+# The headline window degrades when its MAE or Brier is this much worse than all
+# matched history before it, given enough rows on both sides
+DEGRADATION = 0.15
+MIN_ROWS = 50
 
-    data_dir = os.path.join(os.path.dirname(__file__), "..", "..", "data")
-    features_path = os.path.join(data_dir, "features.parquet")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_files (path TEXT PRIMARY KEY, events INTEGER, read_at TEXT);
+CREATE TABLE IF NOT EXISTS partitions (month TEXT PRIMARY KEY, fingerprint TEXT);
+CREATE TABLE IF NOT EXISTS quotes (
+    enquiry_id TEXT PRIMARY KEY, served_at TEXT, e_sale REAL, offer REAL, p_win REAL,
+    e_costs REAL
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    enquiry_id TEXT PRIMARY KEY, day TEXT, won INTEGER, sale_price REAL, gross_margin REAL
+);
+CREATE TABLE IF NOT EXISTS matched (
+    enquiry_id TEXT PRIMARY KEY, day TEXT, p_win REAL, won INTEGER, abs_error REAL,
+    realised_profit REAL, expected_profit REAL
+);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT, metric TEXT, value REAL, PRIMARY KEY (day, metric)
+);
+"""
 
-    if not os.path.exists(features_path):
-        print("Features not found.")
-        return
 
-    df = pd.read_parquet(features_path)
+def _rows(df):
+    """Plain Python tuples for sqlite3, with missing values as NULL."""
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
 
-    # In reality, this would predict on test set and compare to truth
-    # 1. Price Model Simulation
-    won_df = df[df["won"] == 1].copy()
 
-    # Simulate slightly degraded recent performance
-    mae = mean_absolute_error(won_df["sale_price"], won_df["sale_price"] * 0.9 + 500)
+def _contributions(matched):
+    """Each matched enquiry's additions to its day's running sums, summed per day."""
+    won = matched["won"].to_numpy(dtype=float)
+    p_win = matched["p_win"].to_numpy(dtype=float)
+    sold = matched["abs_error"].notna().to_numpy()
+    columns = {
+        "quotes": np.ones(len(matched)),
+        "sold": sold.astype(float),
+        "abs_error": matched["abs_error"].fillna(0.0).to_numpy(dtype=float),
+        "brier": (p_win - won) ** 2,
+        "realised_profit": matched["realised_profit"].to_numpy(dtype=float),
+        "expected_profit": matched["expected_profit"].to_numpy(dtype=float),
+    }
+    bins = np.minimum((p_win * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1)
+    for b in range(CALIBRATION_BINS):
+        in_bin = (bins == b).astype(float)
+        columns[f"calibration_{b}_quotes"] = in_bin
+        columns[f"calibration_{b}_p_win"] = in_bin * p_win
+        columns[f"calibration_{b}_won"] = in_bin * won
+    return pd.DataFrame(columns).groupby(matched["day"].to_numpy()).sum()
 
-    # 2. Conversion Model Simulation
-    brier = brier_score_loss(df["won"].fillna(0), pd.Series(0.4, index=df.index))
 
-    # 3. Overall Profit
-    total_profit_actual = won_df["gross_margin"].sum()
-    total_profit_baseline = won_df["gross_margin"].sum() * 0.8  # Assume baseline made 20% less
+class PerformanceState:
+    """
+    Served quotes joined to realised outcomes by enquiry_id, kept in SQLite.
 
-    report = {
-        "price_mae": round(mae, 2),
-        "conversion_brier": round(brier, 4),
-        "total_profit_actual": float(total_profit_actual),
-        "total_profit_baseline": float(total_profit_baseline),
-        "profit_lift_pct": round(
-            ((total_profit_actual - total_profit_baseline) / total_profit_baseline) * 100, 1
+    Both sides are persisted, so each new quote-log file or rebuilt feature partition
+    only probes the other side for its own enquiries. Every match adds its errors and
+    profits to per-day running sums (replacing its earlier contribution if the quote or
+    outcome changed), and rolling metrics are sums over days, not rows.
+    """
+
+    def __init__(self, path=STATE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _touch(self, enquiry_ids):
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO touched VALUES (?)", [(e,) for e in enquiry_ids]
+        )
+
+    def read_quotes(self, log_dir=QUOTE_LOG_DIR):
+        """Load quote-log files not read before. Returns how many files were read."""
+        seen = {row[0] for row in self.conn.execute("SELECT path FROM log_files")}
+        files = [f for f in log_files(log_dir=log_dir) if os.path.relpath(f, log_dir) not in seen]
+        for path in files:
+            events = read_quote_log([path])
+            quotes = events[events["enquiry_id"].notna()].sort_values("logged_at")
+            quotes = quotes.drop_duplicates("enquiry_id", keep="last")
+            quotes = quotes.assign(
+                served_at=quotes["logged_at"].dt.strftime("%Y-%m-%dT%H:%M:%S.%f")
+            )
+            columns = ["enquiry_id", "served_at", "e_sale", "recommended_offer", "p_win", "e_costs"]
+            # The latest quote for an enquiry is the one it was decided on
+            self.conn.executemany(
+                """
+                INSERT INTO quotes VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (enquiry_id) DO UPDATE SET
+                    served_at = excluded.served_at, e_sale = excluded.e_sale,
+                    offer = excluded.offer, p_win = excluded.p_win, e_costs = excluded.e_costs
+                WHERE excluded.served_at >= quotes.served_at
+                """,
+                _rows(quotes[columns]),
+            )
+            self._touch(quotes["enquiry_id"])
+            self.conn.execute(
+                "INSERT INTO log_files VALUES (?, ?, ?)",
+                (os.path.relpath(path, log_dir), len(events), datetime.now().isoformat()),
+            )
+        return len(files)
+
+    def read_outcomes(self, features_dir=FEATURES_DIR):
+        """Load feature partitions that are new or rebuilt. Returns the months read."""
+        counted = dict(self.conn.execute("SELECT month, fingerprint FROM partitions"))
+        built = read_manifest(features_dir)["partitions"]
+        stale = sorted(m for m, p in built.items() if counted.get(m) != p["fingerprint"])
+        for month in stale:
+            start = pd.Timestamp(f"{month}-01")
+            df = load_features(
+                start,
+                start + pd.offsets.MonthEnd(0),
+                columns=["enquiry_id", "enquiry_date", "won", "sale_price", "gross_margin"],
+                features_dir=features_dir,
+            )
+            df["enquiry_date"] = df["enquiry_date"].dt.strftime("%Y-%m-%d")
+            df["won"] = df["won"].fillna(0).astype(int)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?, ?)", _rows(df)
+            )
+            self._touch(df["enquiry_id"])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO partitions VALUES (?, ?)",
+                (month, built[month]["fingerprint"]),
+            )
+        return stale
+
+    def _add_daily(self, sums, sign):
+        long = sums.mul(sign).stack().reset_index()
+        self.conn.executemany(
+            """
+            INSERT INTO daily VALUES (?, ?, ?)
+            ON CONFLICT (day, metric) DO UPDATE SET value = value + excluded.value
+            """,
+            _rows(long),
+        )
+
+    def update(self, log_dir=QUOTE_LOG_DIR, features_dir=FEATURES_DIR):
+        """
+        Read new quotes and outcomes, then rejoin only the enquiries they touched.
+        Returns the number of new log files, new partitions and (re)matched enquiries.
+        """
+        with self.conn:
+            self.conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS touched (enquiry_id TEXT PRIMARY KEY)"
+            )
+            self.conn.execute("DELETE FROM touched")
+            files = self.read_quotes(log_dir)
+            months = self.read_outcomes(features_dir)
+
+            previous = pd.read_sql(
+                "SELECT m.* FROM matched m JOIN touched USING (enquiry_id)", self.conn
+            )
+            joined = pd.read_sql(
+                """
+                SELECT q.enquiry_id, o.day, q.e_sale, q.offer, q.p_win, q.e_costs,
+                       o.won, o.sale_price, o.gross_margin
+                FROM touched
+                JOIN quotes q USING (enquiry_id)
+                JOIN outcomes o USING (enquiry_id)
+                """,
+                self.conn,
+            )
+            won = joined["won"] == 1
+            matched = pd.DataFrame(
+                {
+                    "enquiry_id": joined["enquiry_id"],
+                    "day": joined["day"],
+                    "p_win": joined["p_win"],
+                    "won": joined["won"],
+                    "abs_error": (joined["sale_price"] - joined["e_sale"]).abs().where(won),
+                    "realised_profit": joined["gross_margin"].where(won, 0.0).fillna(0.0),
+                    "expected_profit": joined["p_win"]
+                    * (joined["e_sale"] - joined["offer"] - joined["e_costs"]),
+                }
+            )
+
+            if len(previous):
+                self._add_daily(_contributions(previous), -1.0)
+            if len(matched):
+                self._add_daily(_contributions(matched), 1.0)
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO matched VALUES (?, ?, ?, ?, ?, ?, ?)", _rows(matched)
+                )
+        return files, months, len(matched)
+
+    def window(self, start=None, end=None):
+        """Summed running sums of the days in [start, end]."""
+        sums = dict(
+            self.conn.execute(
+                "SELECT metric, SUM(value) FROM daily WHERE day BETWEEN ? AND ? GROUP BY metric",
+                (start or "", end or "9999"),
+            )
+        )
+        return {metric: sums.get(metric, 0.0) for metric in _contributions(_EMPTY).columns}
+
+    def last_day(self):
+        return self.conn.execute(
+            "SELECT MAX(day) FROM daily WHERE metric = 'quotes' AND value > 0.5"
+        ).fetchone()[0]
+
+    def counts(self):
+        return {
+            table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ["quotes", "outcomes", "matched", "log_files"]
+        }
+
+
+_EMPTY = pd.DataFrame(
+    {
+        "day": pd.Series(dtype=str),
+        "p_win": pd.Series(dtype=float),
+        "won": pd.Series(dtype=float),
+        "abs_error": pd.Series(dtype=float),
+        "realised_profit": pd.Series(dtype=float),
+        "expected_profit": pd.Series(dtype=float),
+    }
+)
+
+
+def summarise(sums):
+    quotes, sold = sums["quotes"], sums["sold"]
+    realised, expected = sums["realised_profit"], sums["expected_profit"]
+    return {
+        "quotes": round(quotes),
+        "sold": round(sold),
+        "price_mae": round(sums["abs_error"] / sold, 2) if sold else None,
+        "conversion_brier": round(sums["brier"] / quotes, 4) if quotes else None,
+        "realised_profit": round(realised, 2),
+        "expected_profit": round(expected, 2),
+        "realised_vs_expected_pct": (
+            round((realised - expected) / abs(expected) * 100, 1) if expected else None
         ),
-        "performance_degraded": bool(mae > 1000),  # Threshold
     }
 
-    reports_dir = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
-    os.makedirs(reports_dir, exist_ok=True)
 
-    out_path = os.path.join(reports_dir, "performance_report.json")
-    with open(out_path, "w") as f:
-        json.dump(report, f, indent=2)
+def calibration(sums):
+    bins = []
+    for b in range(CALIBRATION_BINS):
+        quotes = sums[f"calibration_{b}_quotes"]
+        bins.append(
+            {
+                "p_win_from": b / CALIBRATION_BINS,
+                "p_win_to": (b + 1) / CALIBRATION_BINS,
+                "quotes": round(quotes),
+                "mean_p_win": round(sums[f"calibration_{b}_p_win"] / quotes, 4) if quotes else None,
+                "win_rate": round(sums[f"calibration_{b}_won"] / quotes, 4) if quotes else None,
+            }
+        )
+    return bins
+
+
+def _degraded(current, before):
+    ratios = {}
+    for metric, rows in [("price_mae", "sold"), ("conversion_brier", "quotes")]:
+        if min(current[rows], before[rows]) >= MIN_ROWS and before[metric]:
+            ratios[metric] = round(current[metric] / before[metric], 3)
+    return ratios, any(ratio > 1 + DEGRADATION for ratio in ratios.values())
+
+
+def check_performance(
+    as_of=None, path=STATE_PATH, log_dir=QUOTE_LOG_DIR, state=None, skip_unchanged=False
+):
+    """
+    Join new quote-log events and feature partitions into the performance state and
+    report rolling 7/30-day price MAE, Brier, calibration and realised vs expected
+    profit of the served quotes, ending at `as_of` (default: the latest matched day).
+
+    A long-running caller passes its open `state` (left open), and with
+    `skip_unchanged` nothing is reported when no new quotes or outcomes arrived.
+    """
+    print("Running Performance Monitoring...")
+    start_time = time.perf_counter()
+
+    owned = state is None
+    state = PerformanceState(path) if owned else state
+    try:
+        files, months, rematched = state.update(log_dir)
+        print(
+            f"Read {files} new quote-log files and {len(months)} new or rebuilt feature "
+            f"partitions; matched {rematched} enquiries"
+        )
+        if skip_unchanged and not files and not months:
+            return
+        last = state.last_day()
+        if last is None:
+            print("No served quotes have matched outcomes yet.")
+            return
+        as_of = pd.Timestamp(as_of or last)
+
+        def since(days):
+            return str((as_of - pd.Timedelta(days=days - 1)).date())
+
+        end = str(as_of.date())
+        windows = {f"{days}d": state.window(since(days), end) for days in WINDOWS}
+        headline = f"{WINDOWS[-1]}d"
+        before = state.window(
+            None, str((pd.Timestamp(since(WINDOWS[-1])) - pd.Timedelta(days=1)).date())
+        )
+        summaries = {name: summarise(sums) for name, sums in windows.items()}
+        summaries[f"before_{headline}"] = summarise(before)
+        ratios, degraded = _degraded(summaries[headline], summaries[f"before_{headline}"])
+        counts = state.counts()
+    finally:
+        if owned:
+            state.close()
 
-    print(f"Performance report generated at {out_path}")
+    current = summaries[headline]
+    report = {
+        "price_mae": current["price_mae"],
+        "conversion_brier": current["conversion_brier"],
+        "total_profit_actual": current["realised_profit"],
+        # What the served quotes expected to make, the yardstick for realised profit
+        "total_profit_baseline": current["expected_profit"],
+        "profit_lift_pct": current["realised_vs_expected_pct"],
+        "performance_degraded": degraded,
+        "checked_at": datetime.now().isoformat(),
+        "as_of": end,
+        "headline_window": headline,
+        "windows": summaries,
+        "degradation_ratios": ratios,
+        "calibration": calibration(windows[headline]),
+        "state": {**counts, "new_log_files": files, "new_partitions": months},
+        "wall_s": round(time.perf_counter() - start_time, 3),
+    }
+
+    out_path = write_report("performance_report.json", report)
+    print(f"Performance report generated at {out_path} ({report['wall_s']:.2f}s)")
+    return report
 
 
 if __name__ == "__main__":
-    check_performance()
+    parser = argparse.ArgumentParser(description="Check model performance")
+    parser.add_argument(
+        "--as-of", default=None, help="Last day of the rolling windows (default: latest match)"
+    )
+    args = parser.parse_args()
+
+    check_performance(as_of=args.as_of)
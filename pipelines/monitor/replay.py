@@ -0,0 +1,83 @@
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from app.optimiser import compute_expected_costs_batch
+from app.quote_log import LOG_SCHEMA, QUOTE_LOG_DIR, QuoteLogger
+from pipelines.evaluate.evaluate import MODEL_DIR, load_models, predict_prices
+from pipelines.features.store import attach_aggregates, load_features
+from pipelines.train import train_conversion_model as conversion
+from pipelines.train import train_price_model as price
+from pipelines.train.out_of_core import source_columns
+
+
+def _version(name):
+    """The model file's MD5, as the API reports it."""
+    with open(os.path.join(MODEL_DIR, f"{name}.pkl"), "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def replay_quotes(start=None, end=None, log_dir=QUOTE_LOG_DIR):
+    """
+    Shadow-score historical enquiries in [start, end] with the served models and append
+    them to the quote log as endpoint "replay", one file per enquiry day, so the
+    performance monitor has served predictions to join to known outcomes. The quote
+    is the offer actually made, so P(win) is scored at that offer.
+
+    Enquiries the models were trained on score optimistically; replay a period after
+    the training data for an honest read.
+    """
+    print("Replaying historical enquiries into the quote log...")
+    models = load_models()
+    if models is None:
+        print("Models not found, run make train first!")
+        return
+    extra = ["enquiry_id", "vehicle_id", "model", "year", "damage_flag", "damage_type"]
+    columns = source_columns(list(dict.fromkeys(conversion.FEATURES + price.FEATURES + extra)))
+    df = load_features(start, end, columns=columns)
+    if df is None or df.empty:
+        print("Features not built, run build_features.py first!")
+        return
+    df = attach_aggregates(df)
+
+    scoring_start = time.perf_counter()
+    e_sale, price_q10 = predict_prices(models, df[price.FEATURES])
+    p_win = models["conversion_model"].predict_proba(df[conversion.FEATURES])[:, 1]
+    e_costs = compute_expected_costs_batch(df["damage_flag"], df["channel"], df["risk_score"])
+    offer = df["offer_price"].to_numpy(dtype=float)
+    latency_ms = (time.perf_counter() - scoring_start) * 1000 / len(df)
+
+    logged = df[[name for name in LOG_SCHEMA.names if name in df.columns]].astype(object)
+    logged = logged.where(logged.notna(), None)
+    logged["logged_at"] = df["enquiry_date"]
+    logged["endpoint"] = "replay"
+    logged["model_source"] = "local"
+    logged["price_model_version"] = _version("price_model")
+    logged["conversion_model_version"] = _version("conversion_model")
+    logged["e_sale"] = np.asarray(e_sale, dtype=float)
+    logged["price_q10"] = np.asarray(price_q10, dtype=float)
+    logged["e_costs"] = e_costs
+    logged["recommended_offer"] = offer
+    logged["expected_value"] = p_win * (logged["e_sale"] - offer - e_costs)
+    logged["p_win"] = p_win
+    logged["selected"] = True
+    logged["latency_ms"] = latency_ms
+
+    logger = QuoteLogger(log_dir)
+    for _, day in logged.groupby(df["enquiry_date"].dt.normalize()):
+        logger.write(day.to_dict("records"))
+    stats = logger.stats()
+    print(f"Logged {stats['written']} replayed quotes in {stats['files']} files")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay historical enquiries as served quotes")
+    parser.add_argument("--start", default=None, help="First enquiry date to replay (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last enquiry date to replay (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    replay_quotes(start=args.start, end=args.end)
@@ -0,0 +1,27 @@
+import json
+import os
+
+REPORTS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
+
+
+def write_report(name, report, reports_dir=REPORTS_DIR):
+    """
+    Write a JSON report by atomic rename, so the dashboard and alerts never read a
+    half-written file. Returns its path.
+    """
+    os.makedirs(reports_dir, exist_ok=True)
+    path = os.path.join(reports_dir, name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_report(name, reports_dir=REPORTS_DIR):
+    """A report's contents, or None if it has not been written."""
+    path = os.path.join(reports_dir, name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
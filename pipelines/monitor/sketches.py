@@ -0,0 +1,349 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2
+
+from pipelines.features.store import FEATURES_DIR, load_features, read_manifest
+
+SKETCH_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "monitor", "drift")
+
+NUMERIC_FEATURES = ["vehicle_age", "mileage", "offer_price", "damage_severity_score"]
+CATEGORICAL_FEATURES = ["make", "fuel_type", "channel", "region_id"]
+# Every feature is also sketched within each value of these columns
+SEGMENT_BY = ["channel", "region_id"]
+# Quantile bins per numeric feature, fixed when the sketches are first built; each
+# feature also has an underflow, an overflow and a missing-value bin. KS uses every
+# bin, PSI merges them into PSI_BUCKETS
+BINS = 100
+PSI_BUCKETS = 10
+# Rebuilt partitions are counted in worker processes once they hold this many rows
+PARALLEL_ROWS = 1_000_000
+
+
+def _month_range(month):
+    start = pd.Timestamp(f"{month}-01")
+    return start, start + pd.offsets.MonthEnd(0)
+
+
+def _day_number(dates):
+    return np.asarray(pd.to_datetime(dates).values.astype("datetime64[D]"), dtype=np.int64)
+
+
+def _category_codes(values, categories):
+    """Index of each value in `categories`: -1 if unseen, -2 if missing."""
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Map the few dictionary entries instead of every row
+        lookup = np.append(pd.Index(categories).get_indexer(values.cat.categories), -2)
+        return lookup[values.cat.codes.to_numpy()]
+    codes = pd.Index(categories).get_indexer(values.astype(object))
+    return np.where(values.isna().to_numpy(), -2, codes)
+
+
+def _count_month(spec, month, features_dir):
+    """Sketch counts of one feature partition, for refresh's worker processes."""
+    sketches = DriftSketches(**spec)
+    start, end = _month_range(month)
+    columns = list(dict.fromkeys(sketches.features + sketches.segment_by + ["enquiry_date"]))
+    sketches.update(load_features(start, end, columns=columns, features_dir=features_dir))
+    return sketches.keys, sketches.values
+
+
+class DriftSketches:
+    """
+    Mergeable per-day histograms of each monitored feature, overall and per segment.
+
+    Numeric features are binned on quantile edges and categorical ones on a vocabulary,
+    both fixed at build time, and each row is counted once overall and once in its
+    value of every SEGMENT_BY column. Counts are kept sparsely, one entry per non-empty
+    (day, segment, bin) cell, so the histograms of any window are the sum of its days'
+    entries and new rows are added without touching old ones. Drift statistics then
+    cost O(days × segments × bins) whatever the number of enquiries.
+    """
+
+    def __init__(
+        self,
+        edges,
+        categories,
+        segment_values,
+        keys=None,
+        values=None,
+        partitions=None,
+    ):
+        self.edges = {name: np.asarray(e, dtype=float) for name, e in edges.items()}
+        self.categories = {name: list(c) for name, c in categories.items()}
+        self.segment_values = {name: list(v) for name, v in segment_values.items()}
+        self.features = list(self.edges) + list(self.categories)
+        self.segment_by = list(self.segment_values)
+        self.segments = ["all"] + [
+            f"{column}={value}"
+            for column, values in self.segment_values.items()
+            for value in values
+        ]
+
+        # Bins per feature: numeric underflow, one per edge interval and overflow, or
+        # one per category and "other"; then a missing bin
+        self.sizes = [len(e) + 2 for e in self.edges.values()] + [
+            len(c) + 2 for c in self.categories.values()
+        ]
+        self.offsets = np.concatenate([[0], np.cumsum(self.sizes)]).astype(np.int64)
+        self.width = int(self.offsets[-1])
+        self.cells = len(self.segments) * self.width
+
+        # Sorted unique day × segment × bin keys and their counts
+        self.keys = np.zeros(0, dtype=np.int64) if keys is None else np.asarray(keys, np.int64)
+        self.values = (
+            np.zeros(0, dtype=np.int64) if values is None else np.asarray(values, np.int64)
+        )
+        # Feature partition fingerprints already counted, so unchanged months are skipped
+        self.partitions = dict(partitions or {})
+
+    @classmethod
+    def from_reference(
+        cls,
+        df,
+        numeric=NUMERIC_FEATURES,
+        categorical=CATEGORICAL_FEATURES,
+        segment_by=SEGMENT_BY,
+        bins=BINS,
+    ):
+        """Sketches binned on the quantiles and category values of `df`."""
+        edges = {}
+        for name in numeric:
+            values = df[name].to_numpy(dtype=float)
+            values = values[~np.isnan(values)]
+            edges[name] = (
+                np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)))
+                if len(values)
+                else np.array([0.0])
+            )
+
+        def vocabulary(name):
+            return sorted(df[name].dropna().astype(str).unique())
+
+        return cls(
+            edges,
+            {name: vocabulary(name) for name in categorical},
+            {name: vocabulary(name) for name in segment_by},
+        )
+
+    def _spec(self):
+        return {
+            "edges": self.edges,
+            "categories": self.categories,
+            "segment_values": self.segment_values,
+        }
+
+    def _bin(self, df):
+        """(rows × features) matrix of each row's bin in the flat all-features layout."""
+        codes = np.empty((len(df), len(self.features)), dtype=np.int64)
+        for j, (name, edges) in enumerate(self.edges.items()):
+            values = df[name].to_numpy(dtype=float)
+            code = np.searchsorted(edges, values, side="right")
+            codes[:, j] = np.where(np.isnan(values), self.sizes[j] - 1, code)
+        for j, (name, categories) in enumerate(self.categories.items(), start=len(self.edges)):
+            code = _category_codes(df[name], categories)
+            # Unseen values go to the "other" bin, just before the missing bin
+            codes[:, j] = np.select(
+                [code == -2, code == -1], [self.sizes[j] - 1, self.sizes[j] - 2], code
+            )
+        return codes + self.offsets[:-1]
+
+    def _segment_codes(self, df):
+        """(rows × (1 + segment columns)) segment of each row, -1 where it has none."""
+        codes = np.zeros((len(df), 1 + len(self.segment_by)), dtype=np.int64)
+        base = 1
+        for j, (name, values) in enumerate(self.segment_values.items(), start=1):
+            code = _category_codes(df[name], values)
+            codes[:, j] = np.where(code >= 0, base + code, -1)
+            base += len(values)
+        return codes
+
+    def _add(self, keys, values):
+        keys = np.concatenate([self.keys, keys])
+        unique, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([self.values, values]))
+        self.keys, self.values = unique, counts.astype(np.int64)
+        return self
+
+    def update(self, df):
+        """
+        Add the rows of `df` (feature and segment columns plus enquiry_date) in one
+        pass: every row's bins and segments are combined into cell keys and counted
+        with a single np.unique.
+        """
+        if len(df) == 0:
+            return self
+        day = _day_number(df["enquiry_date"])
+        segments = self._segment_codes(df)
+        cells = (
+            day[:, None, None] * self.cells
+            + segments[:, :, None] * self.width
+            + self._bin(df)[:, None, :]
+        )
+        keys = cells[np.broadcast_to((segments >= 0)[:, :, None], cells.shape)]
+        unique, counts = np.unique(keys, return_counts=True)
+        return self._add(unique, counts)
+
+    def merge(self, other):
+        """Add another sketch built on the same bins, e.g. counted in a worker."""
+        return self._add(other.keys, other.values)
+
+    def drop(self, start, end):
+        """Forget the days in [start, end], e.g. before recounting a rebuilt partition."""
+        day = self.keys // self.cells
+        keep = (day < _day_number([start])[0]) | (day > _day_number([end])[0])
+        self.keys, self.values = self.keys[keep], self.values[keep]
+        return self
+
+    def refresh(self, features_dir=FEATURES_DIR, n_jobs=None):
+        """
+        Count feature partitions that are new or rebuilt since the last refresh and drop
+        removed ones; unchanged partitions are not read. Large rebuilds are counted one
+        partition per worker process. Returns the months recounted.
+        """
+        built = read_manifest(features_dir)["partitions"]
+        for month in set(self.partitions) - set(built):
+            self.drop(*_month_range(month))
+            del self.partitions[month]
+        stale = sorted(m for m, p in built.items() if self.partitions.get(m) != p["fingerprint"])
+
+        n_jobs = n_jobs or os.cpu_count()
+        rows = sum(built[m].get("rows", 0) for m in stale)
+        if n_jobs > 1 and len(stale) > 1 and rows >= PARALLEL_ROWS:
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(stale))) as pool:
+                counted = list(
+                    pool.map(
+                        _count_month,
+                        [self._spec()] * len(stale),
+                        stale,
+                        [features_dir] * len(stale),
+                    )
+                )
+        else:
+            counted = [_count_month(self._spec(), m, features_dir) for m in stale]
+
+        for month, (keys, values) in zip(stale, counted):
+            self.drop(*_month_range(month))._add(keys, values)
+            self.partitions[month] = built[month]["fingerprint"]
+        return stale
+
+    def days(self):
+        """Enquiry days with counts, as dates."""
+        return pd.to_datetime(np.unique(self.keys // self.cells), unit="D")
+
+    def window(self, start=None, end=None):
+        """
+        (segments × bins) counts of the days in [start, end], and the rows per segment.
+        """
+        day = self.keys // self.cells
+        mask = np.ones(len(day), dtype=bool)
+        if start is not None:
+            mask &= day >= _day_number([start])[0]
+        if end is not None:
+            mask &= day <= _day_number([end])[0]
+        counts = np.bincount(
+            self.keys[mask] % self.cells, weights=self.values[mask], minlength=self.cells
+        )
+        counts = counts.astype(np.int64).reshape(len(self.segments), self.width)
+        # Every row lands in exactly one bin of the first feature
+        return counts, counts[:, : self.offsets[1]].sum(axis=1)
+
+    def histograms(self, counts):
+        """Per-feature (segments × bins) slices of a window's counts."""
+        return {
+            name: counts[..., self.offsets[j] : self.offsets[j + 1]]
+            for j, name in enumerate(self.features)
+        }
+
+    def save(self, path=SKETCH_DIR):
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, "counts.npz"), keys=self.keys, values=self.values)
+        with open(os.path.join(path, "meta.json.tmp"), "w") as f:
+            json.dump(
+                {
+                    "saved_at": datetime.now().isoformat(),
+                    "edges": {name: e.tolist() for name, e in self.edges.items()},
+                    "categories": self.categories,
+                    "segment_values": self.segment_values,
+                    "partitions": self.partitions,
+                },
+                f,
+                indent=2,
+            )
+        os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path=SKETCH_DIR):
+        """Saved sketches, or None if none have been built (or only the old layout)."""
+        if not os.path.exists(os.path.join(path, "counts.npz")):
+            return None
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        counts = np.load(os.path.join(path, "counts.npz"))
+        return cls(
+            meta["edges"],
+            meta["categories"],
+            meta["segment_values"],
+            counts["keys"],
+            counts["values"],
+            meta["partitions"],
+        )
+
+
+def coarsen(counts, buckets=PSI_BUCKETS):
+    """
+    Merge a numeric feature's fine bins (last axis) into about `buckets` adjacent
+    groups, folding underflow and overflow into the end groups and keeping the
+    missing bin.
+    """
+    interior = counts[..., 1:-2]
+    if interior.shape[-1] <= buckets:
+        return counts
+    starts = np.linspace(0, interior.shape[-1], buckets + 1).astype(int)[:-1]
+    groups = np.add.reduceat(interior, starts, axis=-1)
+    groups[..., 0] += counts[..., 0]
+    groups[..., -1] += counts[..., -2]
+    return np.concatenate([groups, counts[..., -1:]], axis=-1)
+
+
+def _shares(counts):
+    return counts / np.maximum(counts.sum(axis=-1, keepdims=True), 1)
+
+
+def psi(expected_counts, actual_counts, floor=0.0001):
+    """Population Stability Index between histograms on the same bins (last axis)."""
+    expected = np.maximum(_shares(expected_counts), floor)
+    actual = np.maximum(_shares(actual_counts), floor)
+    return np.sum((actual - expected) * np.log(actual / expected), axis=-1)
+
+
+def ks_statistic(expected_counts, actual_counts):
+    """
+    Largest gap between the two empirical CDFs at the bin edges, the two-sample KS
+    statistic of the binned data (missing values excluded).
+    """
+    gap = np.cumsum(_shares(expected_counts[..., :-1]), axis=-1) - np.cumsum(
+        _shares(actual_counts[..., :-1]), axis=-1
+    )
+    return np.abs(gap).max(axis=-1)
+
+
+def chi2_test(expected_counts, actual_counts):
+    """
+    Chi-square test of homogeneity of two categorical histograms (last axis), over
+    the bins either one uses. Returns the statistics and p-values.
+    """
+    table = np.stack([expected_counts, actual_counts]).astype(float)
+    totals = table.sum(axis=-1, keepdims=True)
+    used = table.sum(axis=0) > 0
+    expected = table.sum(axis=0) * totals / np.maximum(totals.sum(axis=0), 1)
+    terms = np.where(used, (table - expected) ** 2 / np.where(expected > 0, expected, 1), 0)
+    statistic = terms.sum(axis=(0, -1))
+    dof = np.maximum(used.sum(axis=-1) - 1, 1)
+    p_value = np.where((totals > 0).all(axis=0)[..., 0], chi2.sf(statistic, dof), 1.0)
+    return statistic, p_value
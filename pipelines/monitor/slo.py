@@ -0,0 +1,203 @@
+import time
+from bisect import bisect_left
+
+from app.metrics import API_METRICS_DIR, LATENCY_BOUNDS_MS, read_snapshots
+
+# Multiwindow burn-rate alerting: a rule breaches when both the long and the short
+# window spend its error budget at least `burn_rate` times faster than sustainable
+# (14.4x over an hour spends 2% of a 30-day budget)
+BURN_WINDOWS = [
+    {"long_minutes": 60, "short_minutes": 5, "burn_rate": 14.4},
+    {"long_minutes": 360, "short_minutes": 30, "burn_rate": 6.0},
+]
+# Windows with fewer events than this never breach
+MIN_EVENTS = 20
+THROUGHPUT_MINUTES = 60
+
+# kind "latency": events slower than threshold_ms (rounded up to a histogram bound) are bad
+# kind "shed": requests turned away with 429/503 are bad
+# kind "errors": requests failed with any other 5xx are bad
+# kind "ratio": `bad` counter events are bad, out of `good` + `bad`
+# A breached "rollback" rule flags the serving models for rollback, e.g. after an upgrade
+SLO_RULES = [
+    {
+        "name": "quote_latency",
+        "kind": "latency",
+        "metrics": ["/quote"],
+        "threshold_ms": 2500,
+        "objective": 0.99,
+        "action": "rollback",
+    },
+    {
+        "name": "quote_batch_latency",
+        "kind": "latency",
+        "metrics": ["/quote/batch"],
+        "threshold_ms": 10000,
+        "objective": 0.99,
+        "action": "rollback",
+    },
+    {
+        "name": "dvla_upstream_latency",
+        "kind": "latency",
+        "metrics": ["dvla_upstream"],
+        "threshold_ms": 1000,
+        "objective": 0.95,
+        "action": "alert",
+    },
+    {
+        "name": "dvla_upstream_errors",
+        "kind": "errors",
+        "metrics": ["dvla_upstream"],
+        "objective": 0.99,
+        "action": "alert",
+    },
+    {
+        "name": "aggregate_cache_hit_rate",
+        "kind": "ratio",
+        "good": "aggregate_hit",
+        "bad": "aggregate_miss",
+        "objective": 0.9,
+        "action": "alert",
+    },
+    {
+        "name": "quote_shed_rate",
+        "kind": "shed",
+        "metrics": ["/quote", "/quote/batch"],
+        "objective": 0.999,
+        "action": "alert",
+    },
+]
+
+
+def merge_minutes(snapshots):
+    """Per-minute timings and counters summed over every worker's snapshot."""
+    merged = {}
+    for snapshot in snapshots:
+        for minute, bucket in snapshot.get("minutes", {}).items():
+            into = merged.setdefault(int(minute), {"timings": {}, "counts": {}})
+            for name, timing in bucket["timings"].items():
+                total = into["timings"].setdefault(
+                    name,
+                    {
+                        "requests": 0,
+                        "errors": 0,
+                        "shed": 0,
+                        "latency": [0] * len(timing["latency"]),
+                    },
+                )
+                for field in ["requests", "errors", "shed"]:
+                    total[field] += timing[field]
+                total["latency"] = [a + b for a, b in zip(total["latency"], timing["latency"])]
+            for name, n in bucket["counts"].items():
+                into["counts"][name] = into["counts"].get(name, 0) + n
+    return merged
+
+
+def _window(minutes, last, length):
+    return [minutes[m] for m in range(last - length + 1, last + 1) if m in minutes]
+
+
+def _latency_histogram(buckets, names):
+    histogram = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+    for bucket in buckets:
+        for name in names:
+            timing = bucket["timings"].get(name)
+            if timing is not None:
+                histogram = [a + b for a, b in zip(histogram, timing["latency"])]
+    return histogram
+
+
+def rule_events(rule, buckets):
+    """(bad, total) events of one rule over a window's minute buckets."""
+    if rule["kind"] == "ratio":
+        bad = sum(b["counts"].get(rule["bad"], 0) for b in buckets)
+        good = sum(b["counts"].get(rule["good"], 0) for b in buckets)
+        return bad, bad + good
+    if rule["kind"] == "latency":
+        histogram = _latency_histogram(buckets, rule["metrics"])
+        slow_from = bisect_left(LATENCY_BOUNDS_MS, rule["threshold_ms"]) + 1
+        return sum(histogram[slow_from:]), sum(histogram)
+    timings = [
+        b["timings"][name] for b in buckets for name in rule["metrics"] if name in b["timings"]
+    ]
+    field = "errors" if rule["kind"] == "errors" else "shed"
+    return sum(t[field] for t in timings), sum(t["requests"] for t in timings)
+
+
+def _burning(windows, length, factor):
+    w = windows[f"{length}m"]
+    return w["events"] >= MIN_EVENTS and w["burn_rate"] >= factor
+
+
+def latency_quantile(histogram, q):
+    """Upper bound (ms) of the bucket holding the q-quantile; None past the last bound."""
+    total = sum(histogram)
+    if not total:
+        return None
+    seen = 0
+    for i, n in enumerate(histogram):
+        seen += n
+        if seen >= q * total:
+            return LATENCY_BOUNDS_MS[i] if i < len(LATENCY_BOUNDS_MS) else None
+
+
+def evaluate_slos(snapshots=None, now=None, rules=SLO_RULES, metrics_dir=API_METRICS_DIR):
+    """
+    Burn rates of every SLO rule over each of the BURN_WINDOWS, ending at the minute
+    of `now` (default: the current time), from the API workers' metrics snapshots.
+    """
+    snapshots = read_snapshots(metrics_dir, now) if snapshots is None else snapshots
+    minutes = merge_minutes(snapshots)
+    last = int((time.time() if now is None else now) // 60)
+    lengths = sorted({w[k] for w in BURN_WINDOWS for k in ["long_minutes", "short_minutes"]})
+
+    results = {}
+    for rule in rules:
+        budget = 1 - rule["objective"]
+        windows = {}
+        for length in lengths:
+            bad, total = rule_events(rule, _window(minutes, last, length))
+            windows[f"{length}m"] = {
+                "events": total,
+                "bad_fraction": round(bad / total, 5) if total else None,
+                "burn_rate": round(bad / total / budget, 2) if total else None,
+            }
+
+        breached_by = [
+            f"{w['long_minutes']}m/{w['short_minutes']}m"
+            for w in BURN_WINDOWS
+            if _burning(windows, w["long_minutes"], w["burn_rate"])
+            and _burning(windows, w["short_minutes"], w["burn_rate"])
+        ]
+        result = {
+            "kind": rule["kind"],
+            "objective": rule["objective"],
+            "action": rule["action"],
+            "breached": bool(breached_by),
+            "breached_windows": breached_by,
+            "windows": windows,
+        }
+        if rule["kind"] == "latency":
+            histogram = _latency_histogram(
+                _window(minutes, last, BURN_WINDOWS[0]["long_minutes"]), rule["metrics"]
+            )
+            result["threshold_ms"] = rule["threshold_ms"]
+            result["p99_ms"] = latency_quantile(histogram, 0.99)
+        results[rule["name"]] = result
+
+    recent = _window(minutes, last, THROUGHPUT_MINUTES)
+    names = sorted({name for bucket in recent for name in bucket["timings"]})
+    throughput = {
+        name: round(
+            sum(b["timings"][name]["requests"] for b in recent if name in b["timings"])
+            / THROUGHPUT_MINUTES,
+            2,
+        )
+        for name in names
+    }
+    return {
+        "workers": len(snapshots),
+        "burn_windows": BURN_WINDOWS,
+        "throughput_rpm": throughput,
+        "rules": results,
+    }
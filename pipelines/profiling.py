@@ -0,0 +1,215 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+REPORTS_DIR = os.path.join(os.path.dirname(__file__), "..", "reports")
+PROFILE_PATH = os.path.join(REPORTS_DIR, "training_profile.json")
+FLAMEGRAPH_DIR = os.path.join(REPORTS_DIR, "flamegraphs")
+
+# Runs kept per script in training_profile.json
+HISTORY_RUNS = 20
+# RSS (and, with a flamegraph, stack) sampling period in seconds
+SAMPLE_INTERVAL = 0.01
+# A stage regresses when it is this much slower or bigger than the previous comparable
+# run, and by at least the absolute margins, so millisecond stages don't flag noise
+REGRESSION_RATIO = 1.2
+MIN_REGRESSION_S = 0.5
+MIN_REGRESSION_MB = 50
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """High-water RSS of this process (or of its reaped children) since it started."""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # No /proc (macOS): the process high-water mark is the best available
+        return peak_rss_mb()
+
+
+def _cpu_seconds():
+    # Children are included once reaped, e.g. after a ProcessPoolExecutor shuts down
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class _Sampler(threading.Thread):
+    """Track peak RSS during a stage and optionally count the profiled thread's stacks."""
+
+    def __init__(self, stage, thread_id, stacks=None):
+        super().__init__(daemon=True)
+        self.stage = stage
+        self.thread_id = thread_id
+        self.stacks = stacks
+        self.peak_mb = _rss_mb()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(SAMPLE_INTERVAL):
+            self.peak_mb = max(self.peak_mb, _rss_mb())
+            if self.stacks is not None:
+                frame = sys._current_frames().get(self.thread_id)
+                if frame is not None:
+                    self.stacks[self._fold(frame)] += 1
+
+    def _fold(self, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join([self.stage] + names[::-1])
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        return max(self.peak_mb, _rss_mb())
+
+
+class Profiler:
+    """
+    Wall time, CPU time (worker processes included) and peak RSS per named stage of
+    a pipeline run, appended to reports/training_profile.json and compared with the
+    previous run of the same script and configuration.
+
+    With `flamegraph`, the calling thread's stack is sampled every SAMPLE_INTERVAL and
+    written in collapsed-stack format (one "frame;frame;... count" line per stack) for
+    flamegraph.pl or speedscope. Work done inside worker processes is not sampled.
+    """
+
+    def __init__(self, script, config=None, flamegraph=False, path=PROFILE_PATH):
+        self.script = script
+        self.config = config or {}
+        self.path = path
+        self.stacks = Counter() if flamegraph else None
+        self.stages = {}
+        self.started_at = datetime.now().isoformat()
+        self._wall, self._cpu = time.perf_counter(), _cpu_seconds()
+
+    @contextmanager
+    def stage(self, name):
+        sampler = _Sampler(name, threading.get_ident(), self.stacks)
+        sampler.start()
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        try:
+            yield
+        finally:
+            self.stages[name] = {
+                "wall_s": round(time.perf_counter() - wall, 3),
+                "cpu_s": round(_cpu_seconds() - cpu, 3),
+                "peak_rss_mb": round(sampler.stop(), 1),
+            }
+
+    def add_stage(self, name, wall_s, cpu_s):
+        """Record work timed elsewhere, e.g. a model fitted in a worker process."""
+        self.stages[name] = {"wall_s": round(wall_s, 3), "cpu_s": round(cpu_s, 3), "worker": True}
+
+    def elapsed(self):
+        """(wall, cpu) seconds since the profiler was created."""
+        return time.perf_counter() - self._wall, _cpu_seconds() - self._cpu
+
+    def _write_flamegraph(self):
+        os.makedirs(FLAMEGRAPH_DIR, exist_ok=True)
+        stamp = self.started_at.replace(":", "").split(".")[0]
+        path = os.path.join(FLAMEGRAPH_DIR, f"{self.script}-{stamp}.folded")
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+        return path
+
+    def finish(self):
+        """Write this run to the profile history and print its stages and regressions."""
+        wall, cpu = self.elapsed()
+        run = {
+            "script": self.script,
+            "started_at": self.started_at,
+            "config": self.config,
+            "wall_s": round(wall, 3),
+            "cpu_s": round(cpu, 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "children_peak_rss_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+            "stages": self.stages,
+            "flamegraph": self._write_flamegraph() if self.stacks else None,
+        }
+
+        history = load_profile(self.path)
+        previous = next(
+            (
+                r
+                for r in reversed(history)
+                if r["script"] == self.script and r.get("config") == self.config
+            ),
+            None,
+        )
+        run["compared_to"] = previous["started_at"] if previous else None
+        run["regressions"] = find_regressions(run, previous) if previous else []
+
+        runs = [r for r in history if r["script"] == self.script][-(HISTORY_RUNS - 1) :]
+        history = [r for r in history if r["script"] != self.script] + runs + [run]
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"runs": history}, f, indent=2)
+        os.replace(self.path + ".tmp", self.path)
+
+        print(f"{self.script} profile ({run['wall_s']:.1f}s wall, {run['cpu_s']:.1f}s CPU):")
+        for name, stage in self.stages.items():
+            rss = f", peak RSS {stage['peak_rss_mb']:.0f} MB" if "peak_rss_mb" in stage else ""
+            print(f"  {name}: {stage['wall_s']:.2f}s wall, {stage['cpu_s']:.2f}s CPU{rss}")
+        for regression in run["regressions"]:
+            print(
+                f"  REGRESSION {regression['stage']} {regression['metric']}: "
+                f"{regression['previous']} -> {regression['current']}"
+            )
+        if run["flamegraph"]:
+            print(f"  Flamegraph stacks written to {os.path.abspath(run['flamegraph'])}")
+        return run
+
+
+def load_profile(path=PROFILE_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return json.load(f)["runs"]
+
+
+def find_regressions(run, previous):
+    """Stages (and the run total) that got slower or used more memory than `previous`."""
+    margins = {
+        "wall_s": MIN_REGRESSION_S,
+        "cpu_s": MIN_REGRESSION_S,
+        "peak_rss_mb": MIN_REGRESSION_MB,
+    }
+    pairs = [("total", run, previous)] + [
+        (name, stage, previous["stages"][name])
+        for name, stage in run["stages"].items()
+        if name in previous["stages"]
+    ]
+    regressions = []
+    for name, current, before in pairs:
+        for metric, margin in margins.items():
+            if current.get(metric) is None or before.get(metric) is None:
+                continue
+            if (
+                current[metric] > before[metric] * REGRESSION_RATIO
+                and current[metric] - before[metric] >= margin
+            ):
+                regressions.append(
+                    {
+                        "stage": name,
+                        "metric": metric,
+                        "previous": before[metric],
+                        "current": current[metric],
+                    }
+                )
+    return regressions
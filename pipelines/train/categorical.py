@@ -0,0 +1,71 @@
+import json
+import os
+
+import numpy as np
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+
+CATEGORICAL_FEATURES = ["make", "fuel_type", "body_type", "channel"]
+VOCAB_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "models", "category_vocab.json")
+
+
+def load_vocabulary(path=VOCAB_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def extend_vocabulary(vocab, df, columns=CATEGORICAL_FEATURES):
+    """
+    A copy of `vocab` with any new values of `columns` seen in `df` appended, for
+    tools that encode like the trainers without touching the persisted file.
+    """
+    vocab = {column: list(values) for column, values in vocab.items()}
+    for column in columns:
+        known = vocab.setdefault(column, [])
+        seen = set(known)
+        values = df[column].dropna().astype(str).unique()
+        known.extend(sorted(v for v in values if v not in seen))
+    return vocab
+
+
+def update_vocabulary(df, columns=CATEGORICAL_FEATURES, path=VOCAB_PATH):
+    """
+    Extend the persisted vocabulary with any values of `columns` seen in `df`.
+
+    Values are only ever appended, so a category keeps its ordinal code across retrains
+    and every model trained against the file agrees on what each code means.
+    """
+    vocab = extend_vocabulary(load_vocabulary(path), df, columns)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(vocab, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return vocab
+
+
+def categorical_encoder(mode, vocab=None, columns=CATEGORICAL_FEATURES):
+    """
+    "onehot": one dense column per category.
+    "native": one float32 ordinal code per feature from the vocabulary, for models with
+    native categorical splits; values outside the vocabulary become NaN (missing).
+    """
+    if mode == "onehot":
+        return OneHotEncoder(handle_unknown="ignore", sparse_output=False)
+    return OrdinalEncoder(
+        categories=[vocab[column] for column in columns],
+        handle_unknown="use_encoded_value",
+        unknown_value=np.nan,
+        dtype=np.float32,
+    )
+
+
+def feature_types(n_numeric, mode, columns=CATEGORICAL_FEATURES):
+    """
+    XGBoost "q"/"c" type of each encoded column, numeric columns first as the
+    ColumnTransformers order them. None for one-hot, where every column is numeric.
+    """
+    if mode != "native":
+        return None
+    return ["q"] * n_numeric + ["c"] * len(columns)
@@ -0,0 +1,123 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+from app.aggregates import AGGREGATE_FEATURES, AGGREGATE_KEYS
+from pipelines.features.store import iter_features, load_features
+
+STRATA = ["won", "channel"]
+# Every stratum keeps at least this many rows (or all of them), so rare
+# won/channel combinations are not sampled away
+MIN_STRATUM_ROWS = 100
+# Peak training memory per byte of loaded features: the frame itself, the train/test
+# copies, the encoded design matrix and the booster's own quantised copy
+TRAINING_OVERHEAD = 4.0
+UNITS = {"": 1, "B": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_memory(text):
+    """Parse a size such as "512MB", "2G" or "1.5GB" into bytes."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)I?B?\s*", str(text).upper())
+    if match is None:
+        raise ValueError(f"Unrecognised memory size: {text!r}")
+    return int(float(match.group(1)) * UNITS[match.group(2)])
+
+
+def holdout_mask(enquiry_ids):
+    """
+    Deterministic 20% holdout by enquiry, identical in every streamed chunk. Every
+    trainer holds these enquiries out, so backtests can score on them out-of-sample.
+    """
+    return pd.util.hash_array(enquiry_ids.to_numpy(dtype=str)) % 5 == 0
+
+
+def source_columns(features):
+    """Feature-store columns needed to build `features`, aggregates included."""
+    columns = [c for c in features if c not in AGGREGATE_FEATURES]
+    if any(c in AGGREGATE_FEATURES for c in features):
+        columns += AGGREGATE_KEYS + ["enquiry_date"]
+    return list(dict.fromkeys(columns + STRATA))
+
+
+def budget_rows(max_memory, columns, start=None, end=None, where=None):
+    """Rows of `columns` that fit in `max_memory` bytes once training overhead is included."""
+    probe = next(iter_features(start, end, columns, batch_rows=10000, where=where), None)
+    if probe is None or probe.empty:
+        return 0
+    bytes_per_row = probe.memory_usage(deep=True, index=False).sum() / len(probe)
+    return max(1, int(max_memory / (bytes_per_row * TRAINING_OVERHEAD)))
+
+
+def _strata_keys(df):
+    return df["won"].fillna(0).astype(int).astype(str) + "|" + df["channel"].astype(str)
+
+
+def sample_features(start, end, columns, max_rows, where=None, seed=42):
+    """
+    Stratified sample of at most about `max_rows` rows, streamed in two passes.
+
+    The first pass reads only the strata columns to count rows per won/channel
+    stratum; each stratum is then allocated its proportional share (at least
+    MIN_STRATUM_ROWS) and exactly that many of its row positions are drawn. The second
+    pass streams the requested columns and keeps the drawn rows, so at most one
+    batch plus the sample is in memory at any time.
+    """
+    counts = {}
+    for chunk in iter_features(start, end, STRATA, where=where):
+        for key, n in _strata_keys(chunk).value_counts().items():
+            counts[key] = counts.get(key, 0) + int(n)
+    population = sum(counts.values())
+    if population == 0:
+        return None, {"population_rows": 0, "sample_rows": 0, "strata": {}}
+
+    rate = min(1.0, max_rows / population)
+    rng = np.random.default_rng(seed)
+    keep, seen, strata = {}, {}, {}
+    for key in sorted(counts):
+        count = counts[key]
+        n = min(count, max(round(count * rate), MIN_STRATUM_ROWS))
+        keep[key] = np.zeros(count, dtype=bool)
+        keep[key][rng.choice(count, size=n, replace=False)] = True
+        seen[key] = 0
+        strata[key] = {"rows": count, "sampled": n}
+
+    parts = []
+    for chunk in iter_features(start, end, columns, where=where):
+        keys = _strata_keys(chunk).to_numpy()
+        mask = np.zeros(len(chunk), dtype=bool)
+        for key in np.unique(keys):
+            rows = np.flatnonzero(keys == key)
+            mask[rows] = keep[key][seen[key] : seen[key] + len(rows)]
+            seen[key] += len(rows)
+        parts.append(chunk[mask])
+
+    df = pd.concat(parts, ignore_index=True)
+    return df, {"population_rows": population, "sample_rows": len(df), "strata": strata}
+
+
+def load_training_frame(start, end, columns, max_memory=None, won_only=False, seed=42):
+    """
+    Load training rows, stratified-subsampled to fit `max_memory` bytes if given.
+
+    Returns (df, sample) where `sample` records the population and sample sizes used;
+    df is None if no features are built.
+    """
+    where = ds.field("won") == 1 if won_only else None
+    if max_memory is None:
+        df = load_features(start, end, columns=columns)
+        if df is not None and won_only:
+            df = df[df["won"] == 1].reset_index(drop=True)
+        rows = 0 if df is None else len(df)
+        return df, {"mode": "full", "population_rows": rows, "sample_rows": rows}
+
+    max_rows = budget_rows(max_memory, columns, start, end, where)
+    df, sample = sample_features(start, end, columns, max_rows, where=where, seed=seed)
+    sample = {
+        "mode": "stratified" if sample["sample_rows"] < sample["population_rows"] else "full",
+        "max_memory_mb": round(max_memory / 2**20, 1),
+        "budget_rows": max_rows,
+        **sample,
+    }
+    return df, sample
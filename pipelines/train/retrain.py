@@ -0,0 +1,308 @@
+import argparse
+import copy
+import json
+import os
+import pickle
+import time
+from datetime import datetime
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import brier_score_loss, mean_absolute_error, mean_pinball_loss
+from sklearn.preprocessing import OrdinalEncoder
+from xgboost import XGBRegressor
+
+from app.publish import publish_models
+from pipelines.features.store import attach_aggregates, load_features
+from pipelines.train import train_conversion_model as conversion
+from pipelines.train import train_price_model as price
+from pipelines.train.categorical import update_vocabulary
+from pipelines.train.out_of_core import holdout_mask, source_columns
+from pipelines.train.state import feature_partitions, read_training_state, record_training_state
+from pipelines.train.tuned_params import load_tuned_params
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "models")
+REPORTS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
+TRIGGER_PATH = os.path.join(REPORTS_DIR, "retrain_required.json")
+LOG_PATH = os.path.join(REPORTS_DIR, "retrain_log.json")
+
+PRICE_ARTIFACTS = ["price_model", "price_q10", "price_q90", "price_quantiles"]
+# Boosting rounds added to each XGBoost model per retrain
+WARM_START_ROUNDS = 30
+# Months of history used by models that cannot warm-start and are refitted instead
+WINDOW_MONTHS = 12
+# A candidate is published if its error on recent data is at most this much worse
+TOLERANCE = 0.01
+
+
+def read_trigger(path=TRIGGER_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        trigger = json.load(f)
+    return trigger if trigger.get("retrain") else None
+
+
+def _load_artifact(name):
+    path = os.path.join(MODEL_DIR, f"{name}.pkl")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _quantile_levels(model):
+    """Quantiles an XGBoost, HistGradientBoosting or GradientBoosting model predicts."""
+    params = model.get_params()
+    if params.get("quantile_alpha") is not None:
+        return np.atleast_1d(params["quantile_alpha"])
+    if params.get("loss") == "quantile":
+        return np.atleast_1d(params.get("quantile", params.get("alpha")))
+    return None
+
+
+def _price_error(pipeline, X, y):
+    """MAE for the point model, mean pinball loss over its quantiles otherwise."""
+    predictions = pipeline.predict(X)
+    levels = _quantile_levels(pipeline.named_steps["model"])
+    if levels is None:
+        return float(mean_absolute_error(y, predictions))
+    predictions = predictions.reshape(len(X), len(levels))
+    return float(
+        np.mean([mean_pinball_loss(y, predictions[:, i], alpha=a) for i, a in enumerate(levels)])
+    )
+
+
+def _warm_start(pipeline, X_new, y_new, X_window, y_window):
+    """
+    Continue an XGBoost booster with WARM_START_ROUNDS rounds on the new rows only,
+    keeping the incumbent's fitted preprocessor. Other estimators cannot continue
+    training, so they are refitted on the recent window instead.
+    """
+    candidate = copy.deepcopy(pipeline)
+    preprocessor = candidate.named_steps["preprocessor"]
+    model = candidate.named_steps["model"]
+    if isinstance(model, XGBRegressor):
+        model.set_params(n_estimators=WARM_START_ROUNDS)
+        model.fit(
+            preprocessor.transform(X_new),
+            y_new,
+            xgb_model=pipeline.named_steps["model"].get_booster(),
+        )
+        return candidate, "warm_start", len(X_new)
+    candidate.steps[-1] = ("model", clone(model).fit(preprocessor.transform(X_window), y_window))
+    return candidate, "window_refit", len(X_window)
+
+
+def _categorical_mode(calibrated_model):
+    preprocessor = calibrated_model.calibrated_classifiers_[0].estimator.named_steps["preprocessor"]
+    encoder = preprocessor.named_transformers_["cat"]
+    return "native" if isinstance(encoder, OrdinalEncoder) else "onehot"
+
+
+def _timed(fn, *args):
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = fn(*args)
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def retrain(force=False, tolerance=TOLERANCE):
+    """
+    Act on reports/retrain_required.json: warm-start the price models on feature
+    partitions they have not seen, refit the conversion model on the recent window,
+    validate each candidate group against the incumbent on held-out rows of the new
+    months and atomically publish the groups that are no worse.
+    """
+    trigger = read_trigger()
+    if trigger is None and not force:
+        print("No retrain required.")
+        return
+    reasons = trigger.get("reasons", ["unspecified"]) if trigger else ["forced"]
+
+    state = read_training_state()
+    if "price" not in state or "conversion" not in state:
+        print("No training state recorded, run `make train` for a full fit first.")
+        return
+
+    run_start, run_cpu = time.perf_counter(), time.process_time()
+    partitions = feature_partitions()
+    months = sorted(partitions)
+    new_months = sorted(m for m in months if state["price"]["months"].get(m) != partitions[m])
+    window_months = months[-WINDOW_MONTHS:]
+    first_month = min(window_months + new_months) if months else None
+    print(f"Retraining for: {'; '.join(reasons)}")
+    print(f"New or changed partitions: {new_months or 'none'}")
+    if first_month is None:
+        print("Features not built, run build_features.py first!")
+        return
+
+    columns = source_columns(
+        list(dict.fromkeys(price.FEATURES + conversion.FEATURES + ["sale_price", "enquiry_id"]))
+    )
+    df = attach_aggregates(load_features(f"{first_month}-01", None, columns=columns))
+    df["won"] = df["won"].fillna(0).astype(int)
+    month = df["enquiry_date"].dt.strftime("%Y-%m")
+    holdout = holdout_mask(df["enquiry_id"])
+    # Validation: held-out rows of the new partitions (or of the newest month if none)
+    recent = month.isin(new_months or months[-1:]).to_numpy() & holdout
+    train = ~holdout
+    window = month.isin(window_months).to_numpy()
+
+    log = {"retrained_at": datetime.now().isoformat(), "reasons": reasons, "new_months": new_months}
+    published, groups = {}, {}
+
+    # Price models: continue boosting on the new months' won rows
+    won = (df["won"] == 1).to_numpy()
+    new_rows = month.isin(new_months).to_numpy() & train & won
+    window_rows = window & train & won
+    val = recent & won
+    candidates, results = {}, {}
+    group_start, group_cpu = time.perf_counter(), time.process_time()
+    for name in PRICE_ARTIFACTS:
+        incumbent = _load_artifact(name)
+        if incumbent is None:
+            continue
+        if not new_rows.any() and isinstance(incumbent.named_steps["model"], XGBRegressor):
+            results[name] = {"strategy": "skipped", "reason": "no new partitions"}
+            continue
+        (candidate, strategy, rows), wall, cpu = _timed(
+            _warm_start,
+            incumbent,
+            df.loc[new_rows, price.FEATURES],
+            df.loc[new_rows, price.TARGET],
+            df.loc[window_rows, price.FEATURES],
+            df.loc[window_rows, price.TARGET],
+        )
+        X_val, y_val = df.loc[val, price.FEATURES], df.loc[val, price.TARGET]
+        results[name] = {
+            "strategy": strategy,
+            "training_rows": rows,
+            "wall_s": round(wall, 3),
+            "cpu_s": round(cpu, 3),
+            "incumbent_error": round(_price_error(incumbent, X_val, y_val), 3),
+            "candidate_error": round(_price_error(candidate, X_val, y_val), 3),
+        }
+        candidates[name] = candidate
+    groups["price"] = (
+        candidates,
+        results,
+        time.perf_counter() - group_start,
+        time.process_time() - group_cpu,
+    )
+
+    # Conversion model: calibrated HistGradientBoosting cannot warm-start; refit it
+    # from scratch on the recent window
+    group_start, group_cpu = time.perf_counter(), time.process_time()
+    incumbent = _load_artifact("conversion_model")
+    candidates, results = {}, {}
+    if incumbent is not None:
+        mode = _categorical_mode(incumbent)
+        fit_rows = window & train
+        vocab = update_vocabulary(df[fit_rows]) if mode == "native" else None
+        candidate, wall, cpu = _timed(
+            conversion.fit_conversion_model,
+            df.loc[fit_rows, conversion.FEATURES],
+            df.loc[fit_rows, conversion.TARGET],
+            mode,
+            vocab,
+            load_tuned_params("conversion_model"),
+        )
+        X_val, y_val = df.loc[recent, conversion.FEATURES], df.loc[recent, conversion.TARGET]
+        results["conversion_model"] = {
+            "strategy": "window_refit",
+            "training_rows": int(fit_rows.sum()),
+            "wall_s": round(wall, 3),
+            "cpu_s": round(cpu, 3),
+            "incumbent_error": round(
+                float(brier_score_loss(y_val, incumbent.predict_proba(X_val)[:, 1])), 4
+            ),
+            "candidate_error": round(
+                float(brier_score_loss(y_val, candidate.predict_proba(X_val)[:, 1])), 4
+            ),
+        }
+        candidates["conversion_model"] = candidate
+    groups["conversion"] = (
+        candidates,
+        results,
+        time.perf_counter() - group_start,
+        time.process_time() - group_cpu,
+    )
+
+    log["groups"] = {}
+    for group, (candidates, results, wall, cpu) in groups.items():
+        # A group is published whole so its artifacts stay consistent with each other
+        passed = bool(candidates) and all(
+            r["candidate_error"] <= r["incumbent_error"] * (1 + tolerance)
+            for r in results.values()
+            if "candidate_error" in r
+        )
+        if passed:
+            publish_models(candidates, MODEL_DIR)
+            published[group] = sorted(candidates)
+            if group == "price":
+                record_training_state(group, {m: partitions[m] for m in new_months})
+            else:
+                record_training_state(
+                    group, {m: partitions[m] for m in window_months}, replace=True
+                )
+
+        full = state[group].get("full_retrain", {})
+        log["groups"][group] = {
+            "published": passed,
+            "models": results,
+            "wall_s": round(wall, 3),
+            "cpu_s": round(cpu, 3),
+            "full_retrain": full,
+            "speedup_vs_full": round(full["wall_s"] / wall, 2) if full and wall else None,
+        }
+        print(
+            f"{group}: {'published' if passed else 'kept incumbent'} "
+            f"({wall:.1f}s vs {full.get('wall_s', '?')}s full retrain)"
+        )
+
+    log["wall_s"] = round(time.perf_counter() - run_start, 3)
+    log["cpu_s"] = round(time.process_time() - run_cpu, 3)
+
+    history = []
+    if os.path.exists(LOG_PATH):
+        with open(LOG_PATH, "r") as f:
+            history = json.load(f)
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    with open(LOG_PATH, "w") as f:
+        json.dump(history + [log], f, indent=2)
+
+    # Mark the trigger handled so the same alert is not acted on twice
+    with open(TRIGGER_PATH, "w") as f:
+        json.dump(
+            {
+                "retrain": False,
+                "reasons": reasons,
+                "handled_at": log["retrained_at"],
+                # The reports it was raised from, so alerts do not raise it again
+                "sources": trigger.get("sources") if trigger else None,
+                "published": published,
+            },
+            f,
+            indent=2,
+        )
+
+    print(f"Retrain finished in {log['wall_s']:.1f}s, log written to {os.path.abspath(LOG_PATH)}")
+    if published:
+        print("POST /reload to a single-worker API, or restart it, to serve the new models.")
+    return log
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrain models when a retrain is required")
+    parser.add_argument(
+        "--force", action="store_true", help="Retrain even without retrain_required.json"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="Relative error increase on recent data still accepted for a candidate",
+    )
+    args = parser.parse_args()
+
+    retrain(force=args.force, tolerance=args.tolerance)
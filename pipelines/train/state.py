@@ -0,0 +1,49 @@
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from pipelines.features.store import FEATURES_DIR, read_manifest
+
+STATE_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "models", "training_state.json")
+
+
+def feature_partitions(start=None, end=None, features_dir=FEATURES_DIR):
+    """Fingerprint of each built month partition within [start, end]."""
+    first = pd.Timestamp(start).strftime("%Y-%m") if start is not None else None
+    last = pd.Timestamp(end).strftime("%Y-%m") if end is not None else None
+    return {
+        month: partition["fingerprint"]
+        for month, partition in read_manifest(features_dir)["partitions"].items()
+        if (first is None or month >= first) and (last is None or month <= last)
+    }
+
+
+def read_training_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def record_training_state(group, partitions, full_retrain=None, replace=False, path=STATE_PATH):
+    """
+    Record which feature partitions the published `group` ("price" or "conversion")
+    models have seen, so retrain.py can tell new partitions from old ones. Full
+    trainers also pass `full_retrain` (their wall and CPU seconds), the cost that
+    incremental retrains are compared against.
+    """
+    state = read_training_state(path)
+    entry = state.get(group, {})
+    # A refit from scratch has seen exactly its own range; a warm start adds to it
+    entry["months"] = partitions if replace else {**entry.get("months", {}), **partitions}
+    if full_retrain is not None:
+        entry["full_retrain"] = full_retrain
+    entry["trained_at"] = datetime.now().isoformat()
+    state[group] = entry
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
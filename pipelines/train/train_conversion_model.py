@@ -1,102 +1,195 @@
+import argparse
 import os
-import pickle
-import pandas as pd
-from sklearn.model_selection import train_test_split
+import json
+from datetime import datetime
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder
 from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.calibration import CalibratedClassifierCV
 from sklearn.metrics import roc_auc_score, brier_score_loss
-
-
-def train_conversion_model():
-    print("Loading data for advanced conversion model...")
-    # Read from features if available, else fallback
-    features_path = os.path.join(os.path.dirname(__file__), "..", "..", "data", "features.parquet")
-    if os.path.exists(features_path):
-        df = pd.read_parquet(features_path)
-    else:
-        print("Features not built, run build_features.py first!")
-        return
-
-    df["won"] = df["won"].fillna(0).astype(int)
-
-    features = [
-        "make",
-        "fuel_type",
-        "body_type",
-        "channel",
-        "vehicle_age",
-        "mileage",
-        "offer_price",
-        "damage_severity_score",
-        "risk_score",
-        "month_sin",
-        "month_cos",
-    ]
-    target = "won"
-
-    X = df[features]
-    y = df[target]
-
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    categorical_features = ["make", "fuel_type", "body_type", "channel"]
-    numeric_features = [
-        "vehicle_age",
-        "mileage",
-        "offer_price",
-        "damage_severity_score",
-        "risk_score",
-        "month_sin",
-        "month_cos",
-    ]
-
-    preprocessor = ColumnTransformer(
+from app.publish import publish_models
+from pipelines.features.store import attach_aggregates
+from pipelines.profiling import Profiler
+from pipelines.train.categorical import (
+    CATEGORICAL_FEATURES,
+    categorical_encoder,
+    feature_types,
+    update_vocabulary,
+)
+from pipelines.train.out_of_core import (
+    holdout_mask,
+    load_training_frame,
+    parse_memory,
+    source_columns,
+)
+from pipelines.train.state import feature_partitions, record_training_state
+from pipelines.train.tuned_params import load_tuned_params
+
+NUMERIC_FEATURES = [
+    "vehicle_age",
+    "mileage",
+    "offer_price",
+    "damage_severity_score",
+    "risk_score",
+    "month_sin",
+    "month_cos",
+    "agg_win_rate",
+    "agg_sale_to_offer",
+]
+FEATURES = CATEGORICAL_FEATURES + NUMERIC_FEATURES
+TARGET = "won"
+
+
+def build_preprocessor(categorical="onehot", vocab=None):
+    return ColumnTransformer(
         transformers=[
-            ("num", "passthrough", numeric_features),  # HistGradientBoosting handles unscaled
-            (
-                "cat",
-                OneHotEncoder(handle_unknown="ignore", sparse_output=False),
-                categorical_features,
-            ),
+            ("num", "passthrough", NUMERIC_FEATURES),  # HistGradientBoosting handles unscaled
+            ("cat", categorical_encoder(categorical, vocab), CATEGORICAL_FEATURES),
         ]
     )
 
-    print("Training HistGradientBoostingClassifier with Calibration...")
+
+def conversion_estimator(types=None, params=None):
+    """`params` (e.g. from tune.py) override the default hyperparameters."""
+    defaults = {"max_iter": 200, "learning_rate": 0.05}
+    return HistGradientBoostingClassifier(
+        **{**defaults, **(params or {})},
+        random_state=42,
+        early_stopping=True,
+        validation_fraction=0.1,
+        categorical_features=[t == "c" for t in types] if types else "from_dtype",
+    )
+
+
+def fit_conversion_model(X_train, y_train, categorical="native", vocab=None, params=None):
+    """Fit the isotonic-calibrated preprocessor -> HistGradientBoosting pipeline."""
+    types = feature_types(len(NUMERIC_FEATURES), categorical)
     base_model = Pipeline(
         steps=[
-            ("preprocessor", preprocessor),
-            (
-                "model",
-                HistGradientBoostingClassifier(
-                    max_iter=200,
-                    learning_rate=0.05,
-                    random_state=42,
-                    early_stopping=True,
-                    validation_fraction=0.1,
-                ),
-            ),
+            ("preprocessor", build_preprocessor(categorical, vocab)),
+            ("model", conversion_estimator(types, params)),
         ]
     )
-
     calibrated_model = CalibratedClassifierCV(estimator=base_model, method="isotonic", cv=3)
-    calibrated_model.fit(X_train, y_train)
+    return calibrated_model.fit(X_train, y_train)
 
-    y_pred_prob = calibrated_model.predict_proba(X_test)[:, 1]
 
-    print(f"Conversion Model ROC AUC: {roc_auc_score(y_test, y_pred_prob):.3f}")
-    print(f"Conversion Model Brier Score: {brier_score_loss(y_test, y_pred_prob):.3f}")
+def train_conversion_model(
+    start=None, end=None, categorical="native", max_memory=None, use_tuned=True, flamegraph=False
+):
+    profiler = Profiler(
+        "train_conversion_model",
+        config={"categorical": categorical, "max_memory": max_memory},
+        flamegraph=flamegraph,
+    )
+    print("Loading data for advanced conversion model...")
+    with profiler.stage("load"):
+        # With a memory budget, a won/channel-stratified sample sized to fit is streamed in
+        df, sample = load_training_frame(
+            start, end, source_columns(FEATURES + ["enquiry_id"]), max_memory
+        )
+        if df is None:
+            print("Features not built, run build_features.py first!")
+            return
+        df = attach_aggregates(df)
+    print(f"Training frame: {sample['sample_rows']} of {sample['population_rows']} rows")
+
+    df["won"] = df["won"].fillna(0).astype(int)
+
+    X = df[FEATURES]
+    y = df[TARGET]
+
+    # The same hash holdout as the price models, so backtests only see unseen enquiries
+    holdout = holdout_mask(df["enquiry_id"])
+    X_train, X_test, y_train, y_test = X[~holdout], X[holdout], y[~holdout], y[holdout]
+
+    vocab = update_vocabulary(df) if categorical == "native" else None
+
+    tuned_params = load_tuned_params("conversion_model") if use_tuned else {}
+    if tuned_params:
+        print(f"Using tuned conversion_model params: {tuned_params}")
+
+    print("Training HistGradientBoostingClassifier with Calibration...")
+    # One stage for all three calibration folds: CalibratedClassifierCV fits them together
+    with profiler.stage("fit_calibrated"):
+        calibrated_model = fit_conversion_model(X_train, y_train, categorical, vocab, tuned_params)
+
+    with profiler.stage("evaluate"):
+        y_pred_prob = calibrated_model.predict_proba(X_test)[:, 1]
+        roc_auc = roc_auc_score(y_test, y_pred_prob)
+        brier = brier_score_loss(y_test, y_pred_prob)
+    print(f"Conversion Model ROC AUC: {roc_auc:.3f}")
+    print(f"Conversion Model Brier Score: {brier:.3f}")
 
     model_dir = os.path.join(os.path.dirname(__file__), "..", "..", "models")
     os.makedirs(model_dir, exist_ok=True)
 
-    with open(os.path.join(model_dir, "conversion_model.pkl"), "wb") as f:
-        pickle.dump(calibrated_model, f)
+    with profiler.stage("save"):
+        publish_models({"conversion_model": calibrated_model}, model_dir)
+
+    profile = profiler.finish()
+    wall_time, cpu_time = profile["wall_s"], profile["cpu_s"]
+    record_training_state(
+        "conversion",
+        feature_partitions(start, end),
+        full_retrain={"wall_s": round(wall_time, 3), "cpu_s": round(cpu_time, 3)},
+        replace=True,
+    )
+
+    reports_dir = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
+    os.makedirs(reports_dir, exist_ok=True)
+    with open(os.path.join(reports_dir, "conversion_training.json"), "w") as f:
+        json.dump(
+            {
+                "trained_at": datetime.now().isoformat(),
+                "training_rows": len(X_train),
+                "categorical": categorical,
+                "tuned_params": tuned_params,
+                "sample": sample,
+                "wall_time_s": round(wall_time, 3),
+                "cpu_time_s": round(cpu_time, 3),
+                "roc_auc": round(float(roc_auc), 3),
+                "brier_score": round(float(brier), 4),
+            },
+            f,
+            indent=2,
+        )
 
     print(f"Saved upgraded conversion model to {os.path.abspath(model_dir)}")
 
 
 if __name__ == "__main__":
-    train_conversion_model()
+    parser = argparse.ArgumentParser(description="Train the conversion model")
+    parser.add_argument("--start", default=None, help="First enquiry date to train on (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last enquiry date to train on (YYYY-MM-DD)")
+    parser.add_argument(
+        "--categorical",
+        choices=["native", "onehot"],
+        default="native",
+        help="native: ordinal codes with categorical splits; onehot: dense one-hot columns",
+    )
+    parser.add_argument(
+        "--max-memory",
+        default=None,
+        help="Memory budget for training data, e.g. 2GB; a stratified sample is drawn to fit",
+    )
+    parser.add_argument(
+        "--ignore-tuned",
+        action="store_true",
+        help="Use the default hyperparameters even if models/tuned_params.json exists",
+    )
+    parser.add_argument(
+        "--flamegraph",
+        action="store_true",
+        help="Sample stacks into reports/flamegraphs/ (collapsed format)",
+    )
+    args = parser.parse_args()
+
+    train_conversion_model(
+        start=args.start,
+        end=args.end,
+        categorical=args.categorical,
+        max_memory=parse_memory(args.max_memory) if args.max_memory else None,
+        use_tuned=not args.ignore_tuned,
+        flamegraph=args.flamegraph,
+    )
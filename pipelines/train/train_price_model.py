@@ -1,113 +1,453 @@
+import argparse
+import math
 import os
-import pickle
-import pandas as pd
-from sklearn.model_selection import train_test_split
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pyarrow.dataset as ds
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.preprocessing import StandardScaler
+from sklearn.impute import SimpleImputer
 from sklearn.metrics import mean_absolute_error
 from xgboost import XGBRegressor
-from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
+from threadpoolctl import threadpool_limits
+from app.publish import publish_models
+from pipelines.features.store import attach_aggregates, count_features, iter_features
+from pipelines.profiling import Profiler
+from pipelines.train.categorical import (
+    CATEGORICAL_FEATURES,
+    categorical_encoder,
+    feature_types,
+    update_vocabulary,
+)
+from pipelines.train.out_of_core import (
+    holdout_mask,
+    load_training_frame,
+    parse_memory,
+    source_columns,
+)
+from pipelines.train.state import feature_partitions, record_training_state
+from pipelines.train.tuned_params import load_tuned_params
 
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "cache", "price")
 
-def train_price_models():
-    print("Loading data for advanced price models...")
-    features_path = os.path.join(os.path.dirname(__file__), "..", "..", "data", "features.parquet")
-    if os.path.exists(features_path):
-        df = pd.read_parquet(features_path)
-    else:
-        print("Features not built, run build_features.py first!")
-        return
-
-    # Train on won only for price models
-    train_df = df[df["won"] == 1.0].copy()
-
-    features = [
-        "make",
-        "fuel_type",
-        "body_type",
-        "channel",
-        "vehicle_age",
-        "mileage",
-        "damage_severity_score",
-        "risk_score",
-    ]
-    target = "sale_price"
+NUMERIC_FEATURES = [
+    "vehicle_age",
+    "mileage",
+    "damage_severity_score",
+    "risk_score",
+    "agg_win_rate",
+    "agg_sale_to_offer",
+]
+FEATURES = CATEGORICAL_FEATURES + NUMERIC_FEATURES
+TARGET = "sale_price"
+# Output columns of the multi-quantile model, in order
+QUANTILE_LEVELS = [0.10, 0.50, 0.90]
 
-    X = train_df[features]
-    y = train_df[target]
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    categorical_features = ["make", "fuel_type", "body_type", "channel"]
-    numeric_features = ["vehicle_age", "mileage", "damage_severity_score", "risk_score"]
-
-    preprocessor = ColumnTransformer(
+def build_preprocessor(categorical="onehot", vocab=None):
+    return ColumnTransformer(
         transformers=[
-            ("num", StandardScaler(), numeric_features),
             (
-                "cat",
-                OneHotEncoder(handle_unknown="ignore", sparse_output=False),
-                categorical_features,
+                "num",
+                # Aggregates are missing for keys/months with no prior history
+                Pipeline(
+                    [("impute", SimpleImputer(strategy="median")), ("scale", StandardScaler())]
+                ),
+                NUMERIC_FEATURES,
             ),
+            ("cat", categorical_encoder(categorical, vocab), CATEGORICAL_FEATURES),
         ]
     )
 
-    print("Training Upgraded XGBRegressor...")
-    price_model = Pipeline(
-        steps=[
-            ("preprocessor", preprocessor),
-            (
-                "model",
-                XGBRegressor(n_estimators=150, learning_rate=0.05, max_depth=5, random_state=42),
-            ),
-        ]
+
+def price_estimator(types=None, params=None):
+    """Point-estimate XGBoost model; `params` (e.g. from tune.py) override the defaults."""
+    defaults = {"n_estimators": 150, "learning_rate": 0.05, "max_depth": 5}
+    return XGBRegressor(
+        **{**defaults, **(params or {})},
+        random_state=42,
+        enable_categorical=types is not None,
+        feature_types=types,
     )
-    price_model.fit(X_train, y_train)
 
-    y_pred = price_model.predict(X_test)
-    print(f"Point Estimate MAE: {mean_absolute_error(y_test, y_pred):.2f}")
 
-    print("Training QuantileRegressor (q=0.10)...")
-    q10_model = Pipeline(
-        steps=[
-            ("preprocessor", preprocessor),
-            (
-                "model",
-                GradientBoostingRegressor(
-                    loss="quantile", alpha=0.10, n_estimators=100, random_state=42
-                ),
-            ),
-        ]
+def quantile_estimator(alpha, engine="xgb", types=None):
+    """
+    Quantile regressor for the price bounds.
+
+    "xgb" (XGBoost's quantile objective) and "hist" (sklearn) bin features once and are
+    multi-threaded, so they scale far better with rows than the exact "gbr" engine.
+    "xgb" is also the quickest to predict a single row; see benchmark_quantile.py.
+
+    `types` marks natively categorical columns (see categorical.feature_types).
+    """
+    if engine == "xgb":
+        return XGBRegressor(
+            objective="reg:quantileerror",
+            quantile_alpha=alpha,
+            n_estimators=100,
+            learning_rate=0.1,
+            max_depth=3,
+            random_state=42,
+            enable_categorical=types is not None,
+            feature_types=types,
+        )
+    if engine == "gbr":
+        return GradientBoostingRegressor(
+            loss="quantile", alpha=alpha, n_estimators=100, random_state=42
+        )
+    return HistGradientBoostingRegressor(
+        loss="quantile",
+        quantile=alpha,
+        max_iter=100,
+        early_stopping=False,
+        random_state=42,
+        categorical_features=[t == "c" for t in types] if types else "from_dtype",
     )
-    q10_model.fit(X_train, y_train)
 
-    print("Training QuantileRegressor (q=0.90)...")
-    q90_model = Pipeline(
-        steps=[
-            ("preprocessor", preprocessor),
-            (
-                "model",
-                GradientBoostingRegressor(
-                    loss="quantile", alpha=0.90, n_estimators=100, random_state=42
-                ),
-            ),
-        ]
+
+def multi_quantile_estimator(types=None):
+    """
+    One booster predicting every QUANTILE_LEVELS column, so serving gets q10/q50/q90
+    from a single predict call instead of one model per quantile. Serving takes q10 and
+    the interval from it; E(sale) stays with the mean `price_model`.
+    """
+    return XGBRegressor(
+        objective="reg:quantileerror",
+        quantile_alpha=np.array(QUANTILE_LEVELS),
+        n_estimators=100,
+        learning_rate=0.1,
+        max_depth=3,
+        random_state=42,
+        enable_categorical=types is not None,
+        feature_types=types,
     )
-    q90_model.fit(X_train, y_train)
+
+
+def _fit_model(name, model, X_path, y_path, threads=None):
+    """
+    Fit one estimator on the cached, already-preprocessed design matrix, on at most
+    `threads` threads so parallel fits share the cores instead of oversubscribing them.
+    """
+    X = np.load(X_path, mmap_mode="r")
+    y = np.load(y_path, mmap_mode="r")
+    params = model.get_params()
+    if threads and "n_jobs" in params:
+        model.set_params(n_jobs=threads)
+    wall, cpu = time.perf_counter(), time.process_time()
+    # Caps OpenMP/BLAS pools too, e.g. HistGradientBoostingRegressor's
+    with threadpool_limits(limits=threads):
+        model.fit(X, y)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    if "n_jobs" in params:
+        # Served models keep their default threading
+        model.set_params(n_jobs=params["n_jobs"])
+    return name, model, wall, cpu
+
+
+def _tree_shares(n_estimators, n_chunks):
+    """Trees boosted per chunk: an even split, the first `n_estimators % n_chunks` one more."""
+    per_chunk, extra = divmod(n_estimators, n_chunks)
+    return [per_chunk + (i < extra) for i in range(n_chunks)]
+
+
+def _fit_incremental(estimators, preprocessor, start, end, columns, chunk_rows):
+    """
+    Boost every model over all won rows, one memory-sized chunk at a time.
+
+    Each chunk continues the previous chunk's booster (`xgb_model`) with its share of
+    the trees, so the finished models have as many trees as a single fit. Chunks hold
+    at least `chunk_rows` rows, so there can be fewer than counted: the trees of the
+    chunks that never came are boosted on the last one.
+    """
+    won = ds.field("won") == 1
+    n_chunks = max(1, math.ceil(count_features(start, end, where=won) / chunk_rows))
+    shares = {
+        name: _tree_shares(model.n_estimators, n_chunks) for name, model in estimators.items()
+    }
+    model_timings = {name: {"wall_s": 0.0, "cpu_s": 0.0} for name in estimators}
+
+    def boost(Xt, y, trees, first):
+        for name, model in estimators.items():
+            if not trees[name]:
+                continue
+            wall, cpu = time.perf_counter(), time.process_time()
+            model.set_params(n_estimators=trees[name])
+            model.fit(Xt, y, xgb_model=None if first else model.get_booster())
+            model_timings[name]["wall_s"] += time.perf_counter() - wall
+            model_timings[name]["cpu_s"] += time.process_time() - cpu
+
+    chunks = 0
+    for chunk in iter_features(start, end, columns, batch_rows=chunk_rows, where=won):
+        chunk = attach_aggregates(chunk)
+        chunk = chunk[~holdout_mask(chunk["enquiry_id"])]
+        Xt = np.ascontiguousarray(preprocessor.transform(chunk[FEATURES]), dtype=np.float32)
+        y = chunk[TARGET].to_numpy(dtype=np.float32)
+        boost(
+            Xt,
+            y,
+            {name: sum(share[chunks : chunks + 1]) for name, share in shares.items()},
+            not chunks,
+        )
+        chunks += 1
+        print(f"Boosted chunk {chunks}/{n_chunks} ({len(chunk)} rows)")
+    if 0 < chunks < n_chunks:
+        boost(Xt, y, {name: sum(share[chunks:]) for name, share in shares.items()}, False)
+
+    model_timings = {
+        name: {key: round(value, 3) for key, value in t.items()}
+        for name, t in model_timings.items()
+    }
+    return estimators, model_timings, chunks
+
+
+def train_price_models(
+    start=None,
+    end=None,
+    n_jobs=3,
+    quantile_engine="xgb",
+    multi_quantile=False,
+    categorical="native",
+    max_memory=None,
+    incremental=False,
+    use_tuned=True,
+    flamegraph=False,
+):
+    """
+    Train the point and quantile price models.
+
+    With `max_memory` (bytes) the training frame is a stratified sample sized to the
+    budget; with `incremental` as well, XGBoost models are then boosted over every won
+    row in budget-sized chunks, using the sample only to fit the preprocessor and
+    evaluate.
+
+    Per-stage wall time, CPU time and peak RSS go to reports/training_profile.json.
+    """
+    if quantile_engine == "gbr" and categorical == "native":
+        print("The gbr engine has no native categorical support, use --categorical onehot")
+        return
+    if incremental and (max_memory is None or quantile_engine != "xgb"):
+        print("Incremental training needs --max-memory and the xgb quantile engine")
+        return
+
+    profiler = Profiler(
+        "train_price_model",
+        config={
+            "quantile_engine": quantile_engine,
+            "multi_quantile": multi_quantile,
+            "categorical": categorical,
+            "max_memory": max_memory,
+            "incremental": incremental,
+            "n_jobs": n_jobs,
+        },
+        flamegraph=flamegraph,
+    )
+
+    print("Loading data for advanced price models...")
+    columns = source_columns(FEATURES + [TARGET, "enquiry_id"])
+    with profiler.stage("load"):
+        # Train on won only for price models
+        df, sample = load_training_frame(start, end, columns, max_memory, won_only=True)
+        if df is None:
+            print("Features not built, run build_features.py first!")
+            return
+        df = attach_aggregates(df)
+    print(f"Training frame: {sample['sample_rows']} of {sample['population_rows']} won rows")
+
+    X = df[FEATURES]
+    y = df[TARGET]
+
+    holdout = holdout_mask(df["enquiry_id"])
+    X_train, X_test, y_train, y_test = X[~holdout], X[holdout], y[~holdout], y[holdout]
+
+    # All three models share one design matrix: fit the preprocessor once and cache the
+    # transformed rows on disk so worker processes memory-map them instead of copying
+    with profiler.stage("preprocess"):
+        # Native mode encodes categories as ordinal codes from the shared, append-only
+        # vocabulary instead of one dense column per make/fuel/body/channel value
+        vocab = update_vocabulary(df) if categorical == "native" else None
+        types = feature_types(len(NUMERIC_FEATURES), categorical)
+        preprocessor = build_preprocessor(categorical, vocab)
+
+        Xt_train = preprocessor.fit_transform(X_train)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        X_path = os.path.join(CACHE_DIR, "X_train.npy")
+        y_path = os.path.join(CACHE_DIR, "y_train.npy")
+        np.save(X_path, np.ascontiguousarray(Xt_train, dtype=np.float32))
+        np.save(y_path, y_train.to_numpy(dtype=np.float32))
+
+    tuned_params = load_tuned_params("price_model") if use_tuned else {}
+    if tuned_params:
+        print(f"Using tuned price_model params: {tuned_params}")
+
+    estimators = {
+        "price_model": price_estimator(types, tuned_params),
+        "price_q10": quantile_estimator(0.10, quantile_engine, types),
+        "price_q90": quantile_estimator(0.90, quantile_engine, types),
+    }
+    if multi_quantile:
+        estimators["price_quantiles"] = multi_quantile_estimator(types)
+
+    chunks = None
+    if incremental:
+        print("Boosting price models incrementally over streamed chunks...")
+        with profiler.stage("fit_incremental"):
+            fitted, model_timings, chunks = _fit_incremental(
+                estimators, preprocessor, start, end, columns, sample["budget_rows"]
+            )
+    else:
+        print(f"Training XGBRegressor and q10/q90 {quantile_engine} quantile models in parallel...")
+        fitted, model_timings = {}, {}
+        workers = min(n_jobs, len(estimators))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with (
+            profiler.stage("fit_parallel"),
+            ProcessPoolExecutor(max_workers=workers) as pool,
+        ):
+            futures = [
+                pool.submit(_fit_model, name, estimator, X_path, y_path, threads)
+                for name, estimator in estimators.items()
+            ]
+            for future in futures:
+                name, model, wall, cpu = future.result()
+                fitted[name] = model
+                model_timings[name] = {"wall_s": round(wall, 3), "cpu_s": round(cpu, 3)}
+    # Each model's own fit, measured in whichever process ran it
+    for name, t in model_timings.items():
+        profiler.add_stage(f"fit:{name}", t["wall_s"], t["cpu_s"])
+
+    # Reassemble the same preprocessor -> model pipelines the API has always loaded
+    pipelines = {
+        name: Pipeline(steps=[("preprocessor", preprocessor), ("model", model)])
+        for name, model in fitted.items()
+    }
+
+    with profiler.stage("evaluate"):
+        y_pred = pipelines["price_model"].predict(X_test)
+        mae = mean_absolute_error(y_test, y_pred)
+        if multi_quantile:
+            coverage = (
+                y_test.to_numpy()[:, None] <= pipelines["price_quantiles"].predict(X_test)
+            ).mean(axis=0)
+    print(f"Point Estimate MAE: {mae:.2f}")
+    if multi_quantile:
+        print(
+            "Multi-quantile coverage: "
+            + ", ".join(f"q{int(q * 100)} {c:.2f}" for q, c in zip(QUANTILE_LEVELS, coverage))
+        )
 
     model_dir = os.path.join(os.path.dirname(__file__), "..", "..", "models")
     os.makedirs(model_dir, exist_ok=True)
+    with profiler.stage("save"):
+        # The API serves price_quantiles whenever it exists: drop one left by an
+        # earlier --multi-quantile run rather than serve it beside newer models
+        publish_models(pipelines, model_dir, remove=[] if multi_quantile else ["price_quantiles"])
 
-    with open(os.path.join(model_dir, "price_model.pkl"), "wb") as f:
-        pickle.dump(price_model, f)
-    with open(os.path.join(model_dir, "price_q10.pkl"), "wb") as f:
-        pickle.dump(q10_model, f)
-    with open(os.path.join(model_dir, "price_q90.pkl"), "wb") as f:
-        pickle.dump(q90_model, f)
+    # The profiler's CPU time includes the fit workers once the pool has shut down
+    profile = profiler.finish()
+    wall_time, cpu_time = profile["wall_s"], profile["cpu_s"]
+    record_training_state(
+        "price",
+        feature_partitions(start, end),
+        full_retrain={"wall_s": round(wall_time, 3), "cpu_s": round(cpu_time, 3)},
+        replace=True,
+    )
+
+    reports_dir = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
+    os.makedirs(reports_dir, exist_ok=True)
+    with open(os.path.join(reports_dir, "price_training_timing.json"), "w") as f:
+        json.dump(
+            {
+                "trained_at": datetime.now().isoformat(),
+                "training_rows": len(X_train),
+                "design_matrix_shape": list(Xt_train.shape),
+                "n_jobs": n_jobs,
+                "quantile_engine": quantile_engine,
+                "categorical": categorical,
+                "tuned_params": tuned_params,
+                # Rows actually trained on versus available, per won/channel stratum
+                "sample": sample,
+                "incremental_chunks": chunks,
+                "wall_time_s": round(wall_time, 3),
+                "cpu_time_s": round(cpu_time, 3),
+                "stages_s": {
+                    name: stage["wall_s"]
+                    for name, stage in profile["stages"].items()
+                    if not stage.get("worker")
+                },
+                "models": model_timings,
+                # What the three fits would have cost back to back
+                "sequential_fit_s": round(sum(m["wall_s"] for m in model_timings.values()), 3),
+                "price_mae": round(float(mae), 2),
+            },
+            f,
+            indent=2,
+        )
 
     print(f"Saved upgraded price models to {os.path.abspath(model_dir)}")
 
 
 if __name__ == "__main__":
-    train_price_models()
+    parser = argparse.ArgumentParser(description="Train the sale price models")
+    parser.add_argument("--start", default=None, help="First enquiry date to train on (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last enquiry date to train on (YYYY-MM-DD)")
+    parser.add_argument(
+        "--n-jobs", type=int, default=3, help="Processes used to fit the three models"
+    )
+    parser.add_argument(
+        "--quantile-engine",
+        choices=["xgb", "hist", "gbr"],
+        default="xgb",
+        help="xgb: XGBoost quantile objective, hist: HistGradientBoostingRegressor, "
+        "gbr: exact GradientBoostingRegressor",
+    )
+    parser.add_argument(
+        "--multi-quantile",
+        action="store_true",
+        help="Also train price_quantiles.pkl, serving q10/q50/q90 from one model",
+    )
+    parser.add_argument(
+        "--categorical",
+        choices=["native", "onehot"],
+        default="native",
+        help="native: ordinal codes with categorical splits; onehot: dense one-hot columns",
+    )
+    parser.add_argument(
+        "--max-memory",
+        default=None,
+        help="Memory budget for training data, e.g. 2GB; a stratified sample is drawn to fit",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="With --max-memory, boost over all rows in budget-sized chunks",
+    )
+    parser.add_argument(
+        "--ignore-tuned",
+        action="store_true",
+        help="Use the default hyperparameters even if models/tuned_params.json exists",
+    )
+    parser.add_argument(
+        "--flamegraph",
+        action="store_true",
+        help="Sample the main process's stacks into reports/flamegraphs/ (collapsed format)",
+    )
+    args = parser.parse_args()
+
+    train_price_models(
+        start=args.start,
+        end=args.end,
+        n_jobs=args.n_jobs,
+        quantile_engine=args.quantile_engine,
+        multi_quantile=args.multi_quantile,
+        categorical=args.categorical,
+        max_memory=parse_memory(args.max_memory) if args.max_memory else None,
+        incremental=args.incremental,
+        use_tuned=not args.ignore_tuned,
+        flamegraph=args.flamegraph,
+    )
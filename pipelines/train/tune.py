@@ -0,0 +1,317 @@
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from sklearn.metrics import brier_score_loss, mean_absolute_error
+from sklearn.model_selection import KFold, ParameterSampler, StratifiedKFold
+from threadpoolctl import threadpool_limits
+
+from pipelines.features.store import attach_aggregates
+from pipelines.train import train_conversion_model as conversion
+from pipelines.train import train_price_model as price
+from pipelines.train.categorical import extend_vocabulary, feature_types, load_vocabulary
+from pipelines.train.out_of_core import (
+    holdout_mask,
+    load_training_frame,
+    parse_memory,
+    source_columns,
+)
+from pipelines.train.tuned_params import save_tuned_params
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "cache", "tune")
+
+SEARCH_SPACES = {
+    "price_model": {
+        "n_estimators": [100, 150, 300, 500],
+        "learning_rate": [0.03, 0.05, 0.1, 0.2],
+        "max_depth": [3, 4, 5, 6, 8],
+        "min_child_weight": [1, 5, 20],
+        "subsample": [0.7, 0.85, 1.0],
+    },
+    "conversion_model": {
+        "max_iter": [100, 200, 400],
+        "learning_rate": [0.03, 0.05, 0.1, 0.2],
+        "max_leaf_nodes": [7, 15, 31, 63],
+        "min_samples_leaf": [20, 50, 100],
+        "l2_regularization": [0.0, 0.1, 1.0],
+    },
+}
+# Single-row predictions timed per candidate to estimate serving latency
+LATENCY_ROWS = 50
+
+
+def _cache_folds(model_name, X, y, preprocessor, folds, seed):
+    """
+    Fit the preprocessor once per fold and cache the encoded matrices as .npy files.
+
+    Training rows are saved in shuffled order, so every successive-halving round can
+    memory-map the same file and take a random subset as a prefix.
+    """
+    model_dir = os.path.join(CACHE_DIR, model_name)
+    os.makedirs(model_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    splitter = (
+        StratifiedKFold(folds, shuffle=True, random_state=seed)
+        if model_name == "conversion_model"
+        else KFold(folds, shuffle=True, random_state=seed)
+    )
+    paths = []
+    for k, (train_idx, val_idx) in enumerate(splitter.split(X, y)):
+        train_idx = rng.permutation(train_idx)
+        fold_pre = preprocessor.fit(X.iloc[train_idx])
+        arrays = {
+            "X_train": fold_pre.transform(X.iloc[train_idx]),
+            "y_train": y.iloc[train_idx].to_numpy(),
+            "X_val": fold_pre.transform(X.iloc[val_idx]),
+            "y_val": y.iloc[val_idx].to_numpy(),
+        }
+        fold_paths = {}
+        for name, array in arrays.items():
+            fold_paths[name] = os.path.join(model_dir, f"fold{k}_{name}.npy")
+            np.save(fold_paths[name], np.ascontiguousarray(array, dtype=np.float32))
+        paths.append(fold_paths)
+    return paths
+
+
+def _build(model_name, params, types):
+    if model_name == "price_model":
+        # One thread per fit: parallelism comes from running candidates side by side
+        return price.price_estimator(types, {**params, "n_jobs": 1})
+    return conversion.conversion_estimator(types, params)
+
+
+def _evaluate(model_name, params, types, fold_paths, rows):
+    """Fit one candidate on the first `rows` cached rows of a fold and score it."""
+    X_train = np.load(fold_paths["X_train"], mmap_mode="r")[:rows]
+    y_train = np.load(fold_paths["y_train"], mmap_mode="r")[:rows]
+    X_val = np.load(fold_paths["X_val"], mmap_mode="r")
+    y_val = np.load(fold_paths["y_val"], mmap_mode="r")
+
+    with threadpool_limits(1):
+        model = _build(model_name, params, types)
+        start = time.perf_counter()
+        model.fit(X_train, y_train)
+        fit_s = time.perf_counter() - start
+
+        if model_name == "price_model":
+            error = mean_absolute_error(y_val, model.predict(X_val))
+        else:
+            error = brier_score_loss(y_val, model.predict_proba(X_val)[:, 1])
+
+        timings = []
+        for i in range(min(LATENCY_ROWS, len(X_val))):
+            row = X_val[i : i + 1]
+            start = time.perf_counter()
+            model.predict(row)
+            timings.append(time.perf_counter() - start)
+
+    return float(error), float(np.median(timings) * 1000), fit_s
+
+
+def _rank(results, latency_weight):
+    """
+    Order candidates by error relative to the round's best plus a latency charge:
+    objective = error / best_error + latency_weight * ms_per_row.
+    """
+    best_error = min(r["error"] for r in results)
+    for r in results:
+        r["objective"] = round(
+            r["error"] / best_error + latency_weight * r["latency_ms_per_row"], 4
+        )
+    return sorted(results, key=lambda r: r["objective"])
+
+
+def _n_rounds(n_candidates, factor):
+    """1 + floor(log_factor(n_candidates)), counted in integers to avoid float error."""
+    rounds = 1
+    while factor**rounds <= n_candidates:
+        rounds += 1
+    return rounds
+
+
+def successive_halving(
+    model_name, fold_paths, types, n_rows, n_candidates, factor, latency_weight, n_jobs, seed
+):
+    """
+    Start every candidate on a small row budget and keep the best 1/factor of them
+    for each next round with factor times more rows, until the full data is reached.
+    """
+    candidates = list(
+        ParameterSampler(SEARCH_SPACES[model_name], n_iter=n_candidates, random_state=seed)
+    )
+    n_rounds = _n_rounds(n_candidates, factor)
+    min_rows = max(200, n_rows // factor ** (n_rounds - 1))
+
+    rounds = []
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        for round_idx in range(n_rounds):
+            rows = (
+                n_rows if round_idx == n_rounds - 1 else min(min_rows * factor**round_idx, n_rows)
+            )
+            futures = {
+                (i, k): pool.submit(_evaluate, model_name, params, types, paths, rows)
+                for i, params in enumerate(candidates)
+                for k, paths in enumerate(fold_paths)
+            }
+            results = []
+            for i, params in enumerate(candidates):
+                scores = [futures[(i, k)].result() for k in range(len(fold_paths))]
+                results.append(
+                    {
+                        "params": params,
+                        "error": round(float(np.mean([s[0] for s in scores])), 4),
+                        "latency_ms_per_row": round(float(np.mean([s[1] for s in scores])), 4),
+                        "fit_s": round(float(np.mean([s[2] for s in scores])), 3),
+                    }
+                )
+            ranked = _rank(results, latency_weight)
+            rounds.append({"rows": rows, "candidates": ranked})
+            print(
+                f"{model_name} round {round_idx + 1}/{n_rounds}: {len(candidates)} candidates "
+                f"on {rows} rows, best objective {ranked[0]['objective']}"
+            )
+
+            keep = max(1, math.ceil(len(ranked) / factor))
+            candidates = [r["params"] for r in ranked[:keep]]
+
+    return rounds
+
+
+def tune(
+    models=("price_model", "conversion_model"),
+    start=None,
+    end=None,
+    n_candidates=27,
+    factor=3,
+    folds=3,
+    latency_weight=0.02,
+    n_jobs=None,
+    max_memory=None,
+    seed=42,
+):
+    n_jobs = n_jobs or os.cpu_count()
+    trainers = {"price_model": price, "conversion_model": conversion}
+    winners, report = {}, {}
+
+    for model_name in models:
+        module = trainers[model_name]
+        print(f"Loading data for {model_name} tuning...")
+        df, sample = load_training_frame(
+            start,
+            end,
+            source_columns(module.FEATURES + [module.TARGET, "enquiry_id"]),
+            max_memory,
+            won_only=model_name == "price_model",
+        )
+        if df is None:
+            print("Features not built, run build_features.py first!")
+            return
+        # The hash holdout is the backtests' out-of-sample set: never tune on it
+        df = df[~holdout_mask(df["enquiry_id"])].reset_index(drop=True)
+        df = attach_aggregates(df)
+        if model_name == "conversion_model":
+            df["won"] = df["won"].fillna(0).astype(int)
+
+        vocab = extend_vocabulary(load_vocabulary(), df)
+        types = feature_types(len(module.NUMERIC_FEATURES), "native")
+        fold_paths = _cache_folds(
+            model_name,
+            df[module.FEATURES],
+            df[module.TARGET],
+            module.build_preprocessor("native", vocab),
+            folds,
+            seed,
+        )
+        n_rows = len(np.load(fold_paths[0]["y_train"], mmap_mode="r"))
+
+        start_time = time.perf_counter()
+        rounds = successive_halving(
+            model_name,
+            fold_paths,
+            types,
+            n_rows,
+            n_candidates,
+            factor,
+            latency_weight,
+            n_jobs,
+            seed,
+        )
+        best = rounds[-1]["candidates"][0]
+        winners[model_name] = {
+            "params": best["params"],
+            "cv_error": best["error"],
+            "metric": "mae" if model_name == "price_model" else "brier",
+            "latency_ms_per_row": best["latency_ms_per_row"],
+            "tuned_at": datetime.now().isoformat(),
+        }
+        report[model_name] = {
+            "sample": sample,
+            "wall_time_s": round(time.perf_counter() - start_time, 2),
+            "rounds": rounds,
+        }
+        print(
+            f"Best {model_name}: {best['params']} ({winners[model_name]['metric']} "
+            f"{best['error']}, {best['latency_ms_per_row']} ms/row)"
+        )
+
+    save_tuned_params(winners)
+
+    reports_dir = os.path.join(os.path.dirname(__file__), "..", "..", "reports")
+    os.makedirs(reports_dir, exist_ok=True)
+    with open(os.path.join(reports_dir, "tuning_report.json"), "w") as f:
+        json.dump(
+            {
+                "tuned_at": datetime.now().isoformat(),
+                "n_jobs": n_jobs,
+                "folds": folds,
+                "factor": factor,
+                "latency_weight": latency_weight,
+                "models": report,
+            },
+            f,
+            indent=2,
+        )
+
+    print("Saved tuned_params.json and tuning_report.json")
+    return winners
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the price and conversion models")
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=["price_model", "conversion_model"],
+        default=["price_model", "conversion_model"],
+    )
+    parser.add_argument("--start", default=None, help="First enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Last enquiry date to use (YYYY-MM-DD)")
+    parser.add_argument("--candidates", type=int, default=27, help="Configurations sampled")
+    parser.add_argument("--factor", type=int, default=3, help="Halving factor per round")
+    parser.add_argument("--folds", type=int, default=3, help="Cross-validation folds")
+    parser.add_argument(
+        "--latency-weight",
+        type=float,
+        default=0.02,
+        help="Objective cost per ms of single-row latency, relative to the best error",
+    )
+    parser.add_argument("--n-jobs", type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument("--max-memory", default=None, help="Memory budget for tuning data")
+    args = parser.parse_args()
+
+    tune(
+        models=args.models,
+        start=args.start,
+        end=args.end,
+        n_candidates=args.candidates,
+        factor=args.factor,
+        folds=args.folds,
+        latency_weight=args.latency_weight,
+        n_jobs=args.n_jobs,
+        max_memory=parse_memory(args.max_memory) if args.max_memory else None,
+    )
@@ -0,0 +1,27 @@
+import json
+import os
+
+TUNED_PARAMS_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "models", "tuned_params.json"
+)
+
+
+def load_tuned_params(model_name, path=TUNED_PARAMS_PATH):
+    """Winning hyperparameters from `tune.py` for `model_name`, or {} if never tuned."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f).get(model_name, {}).get("params", {})
+
+
+def save_tuned_params(results, path=TUNED_PARAMS_PATH):
+    """Merge per-model tuning results into the file, keeping models not re-tuned."""
+    tuned = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            tuned = json.load(f)
+    tuned.update(results)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(tuned, f, indent=2)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,50 @@
+import pandas as pd
+
+from app.aggregates import AggregateStore, compute_snapshot
+
+
+def history():
+    return pd.DataFrame(
+        {
+            "make": ["Ford", "Ford", "Ford", "BMW"],
+            "model": ["Focus", "Focus", "Focus", "X5"],
+            "region_id": ["R001"] * 4,
+            "channel": ["dealer"] * 4,
+            "enquiry_date": pd.to_datetime(
+                ["2026-01-05", "2026-01-20", "2026-02-01", "2026-01-10"]
+            ),
+            "won": [1, 0, 1, 1],
+            "offer_price": [5000.0, 5000.0, 5000.0, 20000.0],
+            "sale_price": [6000.0, None, 9000.0, 22000.0],
+        }
+    )
+
+
+def test_snapshot_is_point_in_time():
+    store = compute_snapshot(history(), as_of="2026-02-01", window_days=90)
+
+    # The 2026-02-01 enquiry is on the as-of date, so it must not be counted
+    ford = store.lookup("Ford", "Focus", "R001", "dealer")
+    assert ford["agg_enquiries"] == 2
+    assert 0.0 < ford["agg_win_rate"] < 1.0
+
+
+def test_unknown_key_falls_back_to_defaults(tmp_path):
+    compute_snapshot(history(), as_of="2026-02-01").save(str(tmp_path))
+    store = AggregateStore.load(str(tmp_path))
+
+    unknown = store.lookup("Kia", "Ceed", None, "fleet")
+    assert unknown["agg_enquiries"] == 0
+    assert unknown["agg_win_rate"] == store.defaults[0]
+
+    frame = store.lookup_frame(history())
+    assert frame["agg_enquiries"].tolist() == [2, 2, 2, 1]
+
+
+def test_save_replaces_a_snapshot_in_place(tmp_path):
+    path = str(tmp_path / "aggregates")
+    compute_snapshot(history(), as_of="2026-01-15").save(path)
+    compute_snapshot(history(), as_of="2026-02-15").save(path)
+
+    assert AggregateStore.load(path).as_of.startswith("2026-02-15")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["aggregates"]
@@ -0,0 +1,39 @@
+from functools import partial
+
+from pipelines.monitor import alerts
+from pipelines.monitor.reports import read_report, write_report
+
+
+def test_handled_trigger_is_not_raised_again_by_the_same_reports(tmp_path, monkeypatch):
+    monkeypatch.setattr(alerts, "read_report", partial(read_report, reports_dir=str(tmp_path)))
+    monkeypatch.setattr(alerts, "write_report", partial(write_report, reports_dir=str(tmp_path)))
+    monkeypatch.setattr(alerts, "evaluate_slos", lambda now, rules: {"rules": {}})
+    drift = {
+        "checked_at": "2026-10-01T00:00:00",
+        "features": {"mileage": {"drift_detected": True, "psi": 0.4}},
+    }
+    write_report("drift_report.json", drift, reports_dir=str(tmp_path))
+
+    assert alerts.check_alerts()["retrain"]
+    trigger = read_report("retrain_required.json", reports_dir=str(tmp_path))
+    assert trigger["sources"] == {"drift_report.json": "2026-10-01T00:00:00"}
+
+    # What retrain.py leaves behind once it has acted on the trigger
+    handled = {
+        "retrain": False,
+        "reasons": trigger["reasons"],
+        "handled_at": "2026-10-01T01:00:00",
+        "sources": trigger["sources"],
+    }
+    write_report("retrain_required.json", handled, reports_dir=str(tmp_path))
+    assert not alerts.check_alerts()["retrain"]
+    assert read_report("retrain_required.json", reports_dir=str(tmp_path)) == handled
+
+    # A newer drift check that still sees drift raises it again
+    write_report(
+        "drift_report.json",
+        {**drift, "checked_at": "2026-10-02T00:00:00"},
+        reports_dir=str(tmp_path),
+    )
+    assert alerts.check_alerts()["retrain"]
+    assert read_report("retrain_required.json", reports_dir=str(tmp_path))["retrain"]
@@ -1,4 +1,7 @@
+import numpy as np
+import pandas as pd
 from fastapi.testclient import TestClient
+from app import main
 from app.main import app
 
 client = TestClient(app)
@@ -9,6 +12,14 @@ def test_health():
     assert response.status_code == 200
     assert response.json()["status"] == "ok"
     assert "models" in response.json()
+    assert "dropped" in response.json()["quote_log"]
+
+
+def test_reload():
+    assert client.post("/reload", headers={"X-API-Key": "wrong"}).status_code == 403
+    response = client.post("/reload", headers={"X-API-Key": "default-dev-key"})
+    assert response.status_code == 200
+    assert "price_model" in response.json()["models"]
 
 
 def test_quote_valid():
@@ -37,3 +48,70 @@ def test_quote_invalid():
     payload = {"make": "Ford"}  # Missing lots of fields
     response = client.post("/quote", json=payload, headers={"X-API-Key": "default-dev-key"})
     assert response.status_code == 422
+
+
+def test_quote_batch_respects_budget():
+    vehicle = {
+        "make": "Ford",
+        "model": "Focus",
+        "year": 2019,
+        "mileage": 45000,
+        "fuel_type": "petrol",
+        "channel": "dealer",
+        "damage_flag": False,
+    }
+    payload = {
+        "vehicles": [{**vehicle, "vehicle_id": f"V{i}"} for i in range(5)],
+        "budget": 15000,
+    }
+    response = client.post("/quote/batch", json=payload, headers={"X-API-Key": "default-dev-key"})
+    assert response.status_code == 200
+    data = response.json()
+    assert [q["vehicle_id"] for q in data["quotes"]] == [f"V{i}" for i in range(5)]
+    assert data["feasible"]
+    assert data["expected_spend"] <= 15000 + 1e-6
+    assert data["budget_multiplier"] > 0
+
+
+def test_metrics_counts_requests_by_route():
+    client.get("/health")
+    snapshot = client.get("/metrics").json()
+    requests = sum(
+        minute["timings"].get("/health", {}).get("requests", 0)
+        for minute in snapshot["minutes"].values()
+    )
+    assert requests >= 1
+    assert len(snapshot["latency_bounds_ms"]) > 0
+
+
+def test_failed_dvla_lookup_is_an_upstream_error(monkeypatch):
+    async def fail(reg):
+        return {"status": "error", "upstream_failed": True, "message": "Integration error"}
+
+    monkeypatch.setattr(main, "fetch_dvla_data", fail)
+    response = client.get(
+        "/lookup", params={"reg": "AB12CDE"}, headers={"X-API-Key": "default-dev-key"}
+    )
+    assert response.status_code == 502
+    errors = sum(
+        minute["timings"].get("dvla_upstream", {}).get("errors", 0)
+        for minute in client.get("/metrics").json()["minutes"].values()
+    )
+    assert errors >= 1
+
+
+class _Constant:
+    def __init__(self, value):
+        self.value = np.asarray(value, dtype=float)
+
+    def predict(self, X):
+        return np.tile(self.value, (len(X), 1)) if self.value.ndim else np.full(len(X), self.value)
+
+
+def test_predict_prices_takes_e_sale_from_the_mean_model(monkeypatch):
+    monkeypatch.setitem(main.models, "price_model", _Constant(10500.0))
+    monkeypatch.setitem(main.models, "price_quantiles", _Constant([9500.0, 10000.0, 11000.0]))
+    e_sale, q10, quantiles = main.predict_prices(pd.DataFrame({"x": [1, 2]}))
+    assert e_sale.tolist() == [10500.0, 10500.0]
+    assert q10.tolist() == [9500.0, 9500.0]
+    assert quantiles[:, 1].tolist() == [10000.0, 10000.0]
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from pipelines.train.categorical import categorical_encoder, extend_vocabulary, update_vocabulary
+
+
+def test_vocabulary_is_append_only(tmp_path):
+    path = str(tmp_path / "category_vocab.json")
+    update_vocabulary(pd.DataFrame({"make": ["Ford", "Audi"]}), columns=["make"], path=path)
+    vocab = update_vocabulary(pd.DataFrame({"make": ["BMW", "Ford"]}), columns=["make"], path=path)
+
+    # Existing codes are kept; new values go on the end rather than re-sorting
+    assert vocab["make"] == ["Audi", "Ford", "BMW"]
+
+    encoder = categorical_encoder("native", vocab, columns=["make"])
+    codes = encoder.fit_transform(pd.DataFrame({"make": ["BMW", "Audi", "Trabant"]}))
+    assert codes[:2, 0].tolist() == [2.0, 0.0]
+    assert np.isnan(codes[2, 0])
+
+
+def test_extend_vocabulary_leaves_the_original_alone():
+    vocab = {"make": ["Audi"]}
+    extended = extend_vocabulary(vocab, pd.DataFrame({"make": ["Ford", "Audi"]}), columns=["make"])
+    assert extended["make"] == ["Audi", "Ford"]
+    assert vocab == {"make": ["Audi"]}
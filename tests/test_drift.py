@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2_contingency, ks_2samp
+
+from pipelines.monitor.sketches import DriftSketches, chi2_test, coarsen, ks_statistic, psi
+
+
+def _enquiries(rng, days, mileage_scale=1.0, fleet_share=0.2):
+    n = 400 * len(days)
+    return pd.DataFrame(
+        {
+            "enquiry_date": pd.to_datetime(np.repeat(days, 400)),
+            "mileage": rng.gamma(4.0, 12000.0, n) * mileage_scale,
+            "channel": rng.choice(["dealer", "fleet"], n, p=[1 - fleet_share, fleet_share]).astype(
+                object
+            ),
+        }
+    )
+
+
+def test_sketches_merge_and_match_exact_tests():
+    rng = np.random.default_rng(0)
+    reference = _enquiries(rng, ["2026-01-01", "2026-01-02"])
+    current = _enquiries(rng, ["2026-02-01", "2026-02-02"], mileage_scale=1.3, fleet_share=0.4)
+
+    sketches = DriftSketches.from_reference(
+        reference, numeric=["mileage"], categorical=["channel"], segment_by=["channel"]
+    )
+    assert sketches.segments == ["all", "channel=dealer", "channel=fleet"]
+    sketches.update(reference).update(current.iloc[:500]).update(current.iloc[500:])
+    whole = DriftSketches(**sketches._spec()).update(pd.concat([reference, current]))
+    assert np.array_equal(sketches.keys, whole.keys)
+    assert np.array_equal(sketches.values, whole.values)
+
+    ref_counts, ref_rows = sketches.window("2026-01-01", "2026-01-31")
+    cur_counts, cur_rows = sketches.window("2026-02-01", "2026-02-28")
+    assert ref_rows[0] == cur_rows[0] == 800
+    assert cur_rows[2] == (current["channel"] == "fleet").sum()
+    mileage = sketches.histograms(ref_counts)["mileage"], sketches.histograms(cur_counts)["mileage"]
+
+    # Binned KS is a lower bound on the exact statistic, and close to it on fine bins
+    exact = ks_2samp(reference["mileage"], current["mileage"]).statistic
+    assert exact - 0.03 <= ks_statistic(*mileage)[0] <= exact + 1e-9
+    assert (psi(coarsen(mileage[0]), coarsen(mileage[1])) > 0.1).all()
+
+    channel = sketches.histograms(ref_counts)["channel"], sketches.histograms(cur_counts)["channel"]
+    table = pd.crosstab(
+        np.repeat(["ref", "cur"], 800), pd.concat([reference, current])["channel"].to_numpy()
+    )
+    statistic, p_value = chi2_test(*channel)
+    assert np.isclose(statistic[0], chi2_contingency(table, correction=False).statistic)
+    assert p_value[0] < 0.05
+
+    sketches.drop("2026-02-01", "2026-02-28")
+    assert sketches.window("2026-02-01", "2026-02-28")[1].sum() == 0
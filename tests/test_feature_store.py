@@ -0,0 +1,99 @@
+import pandas as pd
+import pyarrow.dataset as ds
+
+from pipelines.features.build_features import build_features
+from pipelines.features.store import count_features, iter_features, load_features, read_manifest
+
+
+def write_raw(raw_dir, offer_price=5000.0):
+    pd.DataFrame(
+        {"region_id": ["R001"], "name": ["Region 1"], "country": ["UK"], "risk_score": [0.5]}
+    ).to_csv(raw_dir / "regions.csv", index=False)
+    pd.DataFrame(
+        {
+            "vehicle_id": ["V1", "V2", "V3"],
+            "make": ["Ford", "BMW", "Audi"],
+            "model": ["Focus", "3 Series", "A3"],
+            "year": [2019, 2020, 2018],
+            "mileage": [40000, 20000, 70000],
+            "fuel_type": ["petrol", "diesel", "hybrid"],
+            "body_type": ["hatchback", "saloon", "estate"],
+        }
+    ).to_csv(raw_dir / "vehicles.csv", index=False)
+    dates = ["2026-01-10", "2026-02-03", "2026-02-20"]
+    pd.DataFrame(
+        {
+            "enquiry_id": ["E1", "E2", "E3"],
+            "vehicle_id": ["V1", "V2", "V3"],
+            "region_id": ["R001"] * 3,
+            "channel": ["dealer", "private", "fleet"],
+            "damage_flag": [False, True, False],
+            "damage_type": ["none", "dents", "none"],
+            "offer_price": [offer_price, 9000.0, 7000.0],
+            "date": dates,
+        }
+    ).to_csv(raw_dir / "enquiries.csv", index=False)
+    pd.DataFrame(
+        {
+            "enquiry_id": ["E1", "E2", "E3"],
+            "true_market_value": [6000.0, 11000.0, 8000.0],
+            "sale_price": [6100.0, None, 8200.0],
+            "won": [1, 0, 1],
+            "actual_costs": [250.0, 0.0, 250.0],
+            "gross_margin": [850.0, 0.0, 950.0],
+            "date": dates,
+        }
+    ).to_csv(raw_dir / "sales.csv", index=False)
+
+
+def test_only_changed_months_are_rebuilt(tmp_path):
+    features_dir = tmp_path / "features"
+    write_raw(tmp_path)
+
+    assert build_features(raw_dir=tmp_path, features_dir=features_dir) == ["2026-01", "2026-02"]
+    assert build_features(raw_dir=tmp_path, features_dir=features_dir) == []
+
+    # Editing a January enquiry only invalidates the January partition
+    write_raw(tmp_path, offer_price=5200.0)
+    assert build_features(raw_dir=tmp_path, features_dir=features_dir) == ["2026-01"]
+    assert read_manifest(features_dir)["rows"] == 3
+
+
+def test_load_features_date_range(tmp_path):
+    features_dir = tmp_path / "features"
+    write_raw(tmp_path)
+    build_features(raw_dir=tmp_path, features_dir=features_dir)
+
+    df = load_features("2026-02-01", "2026-02-10", features_dir=features_dir)
+    assert df["enquiry_id"].tolist() == ["E2"]
+    assert "month" not in df.columns
+    assert load_features(columns=["offer_price"], features_dir=features_dir).shape == (3, 1)
+
+
+def test_iter_features_streams_filtered_rows(tmp_path):
+    features_dir = tmp_path / "features"
+    write_raw(tmp_path)
+    build_features(raw_dir=tmp_path, features_dir=features_dir)
+
+    chunks = list(
+        iter_features(
+            columns=["enquiry_id"],
+            batch_rows=1,
+            where=ds.field("won") == 1,
+            features_dir=features_dir,
+        )
+    )
+    assert [chunk["enquiry_id"].tolist() for chunk in chunks] == [["E1"], ["E3"]]
+    assert count_features(start="2026-02-01", features_dir=features_dir) == 2
+
+
+def test_enquiries_without_a_vehicle_are_dropped(tmp_path):
+    features_dir = tmp_path / "features"
+    write_raw(tmp_path)
+    vehicles = pd.read_csv(tmp_path / "vehicles.csv")
+    vehicles[vehicles["vehicle_id"] != "V2"].to_csv(tmp_path / "vehicles.csv", index=False)
+    build_features(raw_dir=tmp_path, features_dir=features_dir)
+
+    df = load_features(features_dir=features_dir)
+    assert sorted(df["enquiry_id"]) == ["E1", "E3"]
+    assert sorted(df["vehicle_age"]) == [6, 7]
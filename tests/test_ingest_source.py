@@ -0,0 +1,43 @@
+from pipelines.ingest.load import TABLES, _open_source, _watermark_filter
+
+
+def _read(data_dir, table_name, hwm):
+    source, columns = _open_source(
+        str(data_dir), table_name, row_filter=_watermark_filter(TABLES[table_name], hwm)
+    )
+    with source:
+        return columns, source.read().decode().splitlines()
+
+
+def test_csv_rows_before_the_watermark_never_reach_copy(tmp_path):
+    (tmp_path / "sales.csv").write_text(
+        "enquiry_id,true_market_value,sale_price,won,actual_costs,gross_margin,date\n"
+        "E0000001,10000.0,,0,0.0,0.0,2026-01-01\n"
+        "E0000002,10000.0,,0,0.0,0.0,2026-02-20\n"
+        "E0000003,10000.0,9600.0,1,750.0,800.0,2026-03-01\n"
+    )
+    columns, lines = _read(tmp_path, "sales", "2026-03-01")
+
+    # A 30-day lookback before the watermark keeps late February rows
+    assert columns[0] == "enquiry_id"
+    assert [line.split(",")[0] for line in lines[1:]] == ['"E0000002"', '"E0000003"']
+    # Values are passed through as written, and an empty field stays NULL for COPY
+    assert lines[1].split(",")[2] == ""
+    assert lines[2].split(",")[2:5] == ['"9600.0"', '"1"', '"750.0"']
+
+
+def test_id_watermarks_compare_numerically(tmp_path):
+    (tmp_path / "vehicles.csv").write_text(
+        "vehicle_id,make,model,year,mileage,fuel_type,body_type\n"
+        "V999999,Ford,Focus,2019,40000,petrol,hatchback\n"
+        "V1000000,Ford,Fiesta,2020,30000,petrol,hatchback\n"
+    )
+    _, lines = _read(tmp_path, "vehicles", "999999")
+    assert [line.split(",")[0] for line in lines[1:]] == ['"V1000000"']
+
+
+def test_without_a_watermark_the_csv_is_copied_as_is(tmp_path):
+    text = "region_id,name,country,risk_score\nR001,Region 1,UK,0.5\n"
+    (tmp_path / "regions.csv").write_text(text)
+    _, lines = _read(tmp_path, "regions", None)
+    assert lines == text.splitlines()
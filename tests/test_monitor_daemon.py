@@ -0,0 +1,27 @@
+from pipelines.monitor.daemon import MonitorDaemon
+
+
+def test_tick_runs_only_due_checks():
+    daemon = MonitorDaemon(drift_every=60, performance_every=10, alerts_every=5)
+    daemon.checks = {
+        "drift": lambda: None,
+        "performance": lambda: None,
+        "alerts": lambda: None,
+    }
+
+    assert daemon.tick(now=0) == ["drift", "performance", "alerts"]
+    assert daemon.tick(now=3) == []
+    assert daemon.tick(now=5) == ["alerts"]
+    assert daemon.tick(now=10) == ["performance", "alerts"]
+    assert daemon.tick(now=60) == ["drift", "performance", "alerts"]
+
+
+def test_failing_check_does_not_stop_the_others():
+    daemon = MonitorDaemon()
+
+    def fail():
+        raise RuntimeError("features missing")
+
+    daemon.checks = {"drift": fail, "performance": lambda: None, "alerts": lambda: None}
+    assert daemon.tick(now=0) == ["performance", "alerts"]
+    assert daemon.next_run["drift"] == daemon.cadences["drift"]
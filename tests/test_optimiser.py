@@ -1,4 +1,12 @@
-from app.optimiser import compute_ev, optimise_offer
+import numpy as np
+
+from app.optimiser import (
+    compute_ev,
+    offer_grid,
+    optimise_offer,
+    optimise_offers,
+    optimise_portfolio,
+)
 
 
 def test_compute_ev_zero_win_prob():
@@ -32,3 +40,55 @@ def test_optimise_offer_no_profitable_margin():
     )
     assert result["recommended_offer"] == 0.0
     assert result["expected_value"] == 0.0
+
+
+def test_optimise_offers_matches_optimise_offer():
+    e_sale = np.array([10000.0, 2000.0, 15000.0])
+    price_q10 = np.array([8000.0, 1800.0, 12000.0])
+    e_costs = np.array([500.0, 2000.0, 800.0])
+
+    def p_win(offer, e_sale):
+        return 1.0 / (1.0 + np.exp(-(offer - 0.8 * e_sale) / (0.05 * e_sale)))
+
+    offers, valid = offer_grid(e_sale, e_costs)
+    batch = optimise_offers(
+        e_sale, price_q10, e_costs, offers, p_win(offers, e_sale[:, None]), valid
+    )
+    for i in range(len(e_sale)):
+        single = optimise_offer(
+            e_sale[i], price_q10[i], e_costs[i], lambda offer, i=i: p_win(offer, e_sale[i])
+        )
+        assert np.isclose(batch["recommended_offer"][i], single["recommended_offer"])
+        assert np.isclose(batch["expected_value"][i], single["expected_value"])
+
+
+def test_optimise_portfolio_respects_budget_and_volume():
+    rng = np.random.default_rng(0)
+    e_sale = rng.uniform(3000, 30000, 500)
+    price_q10 = 0.85 * e_sale
+    e_costs = rng.uniform(400, 1200, 500)
+    offers, valid = offer_grid(e_sale, e_costs)
+    p_win = 1.0 / (1.0 + np.exp(-(offers - 0.8 * e_sale[:, None]) / (0.05 * e_sale[:, None])))
+
+    free = optimise_portfolio(e_sale, price_q10, e_costs, offers, p_win, valid)
+    budget = 0.5 * free["expected_spend"]
+    capped = optimise_portfolio(
+        e_sale, price_q10, e_costs, offers, p_win, valid, budget=budget, max_volume=50
+    )
+    assert capped["feasible"]
+    assert capped["expected_spend"] <= budget + 1e-6
+    assert capped["expected_volume"] <= 50 + 1e-6
+    assert capped["total_expected_value"] < free["total_expected_value"]
+    # Unselected vehicles get no offer
+    assert (capped["recommended_offer"][~capped["selected"]] == 0).all()
+
+    more = optimise_portfolio(
+        e_sale,
+        price_q10,
+        e_costs,
+        offers,
+        p_win,
+        valid,
+        min_volume=1.2 * free["expected_volume"],
+    )
+    assert more["feasible"] and more["expected_volume"] >= 1.2 * free["expected_volume"] - 1e-6
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from app.quote_log import QuoteLogger
+from pipelines.features.store import write_manifest, write_partition
+from pipelines.monitor.performance import PerformanceState, summarise
+
+
+def _outcomes(rng, month, n=100):
+    won = rng.random(n) < 0.4
+    sale_price = rng.normal(10000, 1500, n)
+    return pd.DataFrame(
+        {
+            "enquiry_id": [f"E{month}-{i}" for i in range(n)],
+            "enquiry_date": pd.Timestamp(f"{month}-01") + pd.to_timedelta(np.arange(n) % 28, "D"),
+            "won": won.astype("int8"),
+            "sale_price": np.where(won, sale_price, np.nan),
+            "gross_margin": np.where(won, sale_price - 9000, np.nan),
+        }
+    )
+
+
+def _build(features_dir, partitions, versions):
+    for month, df in partitions.items():
+        write_partition(df, month, features_dir)
+    write_manifest(
+        {"partitions": {m: {"fingerprint": f"{m}-{v}", "rows": 100} for m, v in versions.items()}},
+        features_dir,
+    )
+
+
+def _quotes(outcomes, rng, logged_at):
+    return pd.DataFrame(
+        {
+            "logged_at": logged_at,
+            "endpoint": "quote",
+            "enquiry_id": outcomes["enquiry_id"].to_numpy(),
+            "e_sale": rng.normal(10000, 500, len(outcomes)),
+            "recommended_offer": 8000.0,
+            "e_costs": 500.0,
+            "p_win": rng.uniform(0.05, 0.95, len(outcomes)),
+        }
+    )
+
+
+def _expected(quotes, outcomes):
+    joined = quotes.drop_duplicates("enquiry_id", keep="last").merge(outcomes, on="enquiry_id")
+    won = joined["won"] == 1
+    expected = joined["p_win"] * (joined["e_sale"] - 8500.0)
+    return {
+        "quotes": len(joined),
+        "sold": int(won.sum()),
+        "price_mae": round((joined["sale_price"] - joined["e_sale"]).abs()[won].mean(), 2),
+        "conversion_brier": round(((joined["p_win"] - joined["won"]) ** 2).mean(), 4),
+        "realised_profit": round(joined["gross_margin"][won].sum(), 2),
+        "expected_profit": round(expected.sum(), 2),
+    }
+
+
+def test_incremental_join_matches_full_recompute(tmp_path):
+    rng = np.random.default_rng(0)
+    features_dir, log_dir = str(tmp_path / "features"), str(tmp_path / "quote_log")
+    outcomes = {m: _outcomes(rng, m) for m in ["2026-01", "2026-02"]}
+    _build(features_dir, outcomes, {"2026-01": 1, "2026-02": 1})
+    everything = pd.concat(outcomes.values(), ignore_index=True)
+
+    logger = QuoteLogger(log_dir)
+    served = [_quotes(everything.iloc[:120], rng, pd.Timestamp("2026-03-01 09:00"))]
+    logger.write(served[-1].to_dict("records"))
+    state = PerformanceState(str(tmp_path / "performance.sqlite"))
+    assert state.update(log_dir, features_dir) == (1, ["2026-01", "2026-02"], 120)
+
+    # Late quotes, a re-quote of already matched enquiries and a rebuilt partition
+    served.append(_quotes(everything.iloc[100:], rng, pd.Timestamp("2026-03-02 09:00")))
+    logger.write(served[-1].to_dict("records"))
+    outcomes["2026-02"] = outcomes["2026-02"].assign(
+        sale_price=outcomes["2026-02"]["sale_price"] + 250
+    )
+    _build(features_dir, outcomes, {"2026-01": 1, "2026-02": 2})
+    everything = pd.concat(outcomes.values(), ignore_index=True)
+    files, months, rematched = state.update(log_dir, features_dir)
+    assert (files, months) == (1, ["2026-02"])
+    assert rematched < len(everything)
+
+    expected = _expected(pd.concat(served, ignore_index=True), everything)
+    summary = summarise(state.window())
+    assert {k: summary[k] for k in expected} == expected
+    assert summarise(state.window("2026-02-01", "2026-02-28"))["quotes"] == 100
+    state.close()
+
+    fresh = PerformanceState(str(tmp_path / "fresh.sqlite"))
+    fresh.update(log_dir, features_dir)
+    assert summarise(fresh.window()) == summary
+    fresh.close()
@@ -0,0 +1,27 @@
+import time
+
+from pipelines.profiling import Profiler, load_profile
+
+
+def test_profile_history_flags_regressions(tmp_path):
+    path = str(tmp_path / "training_profile.json")
+
+    first = Profiler("train_test", config={"mode": "a"}, path=path)
+    with first.stage("fit"):
+        pass
+    run = first.finish()
+    assert set(run["stages"]["fit"]) == {"wall_s", "cpu_s", "peak_rss_mb"}
+    assert run["compared_to"] is None
+
+    second = Profiler("train_test", config={"mode": "a"}, path=path)
+    with second.stage("fit"):
+        time.sleep(0.6)
+    run = second.finish()
+    assert run["compared_to"] == first.started_at
+    flagged = {(r["stage"], r["metric"]) for r in run["regressions"]}
+    assert ("fit", "wall_s") in flagged and ("fit", "cpu_s") not in flagged
+
+    # A different configuration is not compared with the first two runs
+    other = Profiler("train_test", config={"mode": "b"}, path=path)
+    assert other.finish()["compared_to"] is None
+    assert len(load_profile(path)) == 3
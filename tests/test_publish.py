@@ -0,0 +1,54 @@
+import pickle
+
+from app.publish import load_consistent, publish_models, publishing, read_generation
+
+
+def test_publishing_brackets_the_moves_with_an_odd_generation(tmp_path):
+    path = str(tmp_path / "publish.json")
+    assert read_generation(path) == 0
+    with publishing(["price_model"], path=path):
+        assert read_generation(path) == 1
+    assert read_generation(path) == 2
+
+
+def test_load_consistent_retries_a_load_overlapping_a_publish(tmp_path):
+    path = str(tmp_path / "publish.json")
+    calls = []
+
+    def load():
+        calls.append(read_generation(path))
+        if len(calls) == 1:
+            # A publish starts and finishes while the first load is reading files
+            with publishing(["price_model"], path=path):
+                pass
+        return len(calls)
+
+    assert load_consistent(load, path=path, wait_seconds=0) == 2
+    assert calls == [0, 2]
+
+
+def test_load_consistent_gives_up_while_a_publish_is_in_progress(tmp_path):
+    path = str(tmp_path / "publish.json")
+    with publishing(["price_model"], path=path):
+        assert load_consistent(lambda: "models", path=path, attempts=3, wait_seconds=0) is None
+
+
+def test_publish_models_moves_every_pickle_in_one_generation(tmp_path):
+    publish_models({"price_model": 1, "price_q10": 2}, model_dir=str(tmp_path))
+
+    assert read_generation(str(tmp_path / "publish.json")) == 2
+    with open(tmp_path / "price_q10.pkl", "rb") as f:
+        assert pickle.load(f) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "price_model.pkl",
+        "price_q10.pkl",
+        "publish.json",
+    ]
+
+
+def test_publish_models_removes_artifacts_left_by_earlier_runs(tmp_path):
+    publish_models({"price_model": 1, "price_quantiles": 2}, model_dir=str(tmp_path))
+    publish_models({"price_model": 3}, model_dir=str(tmp_path), remove=["price_quantiles"])
+
+    assert not (tmp_path / "price_quantiles.pkl").exists()
+    assert (tmp_path / "price_model.pkl").exists()
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from app.quote_log import QuoteLogger, log_files, read_quote_log
+
+
+def test_quote_log_batches_events_to_parquet(tmp_path):
+    logger = QuoteLogger(str(tmp_path), batch_events=3, flush_seconds=60)
+    for i in range(7):
+        logger.log(
+            {
+                "logged_at": datetime(2026, 1, 2, 9, 0, i),
+                "endpoint": "quote",
+                "enquiry_id": f"E{i}",
+                "make": "Ford",
+                "recommended_offer": 5000.0 + i,
+                "latency_ms": 1.5,
+            }
+        )
+    logger.flush()
+
+    stats = logger.stats()
+    assert stats["logged"] == stats["written"] == 7
+    assert stats["dropped"] == stats["write_errors"] == 0
+    # Two full batches of three, then the remainder on flush
+    files = log_files(log_dir=str(tmp_path))
+    assert len(files) == stats["files"] == 3
+    assert log_files("2026-01-03", log_dir=str(tmp_path)) == []
+
+    events = read_quote_log(files)
+    assert list(events["enquiry_id"]) == [f"E{i}" for i in range(7)]
+    assert events["p_win"].isna().all()
+
+
+def test_disabled_quote_log_writes_nothing(tmp_path):
+    logger = QuoteLogger(str(tmp_path), enabled=False)
+    logger.log({"logged_at": datetime(2026, 1, 2), "endpoint": "quote"})
+    logger.flush()
+    assert logger.stats()["logged"] == 0
+    assert log_files(log_dir=str(tmp_path)) == []
@@ -0,0 +1,72 @@
+import json
+import os
+import time
+
+from app.metrics import RETENTION_MINUTES, ApiMetrics, read_snapshots
+from pipelines.monitor.slo import SLO_RULES, evaluate_slos, latency_quantile
+
+NOW = 1_800_000_000.0
+
+
+def test_latency_regression_burns_budget_and_flags_rollback():
+    metrics = ApiMetrics(persist=False)
+    for minutes_ago in range(60):
+        # The last ten minutes after an upgrade that made quotes ten times slower
+        latency = 3000 if minutes_ago < 10 else 300
+        for _ in range(20):
+            metrics.observe("/quote", latency, at=NOW - minutes_ago * 60)
+        metrics.count("aggregate_hit", 19, at=NOW - minutes_ago * 60)
+        metrics.count("aggregate_miss", 1, at=NOW - minutes_ago * 60)
+    metrics.observe("/quote", 5, status=503, at=NOW)
+
+    report = evaluate_slos(snapshots=[metrics.snapshot()], now=NOW)
+    quote = report["rules"]["quote_latency"]
+    assert quote["breached"] and quote["action"] == "rollback"
+    assert quote["breached_windows"] == ["60m/5m", "360m/30m"]
+    assert quote["p99_ms"] == 5000
+    assert quote["windows"]["5m"]["bad_fraction"] > 0.99
+    # Five percent misses against a ten percent budget
+    assert not report["rules"]["aggregate_cache_hit_rate"]["breached"]
+    # One shed request is far too few events over 5 minutes to matter
+    assert report["rules"]["quote_shed_rate"]["windows"]["5m"]["events"] == 101
+    assert report["rules"]["dvla_upstream_latency"]["windows"]["60m"]["events"] == 0
+    assert report["throughput_rpm"]["/quote"] > 20
+
+    # An hour later the short window has recovered, so nothing fires
+    later = evaluate_slos(snapshots=[metrics.snapshot()], now=NOW + 3600, rules=SLO_RULES)
+    assert not any(rule["breached"] for rule in later["rules"].values())
+
+
+def test_latency_quantile_uses_bucket_upper_bounds():
+    assert latency_quantile([0] * 12, 0.99) is None
+    assert latency_quantile([90, 0, 0, 0, 10] + [0] * 7, 0.5) == 5
+    assert latency_quantile([90, 0, 0, 0, 10] + [0] * 7, 0.99) == 100
+
+
+def test_failing_upstream_breaches_the_error_rule():
+    metrics = ApiMetrics(persist=False)
+    for minutes_ago in range(60):
+        for _ in range(20):
+            status = 502 if minutes_ago < 10 else 200
+            metrics.observe("dvla_upstream", 20, status=status, at=NOW - minutes_ago * 60)
+
+    report = evaluate_slos(snapshots=[metrics.snapshot()], now=NOW)
+    # Fast failures pass the latency rule but not the error rule
+    assert not report["rules"]["dvla_upstream_latency"]["breached"]
+    assert report["rules"]["dvla_upstream_errors"]["breached"]
+
+
+def test_snapshots_of_exited_workers_are_pruned(tmp_path):
+    metrics = ApiMetrics(metrics_dir=str(tmp_path), persist=False)
+    metrics.observe("/quote", 50)
+    live = metrics.write()
+    exited = tmp_path / "metrics-1.json"
+    exited.write_text(json.dumps({"pid": 1, "written_at": "2020-01-01T00:00:00", "minutes": {}}))
+
+    with open(live) as f:
+        assert read_snapshots(str(tmp_path)) == [json.load(f)]
+    assert not exited.exists()
+    # Once it stops writing, the worker's own file ages out too
+    later = time.time() + (RETENTION_MINUTES + 1) * 60
+    assert read_snapshots(str(tmp_path), now=later) == []
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,8 @@
+from pipelines.train.train_price_model import _tree_shares
+
+
+def test_tree_shares_add_up_to_the_single_fit_budget():
+    assert _tree_shares(300, 100) == [3] * 100
+    assert _tree_shares(10, 4) == [3, 3, 2, 2]
+    # More chunks than trees: the later chunks boost nothing
+    assert _tree_shares(3, 5) == [1, 1, 1, 0, 0]
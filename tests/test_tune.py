@@ -0,0 +1,9 @@
+from pipelines.train.tune import _n_rounds
+
+
+def test_rounds_are_counted_exactly_at_powers_of_the_factor():
+    # math.log(243, 3) is 4.999..., which used to lose the last round
+    assert _n_rounds(243, 3) == 6
+    assert _n_rounds(242, 3) == 5
+    assert _n_rounds(27, 3) == 4
+    assert _n_rounds(1, 3) == 1